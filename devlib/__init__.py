@@ -61,6 +61,7 @@ from devlib.derived import DerivedMeasurements, DerivedMetric
 from devlib.derived.energy import DerivedEnergyMeasurements
 from devlib.derived.fps import DerivedGfxInfoStats, DerivedSurfaceFlingerStats
 
+from devlib.collector import CollectorGroup
 from devlib.collector.ftrace import FtraceCollector
 from devlib.collector.perfetto import PerfettoCollector
 from devlib.collector.perf import PerfCollector
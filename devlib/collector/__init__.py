@@ -13,30 +13,83 @@
 # limitations under the License.
 #
 
+import asyncio
+import contextvars
+import functools
 import logging
+import time
 
+from devlib.utils.asyn import asyncf, _AsyncPolymorphicFunction
 from devlib.utils.types import caseless_string
 
+
+def _make_lifecycle_method(f):
+    """
+    Give a blocking lifecycle method an ``.asyn`` variant running it in a
+    separate thread, so that it can run concurrently with other collectors.
+    """
+    if isinstance(f, _AsyncPolymorphicFunction):
+        return f
+
+    @functools.wraps(f)
+    async def asyn(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(ctx.run, f, *args, **kwargs),
+        )
+
+    return _AsyncPolymorphicFunction(
+        asyn=asyn,
+        blocking=f,
+    )
+
+
 class CollectorBase(object):
+    """
+    Base class of collectors.
+
+    The :meth:`reset`, :meth:`start`, :meth:`stop` and :meth:`get_data`
+    methods all have an ``.asyn`` variant. Subclasses can implement them using
+    :func:`devlib.utils.asyn.asyncf`, or as regular blocking methods, in which
+    case the ``.asyn`` variant runs them in a separate thread.
+    """
+
+    _LIFECYCLE_METHODS = ('reset', 'start', 'stop', 'get_data')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in cls._LIFECYCLE_METHODS:
+            try:
+                f = cls.__dict__[name]
+            except KeyError:
+                pass
+            else:
+                setattr(cls, name, _make_lifecycle_method(f))
 
     def __init__(self, target):
         self.target = target
         self.logger = logging.getLogger(self.__class__.__name__)
         self.output_path = None
 
-    def reset(self):
+    @asyncf
+    async def reset(self):
         pass
 
-    def start(self):
+    @asyncf
+    async def start(self):
         pass
 
-    def stop(self):
+    @asyncf
+    async def stop(self):
         pass
 
     def set_output(self, output_path):
         self.output_path = output_path
 
-    def get_data(self):
+    @asyncf
+    async def get_data(self):
         return CollectorOutput()
 
     def __enter__(self):
@@ -47,6 +100,102 @@ class CollectorBase(object):
     def __exit__(self, exc_type, exc_value, traceback):
         self.stop()
 
+    async def __aenter__(self):
+        await self.reset.asyn()
+        await self.start.asyn()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop.asyn()
+
+
+class CollectorGroup(CollectorBase):
+    """
+    Collector driving a group of collectors concurrently, to minimize the
+    latency of setting them up and the skew between their start and stop.
+
+    :param target: Target the collectors are attached to.
+    :type target: devlib.target.Target
+
+    :param collectors: Collectors of the group. Their output is configured
+        individually using their own :meth:`set_output`.
+    :type collectors: list(CollectorBase)
+
+    If the operation of one collector fails, the exception is raised once the
+    operations already started on the other collectors are finished.
+    """
+    def __init__(self, target, collectors):
+        super().__init__(target)
+        self.collectors = list(collectors)
+        self.timestamps = {}
+
+    async def _run(self, name):
+        async def run(collector):
+            start = time.time()
+            x = await getattr(collector, name).asyn()
+            end = time.time()
+            self.timestamps.setdefault(collector, {})[name] = (start, end)
+            return x
+
+        # Threads running blocking collector methods cannot be cancelled, so
+        # let all of them finish before raising the first exception.
+        results = await asyncio.gather(
+            *map(run, self.collectors),
+            return_exceptions=True,
+        )
+        for x in results:
+            if isinstance(x, BaseException):
+                raise x
+        return results
+
+    @asyncf
+    async def reset(self):
+        """
+        Reset all the collectors concurrently.
+        """
+        await self._run('reset')
+
+    @asyncf
+    async def start(self):
+        """
+        Start all the collectors concurrently.
+        """
+        await self._run('start')
+
+    @asyncf
+    async def stop(self):
+        """
+        Stop all the collectors concurrently.
+        """
+        await self._run('stop')
+
+    @asyncf
+    async def get_data(self):
+        """
+        Get the data of all the collectors concurrently.
+
+        :returns: A :class:`CollectorOutput` with the entries of all the
+            collectors.
+        """
+        outputs = await self._run('get_data')
+        return CollectorOutput(
+            entry
+            for output in outputs
+            for entry in (output or [])
+        )
+
+    def get_timestamps(self, collector):
+        """
+        Get the timestamps of the last lifecycle operations of ``collector``.
+
+        :returns: A dictionary mapping each of ``"reset"``, ``"start"``,
+            ``"stop"`` and ``"get_data"`` that was executed to a tuple
+            ``(begin, end)`` of :func:`time.time` timestamps taken right before
+            and right after the operation.
+        """
+        return dict(self.timestamps.get(collector, {}))
+
+
 class CollectorOutputEntry(object):
 
     path_kinds = ['file', 'directory']
@@ -13,6 +13,7 @@
 # limitations under the License.
 #
 
+import asyncio
 import os
 import json
 import time
@@ -260,15 +261,16 @@ class FtraceCollector(CollectorBase):
         """
         return self.target.read_value(self.available_functions_file).splitlines()
 
-    def reset(self):
+    @asyncf
+    async def reset(self):
         # Save kprobe events
         try:
-            kprobe_events = self.target.read_value(self.kprobe_events_file)
+            kprobe_events = await self.target.read_value.asyn(self.kprobe_events_file)
         except TargetStableError:
             kprobe_events = None
 
-        self.target.execute('{} reset'.format(self.target_binary),
-                            as_root=True, timeout=TIMEOUT)
+        await self.target.execute.asyn('{} reset'.format(self.target_binary),
+                                       as_root=True, timeout=TIMEOUT)
 
 
         # This code is currently not necessary as we are not using alternate
@@ -288,15 +290,15 @@ class FtraceCollector(CollectorBase):
             #  )
 
         if self.functions:
-            self.target.write_value(self.function_profile_file, 0, verify=False)
+            await self.target.write_value.asyn(self.function_profile_file, 0, verify=False)
 
         # Restore kprobe events
         if kprobe_events:
-            self.target.write_value(self.kprobe_events_file, kprobe_events)
+            await self.target.write_value.asyn(self.kprobe_events_file, kprobe_events)
 
         self._reset_needed = False
 
-    def _trace_frequencies(self):
+    async def _trace_frequencies(self):
         if 'cpu_frequency' in self._selected_events:
             self.logger.debug('Trace CPUFreq frequencies')
             try:
@@ -304,9 +306,9 @@ class FtraceCollector(CollectorBase):
             except TargetStableError as e:
                 self.logger.error(f'Could not trace CPUFreq frequencies as the cpufreq module cannot be loaded: {e}')
             else:
-                mod.trace_frequencies()
+                await mod.trace_frequencies.asyn()
 
-    def _trace_idle(self):
+    async def _trace_idle(self):
         if 'cpu_idle' in self._selected_events:
             self.logger.debug('Trace CPUIdle states')
             try:
@@ -314,13 +316,13 @@ class FtraceCollector(CollectorBase):
             except TargetStableError as e:
                 self.logger.error(f'Could not trace CPUIdle states as the cpuidle module cannot be loaded: {e}')
             else:
-                mod.perturb_cpus()
+                await mod.perturb_cpus.asyn()
 
     @asyncf
     async def start(self):
         self.start_time = time.time()
         if self._reset_needed:
-            self.reset()
+            await self.reset.asyn()
 
         if self.tracer is not None and 'function' in self.tracer:
             tracecmd_functions = self.function_string
@@ -332,7 +334,7 @@ class FtraceCollector(CollectorBase):
         # Ensure kallsyms contains addresses if possible, so that function the
         # collected trace contains enough data for pretty printing
         with contextlib.suppress(TargetStableError):
-            self.target.write_value('/proc/sys/kernel/kptr_restrict', 0)
+            await self.target.write_value.asyn('/proc/sys/kernel/kptr_restrict', 0)
 
         params = '{buffer_size} {cmdlines_size} {clock} {events} {tracer} {functions}'.format(
             events=self.event_string,
@@ -354,7 +356,7 @@ class FtraceCollector(CollectorBase):
             assert self._bg_cmd is None
             self._bg_cmd = bg_cmd.__enter__()
         elif mode == 'write-to-memory':
-            self.target.execute(
+            await self.target.execute.asyn(
                 f'{self.target_binary} start {params}',
                 as_root=True,
             )
@@ -362,14 +364,15 @@ class FtraceCollector(CollectorBase):
             raise ValueError(f'Unknown mode {mode}')
 
         if self.automark:
-            self.mark_start()
+            await self.mark_start.asyn()
 
-        self._trace_frequencies()
-        self._trace_idle()
+        await self._trace_frequencies()
+        await self._trace_idle()
 
         # Enable kernel function profiling
         if self.functions and self.tracer is None:
             target = self.target
+            execute = target.execute
             await target.async_manager.concurrently(
                 execute.asyn('echo nop > {}'.format(self.current_tracer_file),
                                     as_root=True),
@@ -382,14 +385,15 @@ class FtraceCollector(CollectorBase):
             )
 
 
-    def stop(self):
+    @asyncf
+    async def stop(self):
         # Disable kernel function profiling
         if self.functions and self.tracer is None:
-            self.target.execute('echo 0 > {}'.format(self.function_profile_file),
-                                as_root=True)
+            await self.target.execute.asyn('echo 0 > {}'.format(self.function_profile_file),
+                                           as_root=True)
         self.stop_time = time.time()
         if self.automark:
-            self.mark_stop()
+            await self.mark_stop.asyn()
 
         mode = self.mode
         if mode == 'write-to-disk':
@@ -397,11 +401,14 @@ class FtraceCollector(CollectorBase):
             self._bg_cmd = None
             assert bg_cmd is not None
             bg_cmd.send_signal(signal.SIGINT)
-            bg_cmd.communicate()
+            # Waiting for trace-cmd to flush its buffers can take a while, so
+            # do not block the event loop in the meantime.
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, bg_cmd.communicate)
             bg_cmd.__exit__(None, None, None)
         elif mode == 'write-to-memory':
-            self.target.execute('{} stop'.format(self.target_binary),
-                                timeout=TIMEOUT, as_root=True)
+            await self.target.execute.asyn('{} stop'.format(self.target_binary),
+                                           timeout=TIMEOUT, as_root=True)
         else:
             raise ValueError(f'Unknown mode {mode}')
 
@@ -430,8 +437,16 @@ class FtraceCollector(CollectorBase):
 
         # The size of trace.dat will depend on how long trace-cmd was running.
         # Therefore timout for the pull command must also be adjusted
-        # accordingly.
-        pull_timeout = 10 * (self.stop_time - self.start_time)
+        # accordingly. Derive it from the size of the file and the throughput
+        # of previous transfers when possible, and fall back on a guess based
+        # on the duration of the trace otherwise.
+        def get_pull_timeout(path):
+            return self.target.estimate_transfer_timeout(
+                path,
+                default=10 * (self.stop_time - self.start_time),
+            )
+
+        pull_timeout = get_pull_timeout(self.target_output_file)
         self.target.pull(self.target_output_file, self.output_path, timeout=pull_timeout)
         output = CollectorOutput()
         if not os.path.isfile(self.output_path):
@@ -443,7 +458,7 @@ class FtraceCollector(CollectorBase):
                 if self.report_on_target:
                     self.generate_report_on_target()
                     self.target.pull(self.target_text_file,
-                                     textfile, timeout=pull_timeout)
+                                     textfile, timeout=get_pull_timeout(self.target_text_file))
                 else:
                     self.report(self.output_path, textfile)
                 output.append(CollectorOutputEntry(textfile, 'file'))
@@ -531,11 +546,13 @@ class FtraceCollector(CollectorBase):
     def teardown(self):
         self.target.remove(self.target.path.join(self.target.working_directory, OUTPUT_TRACE_FILE))
 
-    def mark_start(self):
-        self.target.write_value(self.marker_file, TRACE_MARKER_START, verify=False)
+    @asyncf
+    async def mark_start(self):
+        await self.target.write_value.asyn(self.marker_file, TRACE_MARKER_START, verify=False)
 
-    def mark_stop(self):
-        self.target.write_value(self.marker_file, TRACE_MARKER_STOP, verify=False)
+    @asyncf
+    async def mark_stop(self):
+        await self.target.write_value.asyn(self.marker_file, TRACE_MARKER_STOP, verify=False)
 
 
 def _build_trace_events(events):
@@ -14,18 +14,26 @@
 #
 
 from abc import ABC, abstractmethod
+import asyncio
+from collections import namedtuple, deque
+from concurrent.futures import wait as wait_futures
 from contextlib import contextmanager, nullcontext
+import io
 from shlex import quote
 import os
 from pathlib import Path
 import signal
+import stat
 import subprocess
 import threading
 import time
 import logging
 import select
 import fcntl
+import uuid
 
+# Alias to avoid shadowing the builtin TimeoutError used by TransferManager
+from devlib.exception import TargetTransientError, TargetStableError, TimeoutError as DevlibTimeoutError
 from devlib.utils.misc import InitCheckpoint, memoized
 
 _KILL_TIMEOUT = 3
@@ -50,6 +58,183 @@ def _popen_communicate(bg, popen, input, timeout):
         return (stdout, stderr)
 
 
+def _get_remote_file_cmd(path, mode):
+    """
+    Shell command streaming the content of ``path`` to stdout, or stdin to
+    ``path``, according to ``mode``.
+    """
+    path = quote(path)
+    if mode == 'rb':
+        return f'cat -- {path}'
+    elif mode == 'wb':
+        return f'cat > {path}'
+    elif mode == 'ab':
+        return f'cat >> {path}'
+    else:
+        raise ValueError(f'Unsupported mode for remote files: {mode}')
+
+
+class _RemoteFile(io.RawIOBase):
+    """
+    Binary file object returned by :meth:`ConnectionBase.open_remote`.
+
+    :param stream: File object streaming the data from or to the target.
+    :param mode: Mode the file was opened with.
+    :param on_close: Called once, when reaching EOF or after closing the
+        underlying stream, to release the resources and check for errors. It
+        is passed ``True`` if the transfer completed, i.e. the data were
+        written or read until EOF.
+    """
+    def __init__(self, stream, mode, on_close=None):
+        super().__init__()
+        self._stream = stream
+        self._mode = mode
+        self._on_close = on_close
+        self._eof = False
+        self._close_callbacks = []
+
+    def _add_close_callback(self, callback):
+        """
+        Register a callable called without arguments once the file is closed,
+        e.g. to release the connection it relies on.
+        """
+        self._close_callbacks.append(callback)
+
+    def readable(self):
+        return self._mode == 'rb'
+
+    def writable(self):
+        return self._mode != 'rb'
+
+    def read(self, size=-1):
+        if not self.readable():
+            raise io.UnsupportedOperation('read')
+        if size is None or size < 0:
+            return self.readall()
+        data = self._stream.read(size)
+        if size and not data and not self._eof:
+            self._eof = True
+            self._finish(True)
+        return data
+
+    def readall(self):
+        chunks = []
+        while True:
+            chunk = self.read(1024 * 1024)
+            if chunk:
+                chunks.append(chunk)
+            else:
+                return b''.join(chunks)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def write(self, b):
+        if not self.writable():
+            raise io.UnsupportedOperation('write')
+        b = bytes(b)
+        self._stream.write(b)
+        return len(b)
+
+    def _finish(self, complete):
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close(complete)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._stream.close()
+            finally:
+                super().close()
+                try:
+                    self._finish(self._eof or self.writable())
+                finally:
+                    callbacks, self._close_callbacks = self._close_callbacks, []
+                    for callback in callbacks:
+                        callback()
+
+
+class IOReactor:
+    """
+    Thread running an :mod:`asyncio` event loop, used to multiplex the I/O of
+    many background commands instead of dedicating a thread to each of them.
+
+    The thread is only started when the reactor is first used.
+
+    :param name: Name of the reactor thread.
+    :type name: str
+    """
+    def __init__(self, name='devlib-io-reactor'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def loop(self):
+        """
+        Event loop of the reactor. Its thread is started if needed.
+        """
+        with self._lock:
+            loop = self._loop
+            if loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=self._thread_f,
+                    args=(loop,),
+                    name=self.name,
+                    # The thread will die when the main thread dies
+                    daemon=True,
+                )
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+            return loop
+
+    @staticmethod
+    def _thread_f(loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+            # Let the pending coroutines run their cleanup code
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True)
+            )
+        finally:
+            loop.close()
+
+    def submit(self, coro):
+        """
+        Run the coroutine ``coro`` in the reactor.
+
+        :returns: A :class:`concurrent.futures.Future` for the result of the
+            coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        """
+        Stop the reactor thread. The coroutines still running are cancelled.
+        """
+        with self._lock:
+            loop = self._loop
+            thread = self._thread
+            self._loop = None
+            self._thread = None
+
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not threading.current_thread():
+                thread.join()
+
+
 class ConnectionBase(InitCheckpoint):
     """
     Base class for all connections.
@@ -74,12 +259,152 @@ class ConnectionBase(InitCheckpoint):
             transfer_poll_period=transfer_poll_period,
         ) if poll_transfers else NoopTransferManager()
 
+        self.transfer_metrics = TransferMetrics.for_connection(self.__class__)
+        """
+        :class:`TransferMetrics` shared by all connections of the same class.
+        """
+
+        self.transfer_callbacks = []
+        """
+        List of callables called with a :class:`TransferProgress` while a
+        transfer is being polled, and with a :class:`TransferRecord` once it
+        has completed.
+        """
+
+        self.reactor = IOReactor()
+        """
+        :class:`IOReactor` multiplexing the output of the background commands
+        of this connection.
+        """
+
+    def _notify_transfer(self, event):
+        for callback in self.transfer_callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                self.logger.warning(f'Transfer callback {callback} failed: {e}')
+
+    def record_transfer(self, record):
+        """
+        Record a completed transfer in :attr:`transfer_metrics` and notify
+        :attr:`transfer_callbacks`.
+
+        :param record: :class:`TransferRecord` describing the transfer.
+        """
+        self.transfer_metrics.record(record)
+        self.logger.debug(f'Completed {record}')
+        self._notify_transfer(record)
+
+    native_async = False
+    """
+    ``True`` if :meth:`execute_async` is implemented. Instances of the same
+    connection can set it to ``False`` if some settings prevent it from being
+    used.
+    """
 
     def cancel_running_command(self):
         bg_cmds = set(self._current_bg_cmds)
         for bg_cmd in bg_cmds:
             bg_cmd.cancel()
 
+    async def execute_async(self, command, timeout=None, check_exit_code=True,
+                            as_root=False, strip_colors=True, will_succeed=False):
+        """
+        Coroutine equivalent of ``execute()``, driven by the running asyncio
+        event loop rather than blocking a thread for the duration of the
+        command. Multiple calls can be in flight at the same time on the same
+        connection instance.
+
+        Only available if :attr:`native_async` is ``True``.
+        """
+        raise NotImplementedError(f'{self.__class__.__qualname__} does not support native asyncio execution')
+
+    native_fs = frozenset()
+    """
+    Names of the filesystem methods (e.g. :meth:`stat`) implemented without
+    executing shell commands, at least when not accessing the files as root.
+    """
+
+    def _fs_cmd(self, cmd, as_root):
+        busybox = quote(self.busybox) if self.busybox else ''
+        return self.execute(cmd.format(busybox=busybox), as_root=as_root)
+
+    def stat(self, path, as_root=False):
+        """
+        Return a :class:`os.stat_result`-like object for ``path`` on the
+        target, following symlinks. Only ``st_mode``, ``st_size`` and
+        ``st_mtime`` are guaranteed to be meaningful.
+
+        :raises FileNotFoundError: If ``path`` does not exist.
+        """
+        _path = quote(path)
+        out = self._fs_cmd(
+            f"if [ -e {_path} ]; then {{busybox}} stat -L -c '%f %s %Y' -- {_path}; fi",
+            as_root=as_root,
+        )
+        try:
+            mode, size, mtime = out.split()
+        except ValueError:
+            raise FileNotFoundError(path)
+        return os.stat_result((int(mode, 16), 0, 0, 0, 0, 0, int(size), 0, int(mtime), 0))
+
+    def listdir(self, path, as_root=False):
+        """
+        Return the list of the names of the entries of the ``path`` directory
+        on the target, including hidden ones.
+        """
+        out = self._fs_cmd(f'{{busybox}} ls -1 -A -- {quote(path)}', as_root=as_root)
+        return [name for name in out.splitlines() if name]
+
+    def makedirs(self, path, as_root=False):
+        """
+        Create the ``path`` directory on the target, along with its missing
+        parents.
+        """
+        self._fs_cmd(f'{{busybox}} mkdir -p -- {quote(path)}', as_root=as_root)
+
+    def unlink(self, path, as_root=False):
+        """
+        Remove the file ``path`` on the target. Directories are not removed.
+        """
+        self._fs_cmd(f'{{busybox}} rm -- {quote(path)}', as_root=as_root)
+
+    def rename(self, src, dst, as_root=False):
+        """
+        Rename ``src`` into ``dst`` on the target, replacing ``dst`` if it
+        already exists.
+        """
+        self._fs_cmd(f'{{busybox}} mv -f -- {quote(src)} {quote(dst)}', as_root=as_root)
+
+    def open_remote(self, path, mode='rb', as_root=False):
+        """
+        Open the file ``path`` on the target and return a binary file object
+        streaming its content, without any intermediate file on the host.
+
+        :param mode: ``'rb'`` to read the file, ``'wb'`` to truncate it and
+            write to it and ``'ab'`` to append to it.
+        :param as_root: Access the file as root.
+
+        The default implementation streams the file through ``cat`` in a
+        background command.
+        """
+        cmd = _get_remote_file_cmd(path, mode)
+        bg = self.background(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, as_root=as_root)
+
+        def on_close(complete):
+            # Stop the command if the file was not read until the end.
+            if not complete:
+                bg.cancel()
+            err = bg.stderr.read()
+            ret = bg.wait()
+            bg.close()
+            if complete and ret:
+                err = err.decode('utf-8', errors='replace').strip()
+                raise TargetStableError(f'Could not access {path} on the target: {err}')
+
+        stream = bg.stdout if mode == 'rb' else bg.stdin
+        return _RemoteFile(stream, mode, on_close=on_close)
+
     @abstractmethod
     def _close(self):
         """
@@ -107,6 +432,7 @@ class ConnectionBase(InitCheckpoint):
             if not self._closed:
                 finish_bg()
                 self._close()
+                self.reactor.close()
                 self._closed = True
 
     # Ideally, that should not be relied upon but that will improve the chances
@@ -119,6 +445,155 @@ class ConnectionBase(InitCheckpoint):
             self.close()
 
 
+class PersistentShellBase(ABC):
+    """
+    Long-lived shell used to execute commands without paying for the setup of
+    a new channel or process for each of them.
+
+    Each command is sent to the shell along with a trailer printing a unique
+    marker on both stdout and stderr, followed by the exit code of the command
+    on stdout. This allows finding the boundaries of the output of each
+    command and its exit code in-band, so that a command costs a single round
+    trip.
+
+    If anything unexpected happens (timeout, shell exiting, exception raised
+    while reading the output), the shell is closed as its state cannot be
+    trusted anymore. The owner is expected to check :attr:`closed` and create a
+    new instance if needed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.closed = False
+
+    @abstractmethod
+    def _send(self, data):
+        """
+        Send ``data`` bytes to the shell's stdin.
+        """
+
+    @abstractmethod
+    def _recv(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for some output to be available.
+
+        :returns: An iterable of ``(name, chunk)`` with ``name`` being either
+            ``"stdout"`` or ``"stderr"``. An empty ``chunk`` indicates that the
+            stream reached EOF. An empty iterable indicates the timeout
+            expired.
+        """
+
+    @abstractmethod
+    def _close(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._close()
+
+    @staticmethod
+    def _make_script(command, marker, merge_stderr):
+        redirect = ' 2>&1' if merge_stderr else ''
+        # The subshell isolates the shell from any "exit", "cd" or variable
+        # assignment done by the command, and "eval" ensures that a syntax
+        # error in the command will not affect the parsing of the trailer.
+        # stdin is redirected so the command cannot consume the next commands.
+        return (
+            f'( eval {quote(command)} ) </dev/null{redirect}; '
+            f'_DEVLIB_RC=$?; '
+            f"printf '%s\\n' {marker}-err >&2; "
+            f"printf '%s:%d\\n' {marker}-rc $_DEVLIB_RC\n"
+        ).encode('utf-8')
+
+    def execute(self, command, timeout=None, merge_stderr=False):
+        """
+        Execute ``command`` in the shell.
+
+        :returns: A tuple ``(exit_code, stdout, stderr)`` with the output as
+            :class:`bytes`.
+        """
+        with self._lock:
+            if self.closed:
+                raise TargetTransientError('Persistent shell is closed')
+
+            try:
+                return self._execute(command, timeout, merge_stderr)
+            except BaseException:
+                self.close()
+                raise
+
+    def _execute(self, command, timeout, merge_stderr):
+        marker = uuid.uuid4().hex
+        rc_marker = f'{marker}-rc:'.encode('ascii')
+        # The line ending is not part of the marker, since a pty might turn it
+        # into "\r\n"
+        err_marker = f'{marker}-err'.encode('ascii')
+
+        self._send(self._make_script(command, marker, merge_stderr))
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        out = bytearray()
+        err = bytearray()
+        # Only scan the newly received data (plus a marker-sized overlap) to
+        # avoid a quadratic behavior on commands with large output.
+        out_scan = 0
+        err_scan = 0
+        exit_code = None
+        err_done = False
+
+        while True:
+            if exit_code is None:
+                idx = out.find(rc_marker, out_scan)
+                if idx == -1:
+                    out_scan = max(0, len(out) - len(rc_marker))
+                else:
+                    end = out.find(b'\n', idx)
+                    if end != -1:
+                        exit_code = int(out[idx + len(rc_marker):end])
+                        del out[idx:]
+                        # If stderr is merged into stdout by the transport
+                        # (e.g. adb without shell protocol v2), the stderr
+                        # marker will be found in the stdout stream.
+                        err_idx = out.find(err_marker)
+                        if err_idx != -1:
+                            # The marker line is followed by the exit code
+                            # line, so its line ending was received too.
+                            end = out.find(b'\n', err_idx)
+                            del out[err_idx:end + 1]
+                            err_done = True
+
+            if not err_done:
+                idx = err.find(err_marker, err_scan)
+                if idx == -1:
+                    err_scan = max(0, len(err) - len(err_marker))
+                else:
+                    del err[idx:]
+                    err_done = True
+
+            if exit_code is not None and err_done:
+                return (exit_code, bytes(out), bytes(err))
+
+            if deadline is None:
+                remaining = None
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    output = bytes(out + err).decode('utf-8', 'replace')
+                    raise DevlibTimeoutError(command, output)
+
+            for name, chunk in self._recv(remaining):
+                if not chunk:
+                    output = bytes(out + err).decode('utf-8', 'replace')
+                    raise TargetTransientError(
+                        f'Persistent shell exited unexpectedly while executing: {command}\nOUTPUT: {output}'
+                    )
+                elif name == 'stdout':
+                    out.extend(chunk)
+                else:
+                    err.extend(chunk)
+
+
 class BackgroundCommand(ABC):
     """
     Allows managing a running background command using a subset of the
@@ -150,13 +625,22 @@ class BackgroundCommand(ABC):
 
     @classmethod
     def from_factory(cls, conn, cmd, as_root, make_init_kwargs):
+        """
+        Create a background command.
+
+        :param make_init_kwargs: Callable starting the command. It is called
+            with the command wrapped by :meth:`_with_data_dir` and the path to
+            the data directory of the command on the target, and returns the
+            extra keyword arguments of the class constructor.
+        :type make_init_kwargs: collections.abc.Callable
+        """
         cmd, data_dir = cls._with_data_dir(conn, cmd)
         return cls(
             conn=conn,
             data_dir=data_dir,
             cmd=cmd,
             as_root=as_root,
-            **make_init_kwargs(cmd),
+            **make_init_kwargs(cmd, data_dir),
         )
 
     def _deregister(self):
@@ -429,7 +913,7 @@ class ParamikoBackgroundCommand(BackgroundCommand):
     """
     :mod:`paramiko`-based background command.
     """
-    def __init__(self, conn, data_dir, cmd, as_root, chan, pid, stdin, stdout, stderr, redirect_thread):
+    def __init__(self, conn, data_dir, cmd, as_root, chan, pid, stdin, stdout, stderr, redirect):
         super().__init__(
             conn=conn,
             data_dir=data_dir,
@@ -442,7 +926,11 @@ class ParamikoBackgroundCommand(BackgroundCommand):
         self._stdin = stdin
         self._stdout = stdout
         self._stderr = stderr
-        self.redirect_thread = redirect_thread
+        self.redirect = redirect
+        """
+        :class:`concurrent.futures.Future` completed once the output of the
+        command has been entirely copied to :attr:`stdout` and :attr:`stderr`.
+        """
 
     @property
     def pid(self):
@@ -450,9 +938,9 @@ class ParamikoBackgroundCommand(BackgroundCommand):
 
     def _wait(self):
         status = self.chan.recv_exit_status()
-        # Ensure that the redirection thread is finished copying the content
-        # from paramiko to the pipe.
-        self.redirect_thread.join()
+        # Ensure that the reactor is finished copying the content from
+        # paramiko to the pipe.
+        wait_futures([self.redirect])
         return status
 
     def _communicate(self, input, timeout):
@@ -535,11 +1023,11 @@ class ParamikoBackgroundCommand(BackgroundCommand):
             return (_stdout, _stderr)
 
     def _poll(self):
-        # Wait for the redirection thread to finish, otherwise we would
-        # indicate the caller that the command is finished and that the streams
-        # are safe to drain, but actually the redirection thread is not
-        # finished yet, which would end up in lost data.
-        if self.redirect_thread.is_alive():
+        # Wait for the redirection to finish, otherwise we would indicate the
+        # caller that the command is finished and that the streams are safe to
+        # drain, but actually the redirection is not finished yet, which would
+        # end up in lost data.
+        if not self.redirect.done():
             return None
         elif self.chan.exit_status_ready():
             return self.wait()
@@ -574,10 +1062,7 @@ class ParamikoBackgroundCommand(BackgroundCommand):
                 x.close()
 
         exit_code = self.wait()
-        thread = self.redirect_thread
-        if thread:
-            thread.join()
-
+        wait_futures([self.redirect])
         return exit_code
 
 
@@ -639,6 +1124,158 @@ class AdbBackgroundCommand(BackgroundCommand):
         return self
 
 
+def _host_path_size(path):
+    """
+    Size in bytes of a file, or of all the files in a folder, on the host.
+    """
+    if os.path.isdir(path):
+        return sum(
+            os.stat(os.path.join(dirpath, f)).st_size
+            for dirpath, _, fnames in os.walk(path)
+            for f in fnames
+        )
+    else:
+        return os.stat(path).st_size
+
+
+class TransferRecord(namedtuple('TransferRecord', ['direction', 'connection', 'sources', 'dest', 'size', 'duration'])):
+    """
+    Summary of a completed file transfer.
+
+    :param direction: ``'push'`` or ``'pull'``.
+    :param connection: Name of the connection class used for the transfer.
+    :param sources: List of source paths.
+    :param dest: Destination path.
+    :param size: Number of bytes transferred.
+    :param duration: Duration of the transfer in seconds.
+    """
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        """
+        Average throughput of the transfer in bytes per second.
+        """
+        return self.size / self.duration if self.duration > 0 else None
+
+    def __str__(self):
+        throughput = self.throughput
+        throughput = f'{throughput / 1024 ** 2:.2f}MiB/s' if throughput else 'unknown throughput'
+        return f'{self.direction} of {self.size}B over {self.connection} in {self.duration:.2f}s ({throughput})'
+
+
+class TransferProgress(namedtuple('TransferProgress', ['direction', 'connection', 'sources', 'dest', 'transferred', 'size', 'elapsed', 'throughput'])):
+    """
+    Progress of an ongoing file transfer, as sampled periodically by
+    :class:`TransferManager`.
+
+    :param transferred: Number of bytes transferred so far.
+    :param size: Total number of bytes to transfer, or ``None`` if unknown.
+    :param elapsed: Time in seconds since the beginning of the transfer.
+    :param throughput: Instantaneous throughput in bytes per second, computed
+        since the previous sample.
+
+    The other attributes are the same as for :class:`TransferRecord`.
+    """
+    __slots__ = ()
+
+    @property
+    def average_throughput(self):
+        """
+        Average throughput since the beginning of the transfer in bytes per
+        second.
+        """
+        return self.transferred / self.elapsed if self.elapsed > 0 else None
+
+
+class TransferMetrics:
+    """
+    History of the transfers made using a given connection type, used to
+    derive timeouts from the throughput achieved in practice.
+
+    Instances are shared by all the connections of the same class, see
+    :meth:`for_connection`.
+
+    :param maxlen: Maximum number of :class:`TransferRecord` kept.
+    """
+
+    MIN_SAMPLE_SIZE = 1024 * 1024
+    """
+    Transfers smaller than that are dominated by the fixed cost of setting up
+    the transfer and are therefore ignored when computing the throughput.
+    """
+
+    _INSTANCES = {}
+    _INSTANCES_LOCK = threading.Lock()
+
+    def __init__(self, maxlen=64):
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_connection(cls, conn_cls):
+        """
+        Get the :class:`TransferMetrics` shared by all instances of
+        ``conn_cls``.
+        """
+        with cls._INSTANCES_LOCK:
+            try:
+                return cls._INSTANCES[conn_cls]
+            except KeyError:
+                metrics = cls()
+                cls._INSTANCES[conn_cls] = metrics
+                return metrics
+
+    def record(self, record):
+        """
+        Add a :class:`TransferRecord` to the history.
+        """
+        with self._lock:
+            self._records.append(record)
+
+    @property
+    def history(self):
+        """
+        List of the most recent :class:`TransferRecord`, oldest first.
+        """
+        with self._lock:
+            return list(self._records)
+
+    @property
+    def throughput(self):
+        """
+        Throughput in bytes per second observed over the recorded transfers,
+        or ``None`` if no transfer big enough has been recorded yet.
+        """
+        records = [
+            record
+            for record in self.history
+            if record.size >= self.MIN_SAMPLE_SIZE and record.duration > 0
+        ]
+        if records:
+            return sum(r.size for r in records) / sum(r.duration for r in records)
+        else:
+            return None
+
+    def estimate_timeout(self, size, default=None, margin=4, min_timeout=30):
+        """
+        Estimate a timeout for a transfer of ``size`` bytes, based on the
+        observed :attr:`throughput`.
+
+        :param size: Number of bytes to transfer. If ``None``, ``default`` is
+            returned.
+        :param default: Value returned if no estimation can be made.
+        :param margin: Multiplier applied to the expected duration, to absorb
+            fluctuations of the throughput.
+        :param min_timeout: Minimum timeout returned.
+        """
+        throughput = self.throughput
+        if size is None or throughput is None:
+            return default
+        else:
+            return max(min_timeout, margin * size / throughput)
+
+
 class TransferManager:
     def __init__(self, conn, transfer_poll_period=30, start_transfer_poll_delay=30, total_transfer_timeout=3600):
         self.conn = conn
@@ -648,11 +1285,58 @@ class TransferManager:
 
         self.logger = logging.getLogger('FileTransfer')
 
+    def _get_size(self, sources, direction):
+        try:
+            if direction == 'push':
+                return sum(map(_host_path_size, sources))
+            else:
+                stats = [self.conn.stat(src) for src in sources]
+                # Only regular files have a meaningful size on the target.
+                if all(stat.S_ISREG(st.st_mode) for st in stats):
+                    return sum(st.st_size for st in stats)
+                else:
+                    return None
+        except Exception as e:
+            self.logger.debug(f'Could not get the size of the transfer: {e}')
+            return None
+
+    def _get_deadline(self, size, transferred, elapsed):
+        """
+        Timeout of the transfer, extended beyond ``total_transfer_timeout``
+        when its size and the throughput observed so far show it will take
+        longer while still progressing.
+        """
+        timeout = self.total_transfer_timeout
+        if size is not None:
+            metrics = self.conn.transfer_metrics
+            timeout = max(timeout, metrics.estimate_timeout(size, default=timeout))
+
+            if transferred and elapsed > 0:
+                remaining = max(0, size - transferred) / (transferred / elapsed)
+                timeout = max(timeout, elapsed + 2 * remaining)
+        return timeout
+
     @contextmanager
-    def manage(self, sources, dest, direction, handle):
+    def manage(self, sources, dest, direction, handle, size=None):
+        """
+        Context manager monitoring the transfer carried out inside it, and
+        cancelling it if it stalls or times out.
+
+        :param size: Total number of bytes to transfer. If ``None``, it is
+            computed before the transfer starts. If it cannot be computed, only
+            ``total_transfer_timeout`` is used as a deadline.
+        :type size: int or None
+        """
         excep = None
         stop_thread = threading.Event()
 
+        # Get the size in the caller's thread before the transfer starts, as
+        # the transfer may then hold all the resources needed to get it, e.g.
+        # the SFTP sessions of SshConnection. The monitor thread would then
+        # block before its first poll and never detect a stall.
+        if size is None:
+            size = self._get_size(sources, direction)
+
         def monitor():
             nonlocal excep
 
@@ -663,11 +1347,36 @@ class TransferManager:
                 handle.cancel()
 
             start_t = time.monotonic()
+            last_t = start_t
+            last_transferred = 0
+
             stop_thread.wait(self.start_transfer_poll_delay)
             while not stop_thread.wait(self.transfer_poll_period):
-                if not handle.isactive():
+                active = handle.isactive()
+                now = time.monotonic()
+                elapsed = now - start_t
+                transferred = handle.transferred
+
+                if transferred is not None:
+                    delta_t = now - last_t
+                    self.conn._notify_transfer(
+                        TransferProgress(
+                            direction=direction,
+                            connection=self.conn.__class__.__qualname__,
+                            sources=sources,
+                            dest=dest,
+                            transferred=transferred,
+                            size=size,
+                            elapsed=elapsed,
+                            throughput=(transferred - last_transferred) / delta_t if delta_t > 0 else None,
+                        )
+                    )
+                    last_t = now
+                    last_transferred = transferred
+
+                if not active:
                     cancel(reason='transfer inactive')
-                elif time.monotonic() - start_t > self.total_transfer_timeout:
+                elif elapsed > self._get_deadline(size, transferred, elapsed):
                     cancel(reason='transfer timed out')
                     excep = TimeoutError(f'{direction}: {sources} -> {dest}')
 
@@ -691,6 +1400,11 @@ class TransferHandleBase(ABC):
     def __init__(self, manager):
         self.manager = manager
 
+    transferred = None
+    """
+    Number of bytes transferred so far, or ``None`` if unknown.
+    """
+
     @property
     def logger(self):
         return self.manager.logger
@@ -720,16 +1434,13 @@ class PopenTransferHandle(TransferHandleBase):
         self.popen = popen
         self.last_sample = 0
 
+    @property
+    def transferred(self):
+        return self.last_sample
+
     @staticmethod
     def _pull_dest_size(dest):
-        if os.path.isdir(dest):
-            return sum(
-                os.stat(os.path.join(dirpath, f)).st_size
-	            for dirpath, _, fnames in os.walk(dest)
-	            for f in fnames
-            )
-        else:
-            return os.stat(dest).st_size
+        return _host_path_size(dest)
 
     def _push_dest_size(self, dest):
         conn = self.manager.conn
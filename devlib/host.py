@@ -12,20 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import asyncio
 import os
 import signal
 import shutil
 import subprocess
 import logging
 import sys
+import weakref
 from getpass import getpass
 from shlex import quote
 
 from devlib.exception import (
     TargetStableError, TargetTransientCalledProcessError, TargetStableCalledProcessError
 )
-from devlib.utils.misc import check_output
-from devlib.connection import ConnectionBase, PopenBackgroundCommand
+from devlib.utils.misc import check_output, check_output_async
+from devlib.connection import ConnectionBase, PopenBackgroundCommand, _get_remote_file_cmd
 
 
 if sys.version_info >= (3, 8):
@@ -63,6 +65,7 @@ class LocalConnection(ConnectionBase):
 
     name = 'local'
     host = 'localhost'
+    native_async = True
 
     @property
     def connected_as_root(self):
@@ -77,13 +80,15 @@ class LocalConnection(ConnectionBase):
 
     # pylint: disable=unused-argument
     def __init__(self, platform=None, keep_password=True, unrooted=False,
-                 password=None, timeout=None):
+                 password=None, timeout=None, max_async_processes=50):
         super().__init__()
         self._connected_as_root = None
         self.logger = logging.getLogger('local_connection')
         self.keep_password = keep_password
         self.unrooted = unrooted
         self.password = password
+        self.max_async_processes = max_async_processes
+        self._async_processes_sems = weakref.WeakKeyDictionary()
 
 
     def _copy_path(self, source, dest):
@@ -106,6 +111,39 @@ class LocalConnection(ConnectionBase):
     # pylint: disable=unused-argument
     def execute(self, command, timeout=None, check_exit_code=True,
                 as_root=False, strip_colors=True, will_succeed=False):
+        command, use_sudo = self._prepare_execute(command, as_root)
+        ignore = None if check_exit_code else 'all'
+        try:
+            stdout, stderr = check_output(command, shell=True, timeout=timeout, ignore=ignore)
+        except subprocess.CalledProcessError as e:
+            raise self._execute_excep(e, command, will_succeed)
+
+        return self._execute_output(stdout, stderr, use_sudo)
+
+    async def execute_async(self, command, timeout=None, check_exit_code=True,
+                            as_root=False, strip_colors=True, will_succeed=False):
+        command, use_sudo = self._prepare_execute(command, as_root)
+        ignore = None if check_exit_code else 'all'
+        # Bound the number of processes running at once, as execute_async()
+        # does not go through the thread pool limiting the other connections.
+        async with self._get_async_processes_sem():
+            try:
+                stdout, stderr = await check_output_async(command, shell=True, timeout=timeout, ignore=ignore)
+            except subprocess.CalledProcessError as e:
+                raise self._execute_excep(e, command, will_succeed)
+
+        return self._execute_output(stdout, stderr, use_sudo)
+
+    def _get_async_processes_sem(self):
+        loop = asyncio.get_running_loop()
+        try:
+            return self._async_processes_sems[loop]
+        except KeyError:
+            sem = asyncio.Semaphore(self.max_async_processes)
+            self._async_processes_sems[loop] = sem
+            return sem
+
+    def _prepare_execute(self, command, as_root):
         self.logger.debug(command)
         use_sudo = as_root and not self.connected_as_root
         if use_sudo:
@@ -115,24 +153,66 @@ class LocalConnection(ConnectionBase):
             # Empty prompt with -p '' to avoid adding a leading space to the
             # output.
             command = "echo {} | sudo -k -p '' -S -- sh -c {}".format(quote(password), quote(command))
-        ignore = None if check_exit_code else 'all'
-        try:
-            stdout, stderr = check_output(command, shell=True, timeout=timeout, ignore=ignore)
-        except subprocess.CalledProcessError as e:
-            cls = TargetTransientCalledProcessError if will_succeed else TargetStableCalledProcessError
-            raise cls(
-                e.returncode,
-                command,
-                e.output,
-                e.stderr,
-            )
+        return (command, use_sudo)
+
+    @staticmethod
+    def _execute_excep(e, command, will_succeed):
+        cls = TargetTransientCalledProcessError if will_succeed else TargetStableCalledProcessError
+        return cls(
+            e.returncode,
+            command,
+            e.output,
+            e.stderr,
+        )
 
+    @staticmethod
+    def _execute_output(stdout, stderr, use_sudo):
         # Remove the one-character prompt of sudo -S -p
         if use_sudo and stderr:
             stderr = stderr[1:]
 
         return stdout + stderr
 
+    native_fs = frozenset({'stat', 'listdir', 'makedirs', 'unlink', 'rename'})
+
+    def stat(self, path, as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().stat(path, as_root=as_root)
+        else:
+            return os.stat(path)
+
+    def listdir(self, path, as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().listdir(path, as_root=as_root)
+        else:
+            return os.listdir(path)
+
+    def makedirs(self, path, as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().makedirs(path, as_root=as_root)
+        else:
+            return os.makedirs(path, exist_ok=True)
+
+    def unlink(self, path, as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().unlink(path, as_root=as_root)
+        else:
+            return os.unlink(path)
+
+    def rename(self, src, dst, as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().rename(src, dst, as_root=as_root)
+        else:
+            return os.replace(src, dst)
+
+    def open_remote(self, path, mode='rb', as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().open_remote(path, mode, as_root=as_root)
+        else:
+            # Validate the mode
+            _get_remote_file_cmd(path, mode)
+            return open(path, mode)
+
     def background(self, command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, as_root=False):
         if as_root and not self.connected_as_root:
             if self.unrooted:
@@ -147,7 +227,7 @@ class LocalConnection(ConnectionBase):
         def preexec_fn():
             os.setpgrp()
 
-        def make_init_kwargs(command):
+        def make_init_kwargs(command, data_dir):
             popen = subprocess.Popen(
                 command,
                 stdout=stdout,
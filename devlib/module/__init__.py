@@ -68,10 +68,26 @@ class Module:
         try:
             mod = installed[attr_name]
         except KeyError:
+            probe_cache = target.probe_cache
+            probe_key = f'module:{cls.name}'
+            try:
+                supported = probe_cache.get(probe_key)
+            except KeyError:
+                supported = None
+
             mod = cls(target, **params)
             mod.logger.debug(f'Installing module {cls.name}')
 
-            if mod.probe(target):
+            # Only positive results are cached, since a module can become
+            # supported without a reboot, e.g. once setup() installed the
+            # tools it needs.
+            if not supported:
+                with target.command_stats.measure('probe', site=f'module:{cls.name}'):
+                    supported = bool(mod.probe(target))
+                if supported:
+                    probe_cache.set(probe_key, supported)
+
+            if supported:
                 for name in (
                     attr_name,
                     identifier(cls.name),
@@ -164,17 +164,17 @@ class Cpuidle(Module):
 
     @asyn.asyncf
     async def enable_all(self, cpu=0):
-        await self.target.async_manager.concurrently(
-            state.enable.asyn()
+        await self.target.write_values.asyn({
+            self.target.path.join(state.path, 'disable'): 0
             for state in self.get_states(cpu)
-        )
+        })
 
     @asyn.asyncf
     async def disable_all(self, cpu=0):
-        await self.target.async_manager.concurrently(
-            state.disable.asyn()
+        await self.target.write_values.asyn({
+            self.target.path.join(state.path, 'disable'): 1
             for state in self.get_states(cpu)
-        )
+        })
 
     @asyn.asyncf
     async def perturb_cpus(self):
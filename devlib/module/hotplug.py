@@ -37,8 +37,12 @@ class HotplugModule(Module):
         return target.path.join(cls.base_path, cpu, 'online')
 
     def list_hotpluggable_cpus(self):
-        return [cpu for cpu in range(self.target.number_of_cpus)
-                if self.target.file_exists(self._cpu_path(self.target, cpu))]
+        with self.target.batch() as batch:
+            exists = {
+                cpu: batch.file_exists(self._cpu_path(self.target, cpu))
+                for cpu in range(self.target.number_of_cpus)
+            }
+        return [cpu for cpu, exist in exists.items() if exist.result()]
 
     def online_all(self, verify=True):
         self.target._execute_util('hotplug_online_all',  # pylint: disable=protected-access
@@ -49,12 +53,21 @@ class HotplugModule(Module):
                 raise TargetTransientError('The following CPUs failed to come back online: {}'.format(offline))
 
     def online(self, *args):
-        for cpu in args:
-            self.hotplug(cpu, online=True)
+        self._hotplug_many(args, online=True)
 
     def offline(self, *args):
-        for cpu in args:
-            self.hotplug(cpu, online=False)
+        self._hotplug_many(args, online=False)
+
+    def _hotplug_many(self, cpus, online):
+        paths = [self._cpu_path(self.target, cpu) for cpu in cpus]
+        with self.target.batch() as batch:
+            exists = {path: batch.file_exists(path) for path in paths}
+        value = 1 if online else 0
+        self.target.write_values({
+            path: value
+            for path, exist in exists.items()
+            if exist.result()
+        })
 
     def hotplug(self, cpu, online):
         path = self._cpu_path(self.target, cpu)
@@ -18,6 +18,7 @@ import devlib.utils.asyn as asyn
 
 from devlib.module import Module
 from devlib.exception import TargetStableCalledProcessError
+from devlib.utils.types import integer
 
 class TripPoint(object):
     def __init__(self, zone, _id):
@@ -164,8 +165,10 @@ class ThermalModule(Module):
 
     def disable_all_zones(self):
         """Disables all the thermal zones in the target"""
-        for zone in self.zones.values():
-            zone.set_enabled(False)
+        self.target.write_values({
+            self.target.path.join(zone.path, 'mode'): 'disabled'
+            for zone in self.zones.values()
+        })
 
     @asyn.asyncf
     async def get_all_temperatures(self, error='raise'):
@@ -178,20 +181,29 @@ class ThermalModule(Module):
         :returns: a dictionary in the form: {tz_type:temperature}
         """
 
-        async def get_temperature_noexcep(item):
-            tzid, tz = item
-            try:
-                temperature = await tz.get_temperature.asyn()
-            except TargetStableCalledProcessError as e:
+        paths = {
+            tzid: self.target.path.join(tz.path, 'temp')
+            for tzid, tz in self.zones.items()
+        }
+        values = await self.target.read_values.asyn(paths.values(), kind=integer, raise_errors=False)
+
+        def get_temperature_noexcep(tzid, tz):
+            temperature = values[paths[tzid]]
+            if isinstance(temperature, TargetStableCalledProcessError):
                 if error == 'raise':
-                    raise e
+                    raise temperature
                 elif error == 'ignore':
-                    self.logger.warning(f'Skipping thermal_zone_id={tzid} thermal_zone_type={tz.type} error="{e}"')
+                    self.logger.warning(f'Skipping thermal_zone_id={tzid} thermal_zone_type={tz.type} error="{temperature}"')
                     return None
                 else:
                     raise ValueError(f'Unknown error parameter value: {error}')
+            elif isinstance(temperature, BaseException):
+                raise temperature
             return temperature
 
-        tz_temps = await self.target.async_manager.map_concurrently(get_temperature_noexcep, self.zones.items())
+        tz_temps = {
+            (tzid, tz): get_temperature_noexcep(tzid, tz)
+            for tzid, tz in self.zones.items()
+        }
 
         return {tz.type: temperature for (tzid, tz), temperature in tz_temps.items() if temperature is not None}
@@ -15,19 +15,26 @@
 
 import atexit
 import asyncio
+import bisect
 from contextlib import contextmanager
 import io
-import base64
+import fnmatch
 import functools
 import gzip
 import glob
+import hashlib
+import json
 import os
 from operator import itemgetter
+import pickle
 import re
+import shutil
+import stat
 import time
 import logging
 import posixpath
 import subprocess
+import sys
 import tarfile
 import tempfile
 import threading
@@ -48,22 +55,25 @@ except ImportError:
     from collections import Mapping
 
 from enum import Enum
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from devlib.host import LocalConnection, PACKAGE_BIN_DIRECTORY
+from devlib.connection import TransferRecord, _RemoteFile, _host_path_size
 from devlib.module import get_module, Module
 from devlib.platform import Platform
 from devlib.exception import (DevlibTransientError, TargetStableError,
                               TargetNotRespondingError, TimeoutError,
                               TargetTransientError, KernelConfigKeyError,
-                              TargetError, HostError, TargetCalledProcessError)
+                              TargetError, HostError, TargetCalledProcessError,
+                              TargetStableCalledProcessError,
+                              TargetTransientCalledProcessError)
 from devlib.utils.ssh import SshConnection
 from devlib.utils.android import AdbConnection, AndroidProperties, LogcatMonitor, adb_command, INTENT_FLAGS
-from devlib.utils.misc import memoized, isiterable, convert_new_lines, groupby_value
+from devlib.utils.misc import memoized, reset_memo_cache, isiterable, convert_new_lines, groupby_value
 from devlib.utils.misc import commonprefix, merge_lists
 from devlib.utils.misc import ABI_MAP, get_cpu_name, ranges_to_list
 from devlib.utils.misc import batch_contextmanager, tls_property, _BoundTLSProperty, nullcontext
-from devlib.utils.misc import safe_extract
+from devlib.utils.misc import safe_extract, safe_extract_stream
 from devlib.utils.types import integer, boolean, bitmask, identifier, caseless_string, bytes_regex
 import devlib.utils.asyn as asyn
 
@@ -129,12 +139,51 @@ def call_conn(f):
                 # the thread the connection can then be reused by another
                 # thread.
                 del self.conn
-                with self._lock:
-                    self._unused_conns.add(conn)
+                self._release_conn(conn)
 
     return wrapper
 
 
+def _probe_cached(f):
+    """
+    Decorator for :class:`Target` probe methods whose result can be persisted
+    in :attr:`Target.probe_cache`.
+    """
+    name = f.__name__
+
+    @functools.wraps(f)
+    def wrapper(self):
+        cache = self.probe_cache
+        try:
+            return cache.get(name)
+        except KeyError:
+            value = f(self)
+            cache.set(name, value)
+            return value
+
+    return wrapper
+
+
+def _measured(op):
+    """
+    Decorator recording the calls to a :class:`Target` method in
+    :attr:`Target.command_stats` as the operation ``op``.
+    """
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @functools.wraps(f)
+            async def wrapper(self, *args, **kwargs):
+                with self.command_stats.measure(op):
+                    return await f(self, *args, **kwargs)
+        else:
+            @functools.wraps(f)
+            def wrapper(self, *args, **kwargs):
+                with self.command_stats.measure(op):
+                    return f(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class Target(object):
 
     path = None
@@ -185,6 +234,7 @@ class Target(object):
 
     @property
     @memoized
+    @_probe_cached
     def kernel_version(self):
         return KernelVersion(self.execute('{} uname -r -v'.format(quote(self.busybox))).strip())
 
@@ -214,11 +264,13 @@ class Target(object):
 
     @property
     @memoized
+    @_probe_cached
     def cpuinfo(self):
         return Cpuinfo(self.execute('cat /proc/cpuinfo'))
 
     @property
     @memoized
+    @_probe_cached
     def number_of_cpus(self):
         num_cpus = 0
         corere = re.compile(r'^\s*cpu\d+\s*$')
@@ -256,6 +308,7 @@ class Target(object):
 
     @property
     @memoized
+    @_probe_cached
     def config(self):
         try:
             return KernelConfig(self.execute('zcat /proc/config.gz'))
@@ -274,6 +327,7 @@ class Target(object):
 
     @property
     @memoized
+    @_probe_cached
     def page_size_kb(self):
         cmd = "cat /proc/self/smaps | {0} grep KernelPageSize | {0} head -n 1 | {0} awk '{{ print $2 }}'"
         return int(self.execute(cmd.format(self.busybox)) or 0)
@@ -294,7 +348,8 @@ class Target(object):
     def _conn(self):
         try:
             with self._lock:
-                return self._unused_conns.pop()
+                conn, _ = self._unused_conns.popitem()
+                return conn
         except KeyError:
             return self.get_connection()
 
@@ -303,7 +358,11 @@ class Target(object):
 
     @tls_property
     def _async_manager(self):
-        return asyn.AsyncManager()
+        return asyn.AsyncManager(
+            access_hooks=[self._invalidate_read_cache],
+            conflict_check=lambda: self.async_conflict_check,
+            max_in_flight=lambda: self._async_pool_size,
+        )
 
     # Add a basic property that does not require calling to get the value
     async_manager = _async_manager.basic_property
@@ -321,12 +380,16 @@ class Target(object):
                  is_container=False,
                  max_async=50,
                  tmp_directory=None,
+                 probe_cache=None,
                  ):
 
         self._lock = threading.RLock()
         self._async_pool = None
         self._async_pool_size = None
-        self._unused_conns = set()
+        # Map of connections not currently used by any thread to the time at
+        # which they were last released.
+        self._unused_conns = {}
+        self._reap_timer = None
 
         self._is_rooted = None
         self.connection_settings = connection_settings or {}
@@ -357,9 +420,15 @@ class Target(object):
         self._installed_binaries = {}
         self._installed_modules = {}
         self._cache = {}
+        self.read_cache = ReadCache()
+        self.command_stats = CommandStats()
         self._shutils = None
         self._max_async = max_async
+        self.conn_idle_timeout = 60
+        self.async_conflict_check = True
+        self.probe_cache = ProbeCache(probe_cache)
         self.busybox = None
+        self.transfer_callbacks = []
 
         def normalize_mod_spec(spec):
             if isinstance(spec, str):
@@ -448,6 +517,7 @@ class Target(object):
         ignored.update((
             '_async_pool',
             '_unused_conns',
+            '_reap_timer',
             '_lock',
         ))
         return {
@@ -463,13 +533,17 @@ class Target(object):
             self._async_pool = None
         else:
             self._async_pool = ThreadPoolExecutor(pool_size)
-        self._unused_conns = set()
+        self._unused_conns = {}
+        self._reap_timer = None
         self._lock = threading.RLock()
 
     # connection and initialization
 
     @asyn.asyncf
     async def connect(self, timeout=None, check_boot_completed=True, max_async=None):
+        self.read_cache.invalidate()
+        # Probed values may not be valid anymore, e.g. after a reboot
+        reset_memo_cache(self)
         self.platform.init_target_connection(self)
         # Forcefully set the thread-local value for the connection, with the
         # timeout we want
@@ -477,6 +551,7 @@ class Target(object):
         if check_boot_completed:
             self.wait_boot_complete(timeout)
         self.check_connection()
+        await self._load_probe_cache.asyn()
         self._resolve_paths()
         assert self.working_directory
         if self.executables_directory is None:
@@ -507,54 +582,143 @@ class Target(object):
             self.tmp_directory = tmp
         self.makedirs(self.tmp_directory)
 
-        self._detect_max_async(max_async or self._max_async)
+        self._setup_async_pool(max_async or self._max_async)
         self.platform.update_from_target(self)
         self._update_modules('connected')
 
-    def _detect_max_async(self, max_async):
-        self.logger.debug('Detecting max number of async commands ...')
+    # Maximum number of connections that could be opened to a given target,
+    # discovered when failing to open more. It is shared by all instances so
+    # that connecting again to the same target does not hit the limit again.
+    _max_async_ceilings = {}
+
+    def _get_target_key(self):
+        settings = self.connection_settings
+        return (
+            self.conn_cls,
+            tuple(
+                (key, settings[key])
+                for key in ('host', 'port', 'device', 'adb_server', 'adb_port')
+                if key in settings
+            ),
+        )
 
-        def make_conn(_):
-            try:
-                conn = self.get_connection()
-            except Exception:
-                return None
-            else:
-                payload = 'hello'
-                # Sanity check the connection, in case we managed to connect
-                # but it's actually unusable.
-                try:
-                    res = conn.execute(f'echo {quote(payload)}')
-                except Exception:
-                    return None
-                else:
-                    if res.strip() == payload:
-                        return conn
-                    else:
-                        return None
+    @asyn.asyncf
+    async def _load_probe_cache(self):
+        cache = self.probe_cache
+        if cache.path is None:
+            return
 
-        # Logging needs to be disabled before the thread pool is created,
-        # otherwise the logging config will not be taken into account
-        logging.disable()
         try:
-            # Aggressively attempt to create all the connections in parallel,
-            # so that this setup step does not take too much time.
-            with ThreadPoolExecutor(max_async) as pool:
-                conns = pool.map(make_conn, range(max_async))
-        # Avoid polluting the log with errors coming from broken
-        # connections.
-        finally:
-            logging.disable(logging.NOTSET)
+            boot_id = await self.read_value.asyn('/proc/sys/kernel/random/boot_id')
+        except TargetStableError:
+            boot_id = None
 
-        conns = {conn for conn in conns if conn is not None}
+        identity = (self.__class__.__qualname__, *self._get_target_key())
+        cache.load(identity, boot_id)
 
-        # Keep the connection so it can be reused by future threads
-        self._unused_conns.update(conns)
-        max_conns = len(conns)
+    def _setup_async_pool(self, max_async):
+        """
+        Create the thread pool used by the async API for connections that do
+        not support native asyncio.
+
+        Threads, and therefore connections, are only created on demand when
+        the pool is busy, so this does not connect to the target. The pool
+        size is bounded by the ceiling previously discovered for that target,
+        if any.
+        """
+        ceiling = self._max_async_ceilings.get(self._get_target_key())
+        if ceiling is not None:
+            max_async = min(max_async, ceiling)
+        self._set_async_pool_size(max_async)
+
+    def _set_async_pool_size(self, size):
+        self.logger.debug(f'Setting max number of async commands to {size}')
+        with self._lock:
+            old_pool = self._async_pool
+            self._async_pool_size = size
+            self._async_pool = ThreadPoolExecutor(size)
+
+        if old_pool is not None:
+            # Let the already-submitted work finish in the background
+            old_pool.shutdown(wait=False)
+
+    def _lower_max_async(self):
+        """
+        Lower the size of the async pool to the number of connections
+        currently opened, after failing to open a new one.
 
-        self.logger.debug(f'Detected max number of async commands: {max_conns}')
-        self._async_pool_size = max_conns
-        self._async_pool = ThreadPoolExecutor(max_conns)
+        .. note:: The ceiling is never raised again, as there is no way to
+            tell whether the target would now accept more connections without
+            trying to open them.
+        """
+        with self._lock:
+            opened = len(self._conn.get_all_values()) + len(self._unused_conns)
+            ceiling = max(opened, 1)
+            if self._async_pool_size is None or ceiling >= self._async_pool_size:
+                return
+            self._max_async_ceilings[self._get_target_key()] = ceiling
+            self._set_async_pool_size(ceiling)
+
+    def _release_conn(self, conn):
+        """
+        Return ``conn`` to the pool of unused connections. It will be closed
+        if it is not used again within :attr:`conn_idle_timeout` seconds.
+        """
+        with self._lock:
+            self._unused_conns[conn] = time.monotonic()
+        self._reap_idle_conns()
+
+    def _reap_idle_conns(self):
+        """
+        Close the connections that have not been used for more than
+        :attr:`conn_idle_timeout` seconds, and schedule the next check if some
+        unused connections remain.
+        """
+        now = time.monotonic()
+        timeout = self.conn_idle_timeout
+        with self._lock:
+            if timeout is None:
+                idle = []
+            else:
+                idle = [
+                    idle_conn
+                    for idle_conn, last_used in self._unused_conns.items()
+                    if now - last_used > timeout
+                ]
+                for idle_conn in idle:
+                    del self._unused_conns[idle_conn]
+
+            # Check again once the oldest remaining connection expires, so
+            # that the connections of an idle target are closed as well.
+            if timeout is not None and self._unused_conns:
+                deadline = min(self._unused_conns.values()) + timeout
+                timer = self._reap_timer
+                # The timeout might have been lowered since the timer started
+                if timer is None or deadline < timer.deadline:
+                    if timer is not None:
+                        timer.cancel()
+
+                    # The timer must not keep the target alive
+                    on_timer = WeakMethod(self._on_reap_timer)
+
+                    def reap():
+                        f = on_timer()
+                        if f is not None:
+                            f()
+
+                    timer = threading.Timer(max(0, deadline - now) + 0.1, reap)
+                    timer.deadline = deadline
+                    timer.daemon = True
+                    timer.start()
+                    self._reap_timer = timer
+
+        for idle_conn in idle:
+            idle_conn.close()
+
+    def _on_reap_timer(self):
+        with self._lock:
+            self._reap_timer = None
+        self._reap_idle_conns()
 
     @asyn.asyncf
     async def check_connection(self):
@@ -584,6 +748,11 @@ class Target(object):
             unused_conns = list(self._unused_conns)
             self._unused_conns.clear()
 
+            timer = self._reap_timer
+            self._reap_timer = None
+            if timer is not None:
+                timer.cancel()
+
             for conn in itertools.chain(thread_conns, unused_conns):
                 conn.close()
 
@@ -610,6 +779,7 @@ class Target(object):
         conn = self.conn_cls(timeout=timeout, **self.connection_settings)  # pylint: disable=not-callable
         # This allows forwarding the detected busybox for connections created in new threads.
         conn.busybox = self.busybox
+        conn.transfer_callbacks = self.transfer_callbacks
         return conn
 
     def wait_boot_complete(self, timeout=10):
@@ -619,8 +789,8 @@ class Target(object):
     async def setup(self, executables=None):
         await self._setup_scripts.asyn()
 
-        for host_exe in (executables or []):  # pylint: disable=superfluous-parens
-            await self.install.asyn(host_exe)
+        if executables:
+            await self.install_many.asyn(executables)
 
         # Check for platform dependent setup procedures
         self.platform.setup(self)
@@ -649,6 +819,8 @@ class Target(object):
             timeout = max(timeout - reset_delay, 10)
         if self.has('boot'):
             self.boot()  # pylint: disable=no-member
+        self.read_cache.invalidate()
+        reset_memo_cache(self)
         self.conn.connected_as_root = None
         if connect:
             self.connect(timeout=timeout)
@@ -690,27 +862,14 @@ class Target(object):
 
         _target_cache = {}
         async def target_paths_kind(paths, as_root=False):
-            def process(x):
-                x = x.strip()
-                if x == 'notexist':
-                    return None
-                else:
-                    return x
-
             _paths = [
                 path
                 for path in paths
                 if path not in _target_cache
             ]
             if _paths:
-                cmd = '; '.join(
-                    'if [ -d {path} ]; then echo dir; elif [ -e {path} ]; then echo file; else echo notexist; fi'.format(
-                        path=quote(path)
-                    )
-                    for path in _paths
-                )
-                res = await self.execute.asyn(cmd, as_root=as_root)
-                _target_cache.update(zip(_paths, map(process, res.split())))
+                kinds = await self._get_path_kinds.asyn(_paths, as_root=as_root)
+                _target_cache.update(zip(_paths, kinds))
 
             return [
                 _target_cache[path]
@@ -736,11 +895,6 @@ class Target(object):
                 for path in paths
             ]
 
-        # TODO: Target.remove() and Target.makedirs() would probably benefit
-        # from being implemented by connections, with the current
-        # implementation in ConnectionBase. This would allow SshConnection to
-        # use SFTP for these operations, which should be cheaper than
-        # Target.execute()
         if action == 'push':
             src_excep = HostError
             src_path_kind = host_paths_kind
@@ -836,29 +990,83 @@ class Target(object):
         source = str(source)
         dest = str(dest)
 
-        sources = glob.glob(source) if globbing else [source]
-        mapping = await self._prepare_xfer.asyn('push', sources, dest, pattern=source if globbing else None, as_root=as_root)
+        with self.command_stats.measure('push') as measurement:
+            sources = glob.glob(source) if globbing else [source]
+            mapping = await self._prepare_xfer.asyn('push', sources, dest, pattern=source if globbing else None, as_root=as_root)
 
-        def do_push(sources, dest):
-            for src in sources:
+            def do_push(sources, dest):
+                for src in sources:
+                    self.async_manager.track_access(
+                        asyn.PathAccess(namespace='host', path=src, mode='r')
+                    )
                 self.async_manager.track_access(
-                    asyn.PathAccess(namespace='host', path=src, mode='r')
+                    asyn.PathAccess(namespace='target', path=dest, mode='w')
+                )
+                start = time.monotonic()
+                ret = self.conn.push(sources, dest, timeout=timeout)
+                self._record_transfer('push', sources, dest, sources, start, measurement)
+                return ret
+
+            if as_root:
+                for sources, dest in mapping.items():
+                    async def f(source):
+                        async with self._xfer_cache_path(source) as device_tempfile:
+                            do_push([source], device_tempfile)
+                            await self.execute.asyn("mv -f -- {} {}".format(quote(device_tempfile), quote(dest)), as_root=True)
+                    await self.async_manager.map_concurrently(f, sources)
+            else:
+                for sources, dest in mapping.items():
+                    do_push(sources, dest)
+
+    def _record_transfer(self, direction, sources, dest, host_paths, start, measurement=None):
+        duration = time.monotonic() - start
+        try:
+            size = sum(map(_host_path_size, host_paths))
+        except OSError as e:
+            self.logger.debug(f'Could not get the size of {direction}ed files: {e}')
+        else:
+            if measurement is not None:
+                measurement.add_size(size)
+            self.conn.record_transfer(
+                TransferRecord(
+                    direction=direction,
+                    connection=self.conn.__class__.__qualname__,
+                    sources=list(sources),
+                    dest=dest,
+                    size=size,
+                    duration=duration,
                 )
-            self.async_manager.track_access(
-                asyn.PathAccess(namespace='target', path=dest, mode='w')
             )
-            return self.conn.push(sources, dest, timeout=timeout)
-
-        if as_root:
-            for sources, dest in mapping.items():
-                async def f(source):
-                    async with self._xfer_cache_path(source) as device_tempfile:
-                        do_push([source], device_tempfile)
-                        await self.execute.asyn("mv -f -- {} {}".format(quote(device_tempfile), quote(dest)), as_root=True)
-                await self.async_manager.map_concurrently(f, sources)
+
+    @property
+    def transfer_metrics(self):
+        """
+        :class:`devlib.connection.TransferMetrics` of the connection type used
+        by the target.
+        """
+        return self.conn.transfer_metrics
+
+    @asyn.asyncf
+    @call_conn
+    async def estimate_transfer_timeout(self, path, default=None, as_root=False):
+        """
+        Estimate a timeout suitable to pull the file at ``path``, based on its
+        size and the throughput of the previous transfers.
+
+        :param path: Path of the file on the target.
+        :param default: Value returned if no estimation can be made, e.g.
+            because no big enough transfer has been made yet.
+        :param as_root: Whether to access the file as root.
+        """
+        try:
+            st = await self._native_fs('stat', path, as_root=as_root)
+        # The shell fallback of stat() raises TargetError or TimeoutError
+        except (OSError, TargetError, TimeoutError) as e:
+            self.logger.debug(f'Could not get the size of {path}: {e}')
+            size = None
         else:
-            for sources, dest in mapping.items():
-                do_push(sources, dest)
+            size = st.st_size
+        return self.conn.transfer_metrics.estimate_timeout(size, default=default)
 
     @asyn.asyncf
     async def _expand_glob(self, pattern, **kwargs):
@@ -907,39 +1115,42 @@ class Target(object):
         source = str(source)
         dest = str(dest)
 
-        if globbing:
-            sources = await self._expand_glob.asyn(source, as_root=as_root)
-        else:
-            sources = [source]
+        with self.command_stats.measure('pull') as measurement:
+            if globbing:
+                sources = await self._expand_glob.asyn(source, as_root=as_root)
+            else:
+                sources = [source]
 
-        # The SSH server might not have the right permissions to read the file,
-        # so use a temporary copy instead.
-        via_temp |= as_root
+            # The SSH server might not have the right permissions to read the file,
+            # so use a temporary copy instead.
+            via_temp |= as_root
 
-        mapping = await self._prepare_xfer.asyn('pull', sources, dest, pattern=source if globbing else None, as_root=as_root)
+            mapping = await self._prepare_xfer.asyn('pull', sources, dest, pattern=source if globbing else None, as_root=as_root)
 
-        def do_pull(sources, dest):
-            for src in sources:
+            def do_pull(sources, dest):
+                for src in sources:
+                    self.async_manager.track_access(
+                        asyn.PathAccess(namespace='target', path=src, mode='r')
+                    )
                 self.async_manager.track_access(
-                    asyn.PathAccess(namespace='target', path=src, mode='r')
+                    asyn.PathAccess(namespace='host', path=dest, mode='w')
                 )
-            self.async_manager.track_access(
-                asyn.PathAccess(namespace='host', path=dest, mode='w')
-            )
-            self.conn.pull(sources, dest, timeout=timeout)
-
-        if via_temp:
-            for sources, dest in mapping.items():
-                async def f(source):
-                    async with self._xfer_cache_path(source) as device_tempfile:
-                        cp_cmd = f"{quote(self.busybox)} cp -rL -- {quote(source)} {quote(device_tempfile)}"
-                        chmod_cmd = f"{quote(self.busybox)} chmod 0644 -- {quote(device_tempfile)}"
-                        await self.execute.asyn(f"{cp_cmd} && {chmod_cmd}", as_root=as_root)
-                        do_pull([device_tempfile], dest)
-                await self.async_manager.map_concurrently(f, sources)
-        else:
-            for sources, dest in mapping.items():
-                do_pull(sources, dest)
+                start = time.monotonic()
+                self.conn.pull(sources, dest, timeout=timeout)
+                self._record_transfer('pull', sources, dest, [dest], start, measurement)
+
+            if via_temp:
+                for sources, dest in mapping.items():
+                    async def f(source):
+                        async with self._xfer_cache_path(source) as device_tempfile:
+                            cp_cmd = f"{quote(self.busybox)} cp -rL -- {quote(source)} {quote(device_tempfile)}"
+                            chmod_cmd = f"{quote(self.busybox)} chmod 0644 -- {quote(device_tempfile)}"
+                            await self.execute.asyn(f"{cp_cmd} && {chmod_cmd}", as_root=as_root)
+                            do_pull([device_tempfile], dest)
+                    await self.async_manager.map_concurrently(f, sources)
+            else:
+                for sources, dest in mapping.items():
+                    do_pull(sources, dest)
 
     @asyn.asyncf
     async def get_directory(self, source_dir, dest, as_root=False):
@@ -976,6 +1187,330 @@ class Target(object):
                 safe_extract(f, outdir)
             os.remove(tmpfile)
 
+    def open_remote(self, path, mode='rb', as_root=False):
+        """
+        Open the file ``path`` on the target and return a binary file object
+        streaming its content, without any intermediate file on the host.
+
+        :param mode: ``'rb'`` to read the file, ``'wb'`` to truncate it and
+            write to it and ``'ab'`` to append to it.
+        :param as_root: Access the file as root.
+        """
+        path = str(path)
+        self.async_manager.track_access(
+            asyn.PathAccess(namespace='target', path=path, mode='r' if mode == 'rb' else 'w')
+        )
+
+        # The file keeps using the connection after we return, so take one out
+        # of the pool until the file is closed, rather than using the one of
+        # the thread that call_conn would give back to the pool right away.
+        with self._lock:
+            try:
+                conn, _ = self._unused_conns.popitem()
+            except KeyError:
+                conn = None
+        if conn is None:
+            conn = self.get_connection()
+
+        try:
+            f = conn.open_remote(path, mode=mode, as_root=as_root)
+        except BaseException:
+            self._release_conn(conn)
+            raise
+
+        if isinstance(f, _RemoteFile):
+            f._add_close_callback(lambda: self._release_conn(conn))
+        # Other file objects, e.g. local files, do not rely on the connection
+        else:
+            self._release_conn(conn)
+        return f
+
+    @asyn.asyncf
+    async def pull_stream(self, path, chunk_size=1024 * 1024, as_root=False):
+        """
+        Asynchronous iterator over the content of the file ``path`` on the
+        target, in chunks of at most ``chunk_size`` bytes.
+
+        The chunks are read in a thread, so the event loop is free to do
+        something else with them while the transfer is progressing.
+        """
+        with self.open_remote(path, 'rb', as_root=as_root) as f:
+            while True:
+                # The blocking variant of that function runs each step in a
+                # different event loop, so it cannot be cached.
+                loop = asyncio.get_running_loop()
+                chunk = await loop.run_in_executor(None, f.read, chunk_size)
+                if chunk:
+                    yield chunk
+                else:
+                    break
+
+    @asyn.asyncf
+    async def push_stream(self, fileobj, dest, as_root=False, chunk_size=1024 * 1024):
+        """
+        Write the content read from the binary file object ``fileobj`` to the
+        file ``dest`` on the target, without any intermediate file.
+
+        :returns: The number of bytes written.
+        """
+        loop = asyncio.get_running_loop()
+        size = 0
+        with self.open_remote(dest, 'wb', as_root=as_root) as f:
+            while True:
+                chunk = await loop.run_in_executor(None, fileobj.read, chunk_size)
+                if chunk:
+                    await loop.run_in_executor(None, f.write, chunk)
+                    size += len(chunk)
+                else:
+                    break
+        return size
+
+    @asyn.asyncf
+    async def stream(self, command, lines=True, line_filter=None, as_root=False,
+                     merge_stderr=False, check_exit_code=True, chunk_size=64 * 1024,
+                     force_locale='C'):
+        """
+        Iterate over the output of ``command`` while it is running, without
+        buffering it. The command is only read from when the next item is
+        requested, so a slow consumer makes the command block on its output
+        rather than using more memory.
+
+        :param lines: If ``True``, yield decoded lines without their trailing
+            newline. Otherwise, yield chunks of at most ``chunk_size`` bytes.
+        :param line_filter: Only keep the lines matching this awk extended
+            regular expression. The filtering is done on the target, so the
+            other lines are never transferred.
+        :param as_root: Run the command as root.
+        :param merge_stderr: Include stderr in the output. Otherwise, it is
+            discarded.
+        :param check_exit_code: Raise a :class:`TargetStableError` if the
+            command exits with a non-zero exit code once its whole output has
+            been consumed.
+
+        The command is killed with :meth:`BackgroundCommand.cancel` if the
+        iteration is stopped before the end of the output, e.g. if the
+        consumer breaks out of the loop or if the consuming task is cancelled.
+        """
+        stderr = subprocess.STDOUT if merge_stderr else subprocess.DEVNULL
+        if line_filter is not None:
+            # Use the environment to pass the regex, since -v would interpret
+            # the escape sequences it contains.
+            redirect = ' 2>&1' if merge_stderr else ''
+            # The exit code of a pipeline is the one of awk, and "set -o
+            # pipefail" is not available in all shells. Instead, the exit code
+            # of the command is sent on fd 3 to a subshell exiting with it,
+            # while the output of awk goes to the original stdout on fd 4.
+            command = '{{ {{ {{ ({}){}; echo $? >&3; }} | DEVLIB_STREAM_FILTER={} {} awk {} >&4; }} 3>&1 | {{ read ret; exit $ret; }}; }} 4>&1'.format(
+                command,
+                redirect,
+                quote(line_filter),
+                quote(self.busybox),
+                quote('$0 ~ ENVIRON["DEVLIB_STREAM_FILTER"] {print; fflush()}'),
+            )
+            stderr = subprocess.DEVNULL
+
+        bg = self.background(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            as_root=as_root,
+            force_locale=force_locale,
+        )
+        try:
+            stdout = bg.stdout
+            if lines:
+                read = stdout.readline
+            else:
+                read = functools.partial(stdout.read1, chunk_size)
+
+            while True:
+                # The blocking variant of that function runs each step in a
+                # different event loop, so it cannot be cached.
+                loop = asyncio.get_running_loop()
+                data = await loop.run_in_executor(None, read)
+                if not data:
+                    break
+                elif lines:
+                    # adb may turn the newlines into CRLF
+                    yield data.decode('utf-8', 'replace').rstrip('\r\n')
+                else:
+                    yield data
+        finally:
+            # No-op if the command already finished
+            bg.cancel()
+            exit_code = bg.close()
+
+        if check_exit_code and exit_code:
+            raise TargetStableError(f'Command exited with exit code {exit_code}: {command}')
+
+    _DIRECTORY_STREAM_COMPRESSIONS = {
+        'gzip': ('{busybox} gzip -c', '{busybox} gzip -dc'),
+        'zstd': ('zstd -q -c', 'zstd -q -dc'),
+    }
+    """
+    Commands used on the target to compress and decompress the tar stream of
+    :meth:`pull_directory` and :meth:`push_directory`.
+    """
+
+    @asyn.asyncf
+    async def _get_stream_compression(self, compression):
+        if compression == 'auto':
+            if shutil.which('zstd'):
+                out = await self.execute.asyn('command -v zstd', check_exit_code=False)
+                if out.strip():
+                    return 'zstd'
+            return 'gzip'
+        elif compression is None:
+            return None
+        elif compression in self._DIRECTORY_STREAM_COMPRESSIONS:
+            if compression == 'zstd' and not shutil.which('zstd'):
+                raise HostError('zstd compression requires the zstd command on the host')
+            return compression
+        else:
+            raise ValueError(f'Unknown compression: {compression}')
+
+    def _get_stream_compression_cmds(self, compression):
+        if compression is None:
+            return (None, None)
+        else:
+            return tuple(
+                cmd.format(busybox=quote(self.busybox))
+                for cmd in self._DIRECTORY_STREAM_COMPRESSIONS[compression]
+            )
+
+    @asyn.asyncf
+    async def pull_directory(self, source, dest, as_root=False, compression='auto', timeout=None):
+        """
+        Pull the content of the ``source`` directory on the target into the
+        ``dest`` directory on the host.
+
+        The directory is streamed as a compressed tar archive over the
+        connection and extracted on the fly, without any intermediate file.
+
+        :returns: A :class:`DirectoryTransferStats` instance.
+        """
+        source = str(source)
+        dest = str(dest)
+        compression = await self._get_stream_compression.asyn(compression)
+        compress, _ = self._get_stream_compression_cmds(compression)
+
+        # The exit status of a pipeline is the one of its last command, so
+        # tar failures are reported on stderr instead.
+        error_marker = 'devlib-tar-failed'
+        cmd = '{} tar -cf - -C {} .'.format(quote(self.busybox), quote(source))
+        if compress:
+            cmd = f'{{ {cmd} || echo {error_marker} >&2; }} | {compress}'
+
+        self.async_manager.track_access(
+            asyn.PathAccess(namespace='target', path=source, mode='r')
+        )
+        self.async_manager.track_access(
+            asyn.PathAccess(namespace='host', path=dest, mode='w')
+        )
+        os.makedirs(dest, exist_ok=True)
+
+        start = time.monotonic()
+        with self.background(cmd, as_root=as_root, timeout=timeout) as bg:
+            stderr = _pump_to_memory(bg.stderr)
+            transferred = _CountingFile(bg.stdout)
+            try:
+                with _host_decompress(compression, transferred) as f:
+                    raw = _CountingFile(f)
+                    with tarfile.open(fileobj=raw, mode='r|') as tar:
+                        safe_extract_stream(tar, dest)
+                    # Consume the end of the stream so the command can exit
+                    while raw.read(1024 * 1024):
+                        pass
+            # The stream ended early, the command's stderr will tell why.
+            except (tarfile.TarError, EOFError) as e:
+                excep = e
+            except BaseException:
+                bg.cancel()
+                raise
+            else:
+                excep = None
+            stderr.join()
+            err = stderr.dst.getvalue().decode('utf-8', errors='replace')
+            ret = bg.wait()
+
+        if ret or excep or error_marker in err:
+            err = err.replace(error_marker, '')
+            raise TargetStableError(f'Could not pull directory {source}: {err.strip() or excep}') from excep
+
+        stats = DirectoryTransferStats(
+            raw_size=raw.count,
+            transferred_size=transferred.count,
+            duration=time.monotonic() - start,
+        )
+        self.logger.debug(f'Pulled directory {source} to {dest}: {stats}')
+        return stats
+
+    @asyn.asyncf
+    async def push_directory(self, source, dest, as_root=False, compression='auto', timeout=None):
+        """
+        Push the content of the ``source`` directory on the host into the
+        ``dest`` directory on the target, which is created if necessary.
+
+        The directory is streamed as a compressed tar archive over the
+        connection and extracted on the fly, without any intermediate file.
+
+        :returns: A :class:`DirectoryTransferStats` instance.
+        """
+        source = str(source)
+        dest = str(dest)
+        if not os.path.isdir(source):
+            raise NotADirectoryError(source)
+        compression = await self._get_stream_compression.asyn(compression)
+        _, decompress = self._get_stream_compression_cmds(compression)
+
+        cmd = '{} tar -xf - -C {}'.format(quote(self.busybox), quote(dest))
+        if decompress:
+            cmd = f'{decompress} | {cmd}'
+        cmd = '{} mkdir -p {} && {}'.format(quote(self.busybox), quote(dest), cmd)
+
+        self.async_manager.track_access(
+            asyn.PathAccess(namespace='host', path=source, mode='r')
+        )
+        self.async_manager.track_access(
+            asyn.PathAccess(namespace='target', path=dest, mode='w')
+        )
+
+        start = time.monotonic()
+        with self.background(cmd, as_root=as_root, timeout=timeout) as bg:
+            stdout = _pump_to_memory(bg.stdout)
+            stderr = _pump_to_memory(bg.stderr)
+            transferred = _CountingFile(bg.stdin)
+            try:
+                with _host_compress(compression, transferred) as f:
+                    raw = _CountingFile(f)
+                    with tarfile.open(fileobj=raw, mode='w|') as tar:
+                        tar.add(source, arcname='.')
+            # The command stopped reading its stdin, its stderr will tell why.
+            except BrokenPipeError:
+                pass
+            except BaseException:
+                bg.cancel()
+                raise
+            try:
+                bg.stdin.close()
+            except BrokenPipeError:
+                pass
+            stdout.join()
+            stderr.join()
+            err = stderr.dst.getvalue().decode('utf-8', errors='replace')
+            ret = bg.wait()
+
+        if ret:
+            raise TargetStableError(f'Could not push directory {source}: {err.strip()}')
+
+        stats = DirectoryTransferStats(
+            raw_size=raw.count,
+            transferred_size=transferred.count,
+            duration=time.monotonic() - start,
+        )
+        self.logger.debug(f'Pushed directory {source} to {dest}: {stats}')
+        return stats
+
     # execution
 
     def _prepare_cmd(self, command, force_locale):
@@ -998,7 +1533,17 @@ class Target(object):
 
     @asyn.asyncf
     @call_conn
+    @_measured('execute')
     async def _execute_async(self, *args, **kwargs):
+        conn = self.conn
+        # Connections with a native asyncio implementation can multiplex
+        # concurrent commands without consuming a thread each. Unlike the
+        # thread pool path below, there is no fallback on _BrokenConnection
+        # since no new connection is opened: the commands use self.conn,
+        # which is already connected.
+        if conn.native_async and kwargs.get('output') is None:
+            return await self._execute_native_async(conn, *args, **kwargs)
+
         execute = functools.partial(
             self._execute,
             *args, **kwargs
@@ -1009,7 +1554,14 @@ class Target(object):
             return execute()
         else:
 
+            stats = self.command_stats
+            site = stats._caller_site() if stats.enabled else None
+            submitted = time.monotonic()
+
             def thread_f():
+                # Time spent waiting for a free thread, which grows when the
+                # pool is saturated.
+                stats.record('async_pool_wait', time.monotonic() - submitted, site=site)
                 # If we cannot successfully connect from the thread, it might
                 # mean that something external opened a connection on the
                 # target, so we just revert to the blocking path.
@@ -1024,21 +1576,135 @@ class Target(object):
             try:
                 return await loop.run_in_executor(pool, thread_f)
             except self._BrokenConnection:
+                self._lower_max_async()
                 return execute()
 
+    async def _execute_native_async(self, conn, command, timeout=None, check_exit_code=True,
+                                    as_root=False, strip_colors=True, will_succeed=False,
+                                    force_locale='C', output=None):
+        command = self._prepare_cmd(command, force_locale)
+        return await conn.execute_async(command, timeout=timeout,
+                check_exit_code=check_exit_code, as_root=as_root,
+                strip_colors=strip_colors, will_succeed=will_succeed)
+
     @call_conn
     def _execute(self, command, timeout=None, check_exit_code=True,
                 as_root=False, strip_colors=True, will_succeed=False,
-                force_locale='C'):
+                force_locale='C', output=None):
+
+        if output is not None:
+            return self._execute_to_output(
+                command,
+                output=output,
+                timeout=timeout,
+                check_exit_code=check_exit_code,
+                as_root=as_root,
+                will_succeed=will_succeed,
+                force_locale=force_locale,
+            )
 
         command = self._prepare_cmd(command, force_locale)
         return self.conn.execute(command, timeout=timeout,
                 check_exit_code=check_exit_code, as_root=as_root,
                 strip_colors=strip_colors, will_succeed=will_succeed)
 
+    def _execute_to_output(self, command, output, timeout, check_exit_code,
+                           as_root, will_succeed, force_locale):
+        """
+        Implementation of :meth:`execute` writing the output of the command to
+        ``output`` as it is produced, rather than accumulating it in memory.
+        The raw bytes are written, so ``strip_colors`` is not applied.
+        """
+        if isinstance(output, bool):
+            raise TypeError('output must be a path, a binary file object or a maximum in-memory size')
+        elif isinstance(output, int):
+            f = tempfile.SpooledTemporaryFile(max_size=output)
+            path = None
+            owned = True
+        elif isinstance(output, (str, os.PathLike)):
+            path = str(output)
+            f = open(path, 'w+b')
+            owned = True
+        else:
+            f = output
+            path = getattr(output, 'name', None)
+            path = path if isinstance(path, str) else None
+            owned = False
+
+        # The caller's file object may already contain some data, or may not
+        # be seekable at all (e.g. a pipe), so the output is located by its
+        # start offset and size rather than by the file boundaries.
+        seekable = f.seekable()
+        start = f.tell() if seekable else None
+        size = 0
+        tail = b''
+
+        timed_out = threading.Event()
+        def cancel():
+            timed_out.set()
+            bg.cancel()
+
+        try:
+            bg = self.background(
+                command,
+                stdout=subprocess.PIPE,
+                # execute() merges stderr into the output
+                stderr=subprocess.STDOUT,
+                as_root=as_root,
+                force_locale=force_locale,
+            )
+            with bg:
+                if timeout is not None:
+                    timer = threading.Timer(timeout, function=cancel)
+                    timer.daemon = True
+                    timer.start()
+                try:
+                    while True:
+                        chunk = bg.stdout.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        size += len(chunk)
+                        # Keep the end of the output for error messages, as
+                        # it cannot be read back from a non-seekable file.
+                        tail = (tail + chunk[-CommandOutput._TAIL_SIZE:])[-CommandOutput._TAIL_SIZE:]
+                    exit_code = bg.wait()
+                finally:
+                    if timeout is not None:
+                        timer.cancel()
+        except BaseException:
+            if owned:
+                f.close()
+            raise
+
+        f.flush()
+        result = CommandOutput(f, path=path, owned=owned, start=start, size=size)
+        tail = tail.decode('utf-8', 'replace')
+        if timed_out.is_set():
+            excep = TimeoutError(command, output=tail)
+        elif check_exit_code and exit_code:
+            cls = TargetTransientCalledProcessError if will_succeed else TargetStableCalledProcessError
+            excep = cls(
+                exit_code,
+                command,
+                tail,
+                None,
+            )
+        else:
+            return result
+
+        result.close()
+        raise excep
+
+    # _execute() is also used by _execute_async(), so only the blocking entry
+    # point is measured to avoid counting the commands twice.
+    @_measured('execute')
+    def _execute_blocking(self, *args, **kwargs):
+        return self._execute(*args, **kwargs)
+
     execute = asyn._AsyncPolymorphicFunction(
         asyn=_execute_async.asyn,
-        blocking=_execute,
+        blocking=_execute_blocking,
     )
 
     @call_conn
@@ -1138,12 +1804,17 @@ class Target(object):
     # sysfs interaction
 
     @asyn.asyncf
+    @_measured('read_value')
     async def read_value(self, path, kind=None):
         self.async_manager.track_access(
             asyn.PathAccess(namespace='target', path=path, mode='r')
         )
-        output = await self.execute.asyn('cat {}'.format(quote(path)), as_root=self.needs_su) # pylint: disable=E1103
-        output = output.strip()
+
+        async def read():
+            output = await self.execute.asyn('cat {}'.format(quote(path)), as_root=self.needs_su) # pylint: disable=E1103
+            return output.strip()
+
+        output = await self._cached_read(('value', path), read)
         if kind:
             return kind(output)
         else:
@@ -1157,6 +1828,53 @@ class Target(object):
     async def read_bool(self, path):
         return await self.read_value.asyn(path, kind=boolean)
 
+    async def _cached_read(self, key, read):
+        """
+        Return the value cached in :attr:`read_cache` for ``key``, or call
+        ``read()`` to get it and cache it if allowed by the rules.
+        """
+        cache = self.read_cache
+        try:
+            return cache.get(key)
+        except KeyError:
+            generation = cache.generation
+            value = await read()
+            cache.set(key, value, generation)
+            return value
+
+    def _invalidate_read_cache(self, access):
+        if (
+            isinstance(access, asyn.PathAccess) and
+            access.namespace == 'target' and
+            access.mode == 'w'
+        ):
+            self.read_cache.invalidate(access.path)
+
+    @asyn.asyncf
+    async def read_values(self, paths, kind=None, raise_errors=True):
+        """
+        Read the content of multiple files in a single round trip.
+
+        :param paths: Paths of the files to read.
+        :type paths: list(str)
+
+        :param kind: Same as for :meth:`read_value`, applied to every value.
+        :type kind: collections.abc.Callable or None
+
+        :param raise_errors: If ``True``, the exception of the first failed
+            read is raised. Otherwise, that exception is used as the value of
+            the path in the returned dictionary.
+        :type raise_errors: bool
+
+        :returns: A dictionary mapping each path to its value.
+        """
+        async with self.batch(raise_errors=raise_errors) as batch:
+            futures = {
+                path: batch.read_value(path, kind=kind)
+                for path in paths
+            }
+        return _futures_outcome(futures)
+
     @asyn.asynccontextmanager
     async def revertable_write_value(self, path, value, verify=True, as_root=True):
         orig_value = self.read_value(path)
@@ -1170,12 +1888,24 @@ class Target(object):
         return batch_contextmanager(self.revertable_write_value, kwargs_list)
 
     @asyn.asyncf
+    @_measured('write_value')
     async def write_value(self, path, value, verify=True, as_root=True):
         self.async_manager.track_access(
             asyn.PathAccess(namespace='target', path=path, mode='w')
         )
         value = str(value)
+        cmd = self._write_value_cmd(path, value, verify)
+
+        try:
+            await self.execute.asyn(cmd, check_exit_code=True, as_root=as_root)
+        except TargetCalledProcessError as e:
+            raise self._write_value_excep(e, path, value, verify)
+        finally:
+            # The cache was invalidated when the access was tracked, but a
+            # concurrent read_value() may have cached the old value since.
+            self.read_cache.invalidate(path)
 
+    def _write_value_cmd(self, path, value, verify):
         if verify:
             # Check in a loop for a while since updates to sysfs files can take
             # some time to be observed, typically when a write triggers a
@@ -1199,20 +1929,90 @@ fi
 '''
         else:
             cmd = '{busybox} printf "%s" {value} > {path}'
-        cmd = cmd.format(busybox=quote(self.busybox), path=quote(path), value=quote(value))
+        return cmd.format(busybox=quote(self.busybox), path=quote(path), value=quote(value))
+
+    @staticmethod
+    def _write_value_excep(e, path, value, verify):
+        """
+        Turn the exception raised by the command built by
+        :meth:`_write_value_cmd` into the exception to raise to the user.
+        """
+        if e.returncode == 10:
+            return TargetStableError('Could not write "{value}" to {path}: {e.output}'.format(
+                value=value, path=path, e=e))
+        elif verify and e.returncode == 11:
+            out = e.output
+            message = 'Could not set the value of {} to "{}" (read "{}")'.format(path, value, out)
+            return TargetStableError(message)
+        else:
+            return e
 
+    @asyn.asyncf
+    async def write_values(self, values, verify=True, as_root=True, raise_errors=True):
+        """
+        Write multiple files in a single round trip.
+
+        :param values: Dictionary mapping paths to the value to write in them.
+            Writes are carried out in the iteration order of the dictionary.
+        :type values: dict(str, object)
+
+        :param verify: Same as for :meth:`write_value`.
+        :type verify: bool
+
+        :param as_root: Same as for :meth:`write_value`.
+        :type as_root: bool
+
+        :param raise_errors: If ``True``, the exception of the first failed
+            write is raised. Otherwise, that exception is used as the value of
+            the path in the returned dictionary.
+        :type raise_errors: bool
+
+        :returns: A dictionary mapping each path to ``None``, or to the
+            exception of the write if it failed and ``raise_errors=False``.
+        """
+        async with self.batch(raise_errors=raise_errors) as batch:
+            futures = {
+                path: batch.write_value(path, value, verify=verify, as_root=as_root)
+                for path, value in values.items()
+            }
+        return _futures_outcome(futures)
+
+    @asyn.asynccontextmanager
+    async def batch(self, timeout=None, raise_errors=True):
+        """
+        Context manager recording commands to execute them in a single round
+        trip when exiting the context.
+
+        :param timeout: Timeout of the execution of the whole batch.
+        :type timeout: int or None
+
+        :param raise_errors: If ``True``, the exception of the first failed
+            command is raised when exiting the context.
+        :type raise_errors: bool
+
+        :yield: A :class:`CommandBatch` used to record the commands.
+
+        **Example**::
+
+            with target.batch() as batch:
+                batch.write_value('/sys/foo', 42)
+                bar = batch.read_value('/sys/bar', kind=int)
+
+            print(bar.result())
+        """
+        batch = CommandBatch(self, timeout=timeout)
         try:
-            await self.execute.asyn(cmd, check_exit_code=True, as_root=as_root)
-        except TargetCalledProcessError as e:
-            if e.returncode == 10:
-                raise TargetStableError('Could not write "{value}" to {path}: {e.output}'.format(
-                    value=value, path=path, e=e))
-            elif verify and e.returncode == 11:
-                out = e.output
-                message = 'Could not set the value of {} to "{}" (read "{}")'.format(path, value, out)
-                raise TargetStableError(message)
-            else:
-                raise
+            yield batch
+        except BaseException:
+            batch.cancel()
+            raise
+        else:
+            futures = await batch.flush.asyn()
+            if raise_errors:
+                for future in futures:
+                    excep = future.exception()
+                    if excep is not None:
+                        raise excep
 
     @asyn.asynccontextmanager
     async def make_temp(self, is_directory=True, directory=None, prefix=None):
@@ -1286,22 +2086,76 @@ fi
 
     # files
 
-    @asyn.asyncf
-    async def makedirs(self, path, as_root=False):
-        await self.execute.asyn('mkdir -p {}'.format(quote(path)), as_root=as_root)
+    def _use_native_fs(self, method, as_root):
+        """
+        Whether the filesystem ``method`` of the connection can be used
+        without executing a shell command.
+        """
+        conn = self.conn
+        return method in conn.native_fs and not (as_root and not conn.connected_as_root)
+
+    async def _native_fs(self, method, *args, **kwargs):
+        """
+        Call the filesystem ``method`` of the connection in a thread, since it
+        can involve a round trip to the target (e.g. over SFTP).
+        """
+        f = getattr(self.conn, method)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(f, *args, **kwargs))
+
+    @asyn.asyncf
+    @call_conn
+    async def _get_path_kinds(self, paths, as_root=False):
+        """
+        Return for each path either ``'dir'``, ``'file'`` or ``None`` if it
+        does not exist.
+        """
+        # A single command is cheaper than one stat() round trip per path
+        if len(paths) == 1 and self._use_native_fs('stat', as_root):
+            path, = paths
+            try:
+                st = await self._native_fs('stat', path, as_root=as_root)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                return [None]
+            else:
+                return ['dir' if stat.S_ISDIR(st.st_mode) else 'file']
+        else:
+            cmd = '; '.join(
+                'if [ -d {path} ]; then echo dir; elif [ -e {path} ]; then echo file; else echo notexist; fi'.format(
+                    path=quote(path)
+                )
+                for path in paths
+            )
+            res = await self.execute.asyn(cmd, as_root=as_root)
+            return [
+                None if kind == 'notexist' else kind
+                for kind in res.split()
+            ]
+
+    @asyn.asyncf
+    @call_conn
+    async def makedirs(self, path, as_root=False):
+        if self._use_native_fs('makedirs', as_root):
+            try:
+                await self._native_fs('makedirs', path, as_root=as_root)
+            except OSError as e:
+                raise TargetStableError(f'Could not create directory {path}: {e}') from e
+        else:
+            await self.execute.asyn('mkdir -p {}'.format(quote(path)), as_root=as_root)
 
     @asyn.asyncf
     async def file_exists(self, filepath):
-        command = 'if [ -e {} ]; then echo 1; else echo 0; fi'
-        output = await self.execute.asyn(command.format(quote(filepath)), as_root=self.is_rooted)
-        return boolean(output.strip())
+        kind, = await self._get_path_kinds.asyn([filepath], as_root=self.is_rooted)
+        return kind is not None
+
+    @staticmethod
+    def _file_exists_cmd(filepath):
+        return 'if [ -e {} ]; then echo 1; else echo 0; fi'.format(quote(filepath))
 
     @asyn.asyncf
     async def directory_exists(self, filepath):
-        output = await self.execute.asyn('if [ -d {} ]; then echo 1; else echo 0; fi'.format(quote(filepath)))
-        # output from ssh my contain part of the expression in the buffer,
-        # split out everything except the last word.
-        return boolean(output.split()[-1])  # pylint: disable=maybe-no-member
+        kind, = await self._get_path_kinds.asyn([filepath])
+        return kind == 'dir'
 
     @asyn.asyncf
     async def list_file_systems(self):
@@ -1321,10 +2175,27 @@ fi
         return fstab
 
     @asyn.asyncf
+    @call_conn
     async def list_directory(self, path, as_root=False):
         self.async_manager.track_access(
             asyn.PathAccess(namespace='target', path=path, mode='r')
         )
+        if self._use_native_fs('listdir', as_root):
+            try:
+                names = await self._native_fs('listdir', path, as_root=as_root)
+            # Let the shell handle the error cases, so that they are reported
+            # the same way for all the connections. For example, "ls" lists a
+            # path that is not a directory as itself, whereas SFTP does not
+            # reliably report ENOTDIR.
+            except OSError:
+                pass
+            else:
+                # Match the output of "ls", which does not list hidden entries
+                return sorted(
+                    name
+                    for name in names
+                    if not name.startswith('.')
+                )
         return await self._list_directory(path, as_root=as_root)
 
     def _list_directory(self, path, as_root=False):
@@ -1349,8 +2220,22 @@ fi
             return path
 
     @asyn.asyncf
+    @call_conn
     async def remove(self, path, as_root=False):
-        await self.execute.asyn('rm -rf -- {}'.format(quote(path)), as_root=as_root)
+        try:
+            if self._use_native_fs('unlink', as_root):
+                try:
+                    await self._native_fs('unlink', path, as_root=as_root)
+                except FileNotFoundError:
+                    return
+                # Directories need a recursive removal
+                except OSError:
+                    pass
+                else:
+                    return
+            await self.execute.asyn('rm -rf -- {}'.format(quote(path)), as_root=as_root)
+        finally:
+            self.read_cache.invalidate(path)
 
     # misc
     @asyn.asyncf
@@ -1400,6 +2285,148 @@ fi
     def uninstall(self, name):
         raise NotImplementedError()
 
+    _INSTALL_MANIFEST = '.devlib-manifest'
+    """
+    Name of the file in :attr:`executables_directory` recording the content
+    digest of each binary installed by devlib.
+    """
+
+    @asyn.asyncf
+    async def install_many(self, filepaths, timeout=None):
+        """
+        Install several executables, returning their paths on the target.
+
+        The executables already present on the target with matching content
+        are found in a single round trip and are not pushed again.
+        """
+        return await self._install_content_addressed(
+            [(filepath, None) for filepath in filepaths],
+            timeout=timeout,
+        )
+
+    async def _install_executable(self, filepath, name, timeout=None):
+        """
+        Push ``filepath`` as the executable ``name`` in
+        :attr:`executables_directory` and return its path on the target.
+        """
+        raise NotImplementedError()
+
+    @property
+    def _install_as_root(self):
+        return False
+
+    @staticmethod
+    def _host_file_digest(filepath):
+        sha = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return (sha.hexdigest(), os.path.getsize(filepath))
+
+    async def _get_installed(self, specs):
+        """
+        Return the names of the ``(name, (digest, size))`` of ``specs`` that
+        are already installed on the target with that content.
+
+        The manifest and the size are checked first so that only the
+        candidates are hashed on the target, all in a single round trip.
+        """
+        # busybox itself is installed this way, so it might not be available
+        busybox = quote(self.busybox) if self.busybox else ''
+        manifest = quote(self._INSTALL_MANIFEST)
+        checks = '\n'.join(
+            (
+                '{busybox} grep -qxF -e {entry} {manifest} && [ -x {name} ] && '
+                '[ "$({busybox} wc -c < {name})" -eq {size} ] && '
+                'printf "%s %s\\n" "$({busybox} sha256sum < {name})" {name}'
+            ).format(
+                busybox=busybox,
+                manifest=manifest,
+                entry=quote(f'{digest} {name}'),
+                name=quote(name),
+                size=size,
+            )
+            for name, (digest, size) in specs
+        )
+        cmd = '(cd {} && {{\n{}\n}}) 2>/dev/null; true'.format(
+            quote(self.executables_directory),
+            checks,
+        )
+        output = await self.execute.asyn(cmd, as_root=self._install_as_root)
+
+        # Each line is "<digest>  - <name>", since sha256sum read stdin
+        regex = re.compile(r'^([0-9a-f]+) +- (.*)$')
+        remote = {}
+        for line in output.splitlines():
+            m = regex.match(line)
+            if m:
+                digest, name = m.groups()
+                remote[name] = digest
+
+        return {
+            name
+            for name, (digest, _) in specs
+            if remote.get(name) == digest
+        }
+
+    async def _update_install_manifest(self, entries):
+        """
+        Record the ``(name, digest)`` of ``entries`` in the install manifest,
+        replacing the previous entries of the same names.
+        """
+        manifest = quote(self._INSTALL_MANIFEST)
+        # Later entries take precedence, and the manifest is rewritten so it
+        # does not grow with each install. This is best effort, as a missing
+        # entry only means the binary will be pushed again next time.
+        cmd = (
+            '(cd {dir} && {{ cat {manifest} 2>/dev/null; printf "%s\\n" {entries}; }} | '
+            '{busybox} awk {script} > {manifest}.tmp && mv -f {manifest}.tmp {manifest}) 2>/dev/null; true'
+        ).format(
+            dir=quote(self.executables_directory),
+            manifest=manifest,
+            entries=' '.join(
+                quote(f'{digest} {name}')
+                for name, digest in entries
+            ),
+            busybox=quote(self.busybox) if self.busybox else '',
+            script=quote('{name = $0; sub(/^[^ ]* /, "", name); entries[name] = $0} END {for (name in entries) print entries[name]}'),
+        )
+        await self.execute.asyn(cmd, as_root=self._install_as_root)
+
+    async def _install_content_addressed(self, specs, timeout=None):
+        """
+        Install each ``(filepath, with_name)`` of ``specs``, skipping the ones
+        already installed with the same content.
+        """
+        specs = [
+            (filepath, with_name or os.path.basename(filepath))
+            for filepath, with_name in specs
+        ]
+        host_digests = [
+            self._host_file_digest(filepath)
+            for filepath, _ in specs
+        ]
+        installed = await self._get_installed([
+            (name, host_digest)
+            for (_, name), host_digest in zip(specs, host_digests)
+        ])
+
+        paths = []
+        updated = []
+        for (filepath, name), host_digest in zip(specs, host_digests):
+            if name in installed:
+                self.logger.debug(f'Skipping install of {filepath}, already up to date on the target')
+                path = self.path.join(self.executables_directory, name)
+                self._installed_binaries[name] = path
+            else:
+                path = await self._install_executable(filepath, name, timeout=timeout)
+                updated.append((name, host_digest[0]))
+            paths.append(path)
+
+        if updated:
+            await self._update_install_manifest(updated)
+        return paths
+
     @asyn.asyncf
     async def get_installed(self, name, search_system_binaries=True):
         # Check user installed binaries first
@@ -1504,46 +2531,98 @@ fi
         await self.execute.asyn('sleep {}'.format(duration), timeout=timeout)
 
     @asyn.asyncf
-    async def read_tree_tar_flat(self, path, depth=1, check_exit_code=True,
-                              decode_unicode=True, strip_null_chars=True):
+    async def _read_tree_dump(self, command, path, check_exit_code=True):
+        """
+        Execute a shutils command producing a tree dump (see
+        ``read_tree_dump``) and return a dict mapping the path of each file
+        under ``path`` to its ``bytes`` content, or ``None`` if it was removed.
+        """
         self.async_manager.track_access(
             asyn.PathAccess(namespace='target', path=path, mode='r')
         )
-        command = 'read_tree_tgz_b64 {} {} {}'.format(quote(path), depth,
-                                                  quote(self.working_directory))
-        output = await self._execute_util.asyn(command, as_root=self.is_rooted,
-                                    check_exit_code=check_exit_code)
+        # The tree is streamed in a binary format as-is, rather than going
+        # through execute() which would require encoding it as text.
+        command = '{} sh {} {}'.format(quote(self.busybox), quote(self.shutils), command)
 
-        result = {}
+        with self.background(command, as_root=self.is_rooted) as bg:
+            stderr = _pump_to_memory(bg.stderr)
+            try:
+                result = {
+                    path if name == '.' else self.path.join(path, name): value
+                    for name, value in _parse_tree_dump(bg.stdout)
+                }
+            except ValueError as e:
+                excep = e
+            except BaseException:
+                bg.cancel()
+                raise
+            else:
+                excep = None
+            stderr.join()
+            err = stderr.dst.getvalue().decode('utf-8', errors='replace')
+            ret = bg.wait()
 
-        # Unpack the archive in memory
-        tar_gz = base64.b64decode(output)
-        tar_gz_bytes = io.BytesIO(tar_gz)
-        tar_buf = gzip.GzipFile(fileobj=tar_gz_bytes).read()
-        tar_bytes = io.BytesIO(tar_buf)
-        with tarfile.open(fileobj=tar_bytes) as tar:
-            for member in tar.getmembers():
-                try:
-                    content_f = tar.extractfile(member)
-                # ignore exotic members like sockets
-                except Exception:
-                    continue
-                # if it is a file and not a folder
-                if content_f:
-                    content = content_f.read()
-                    if decode_unicode:
-                        try:
-                            content = content.decode('utf-8').strip()
-                            if strip_null_chars:
-                                content = content.replace('\x00', '').strip()
-                        except UnicodeDecodeError:
-                            content = ''
-
-                    name = self.path.join(path, member.name)
-                    result[name] = content
+        if excep or (ret and check_exit_code):
+            raise TargetStableError(f'Could not read tree {path}: {err.strip() or excep}') from excep
+
+        return result
+
+    @asyn.asyncf
+    async def read_tree_tar_flat(self, path, depth=1, check_exit_code=True,
+                              decode_unicode=True, strip_null_chars=True,
+                              lazy_decode=False):
+        command = 'read_tree_dump {} {} {}'.format(
+            quote(path),
+            depth,
+            quote(self.working_directory),
+        )
+        result = await self._read_tree_dump.asyn(command, path, check_exit_code)
+
+        if decode_unicode:
+            decode = functools.partial(_decode_tree_value, strip_null_chars=strip_null_chars)
+            if lazy_decode:
+                result = _LazyDecodedMapping(result, decode)
+            else:
+                result = {
+                    name: decode(content)
+                    for name, content in result.items()
+                }
 
         return result
 
+    @asyn.asyncf
+    async def snapshot_tree(self, path, depth=1, decode_unicode=True, strip_null_chars=True):
+        """
+        Read the content of all files under a given folder, like
+        :meth:`read_tree_values` with ``tar=True``, and return a
+        :class:`TreeSnapshot` that can be refreshed later on by only
+        transferring the files that changed in the meantime.
+
+        :param path: path to the folder
+        :param depth: maximum tree depth to read
+        :param decode_unicode: decode the content of files as utf-8
+        :param strip_null_chars: remove '\x00' chars from the content of utf-8
+            decoded files
+        """
+        cmd = f'mktemp -p {quote(self.tmp_directory)} -d'
+        state_dir = (await self.execute.asyn(cmd)).strip()
+        snapshot = TreeSnapshot(
+            target=self,
+            path=path,
+            depth=depth,
+            state_dir=state_dir,
+            decode=functools.partial(
+                _decode_tree_value,
+                strip_null_chars=strip_null_chars,
+            ) if decode_unicode else None,
+        )
+        try:
+            await snapshot.refresh.asyn()
+        except BaseException:
+            await snapshot.close.asyn()
+            raise
+        return snapshot
+
     @asyn.asyncf
     async def read_tree_values_flat(self, path, depth=1, check_exit_code=True):
         self.async_manager.track_access(
@@ -1566,7 +2645,7 @@ fi
     @asyn.asyncf
     async def read_tree_values(self, path, depth=1, dictcls=dict,
                          check_exit_code=True, tar=False, decode_unicode=True,
-                         strip_null_chars=True):
+                         strip_null_chars=True, lazy_decode=False):
         """
         Reads the content of all files under a given tree
 
@@ -1579,16 +2658,28 @@ fi
         :decode_unicode: decode the content of tar-ed files as utf-8
         :strip_null_chars: remove '\x00' chars from the content of utf-8
                            decoded files
+        :lazy_decode: with ``tar=True``, only decode the content of files when
+                      it is accessed. The nodes of the tree are then read-only
+                      mappings rather than ``dictcls`` instances.
 
         :returns: a tree-like dict with the content of files as leafs
         """
-        if not tar:
-            value_map = await self.read_tree_values_flat.asyn(path, depth, check_exit_code)
+        async def read():
+            if not tar:
+                return await self.read_tree_values_flat.asyn(path, depth, check_exit_code)
+            else:
+                return await self.read_tree_tar_flat.asyn(path, depth, check_exit_code,
+                                                    decode_unicode,
+                                                    strip_null_chars,
+                                                    lazy_decode)
+
+        key = ('tree', path, depth, check_exit_code, tar, decode_unicode, strip_null_chars, lazy_decode)
+        value_map = await self._cached_read(key, read)
+        if isinstance(value_map, _LazyDecodedMapping):
+            tree = _build_path_tree(value_map.raw, path, self.path.sep, dict)
+            return value_map.wrap_tree(tree)
         else:
-            value_map = await self.read_tree_tar_flat.asyn(path, depth, check_exit_code,
-                                                decode_unicode,
-                                                strip_null_chars)
-        return _build_path_tree(value_map, path, self.path.sep, dictcls)
+            return _build_path_tree(value_map, path, self.path.sep, dictcls)
 
     def install_module(self, mod, **params):
         mod = get_module(mod)
@@ -1613,163 +2704,1214 @@ fi
                 for line in lines:
                     line = line.replace("__DEVLIB_BUSYBOX__", self.busybox)
                     ofile.write(line)
-            self._shutils = await self.install.asyn(shutils_ofile)
+            self._shutils, _ = await self.install_many.asyn([
+                shutils_ofile,
+                os.path.join(scripts, 'devlib-signal-target'),
+            ])
+
+    @asyn.asyncf
+    @call_conn
+    async def _execute_util(self, command, timeout=None, check_exit_code=True, as_root=False):
+        command = '{} sh {} {}'.format(quote(self.busybox), quote(self.shutils), command)
+        return await self.execute.asyn(
+            command,
+            timeout=timeout,
+            check_exit_code=check_exit_code,
+            as_root=as_root
+        )
+
+    async def _extract_archive(self, path, cmd, dest=None):
+        cmd = '{} ' + cmd  # busybox
+        if dest:
+            extracted = dest
+        else:
+            extracted = self.path.dirname(path)
+        cmdtext = cmd.format(quote(self.busybox), quote(path), quote(extracted))
+        await self.execute.asyn(cmdtext)
+        return extracted
+
+    async def _extract_file(self, path, cmd, dest=None):
+        cmd = '{} ' + cmd  # busybox
+        cmdtext = cmd.format(quote(self.busybox), quote(path))
+        await self.execute.asyn(cmdtext)
+        extracted = self.path.splitext(path)[0]
+        if dest:
+            await self.execute.asyn('mv -f {} {}'.format(quote(extracted), quote(dest)))
+            if dest.endswith('/'):
+                extracted = self.path.join(dest, self.path.basename(extracted))
+            else:
+                extracted = dest
+        return extracted
+
+    def _install_module(self, mod, params, log=True):
+        mod = get_module(mod)
+        name = mod.name
+        if params is None or self._modules.get(name, {}) is None:
+            raise TargetStableError(f'Could not load module "{name}" as it has been explicilty disabled')
+        else:
+            try:
+                return mod.install(self, **params)
+            except Exception as e:
+                if log:
+                    self.logger.error(f'Module "{name}" failed to install on target: {e}')
+                raise
+
+    @property
+    def modules(self):
+        return sorted(self._modules.keys())
+
+    def stats(self, reset=False):
+        """
+        Statistics of the operations carried out on the target, as returned by
+        :meth:`CommandStats.to_dict` on :attr:`command_stats`.
+
+        :param reset: If ``True``, reset the statistics after collecting them.
+        :type reset: bool
+        """
+        stats = self.command_stats
+        dct = stats.to_dict()
+        if reset:
+            stats.reset()
+        return dct
+
+    def _update_modules(self, stage):
+        to_install = [
+            (mod, params)
+            for mod, params in (
+                (get_module(name), params)
+                for name, params in self._modules.items()
+            )
+            if mod.stage == stage
+        ]
+        for mod, params in to_install:
+            try:
+                self._install_module(mod, params)
+            except Exception as e:
+                mod_name = mod.name
+                self.logger.warning(f'Module {mod.name} is not supported by the target: {e}')
+
+    def _get_module(self, modname, log=True):
+        try:
+            return self._installed_modules[modname]
+        except KeyError:
+            params = {}
+            try:
+                mod = get_module(modname)
+            # We might try to access e.g. "boot" attribute, which is ambiguous
+            # since there are multiple modules with the "boot" kind. In that
+            # case, we look into the list of modules enabled by the user and
+            # get the first "boot" module we find.
+            except ValueError:
+                for _mod, _params in self._modules.items():
+                    try:
+                        _mod = get_module(_mod)
+                    except ValueError:
+                        pass
+                    else:
+                        if _mod.attr_name == modname:
+                            mod = _mod
+                            params = _params
+                            break
+                else:
+                    raise AttributeError(
+                        f"'{self.__class__.__name__}' object has no attribute '{modname}'"
+                    )
+            else:
+                params = self._modules.get(mod.name, {})
+
+            self._install_module(mod, params, log=log)
+            return self.__getattr__(modname)
+
+    def __getattr__(self, attr):
+        # When unpickled, objects will have an empty dict so fail early
+        if attr.startswith('__') and attr.endswith('__'):
+            raise AttributeError(attr)
+
+        try:
+            return self._get_module(attr)
+        except Exception as e:
+            # Raising AttributeError is important otherwise hasattr() will not
+            # work as expected
+            raise AttributeError(str(e))
+
+    def _resolve_paths(self):
+        raise NotImplementedError()
+
+    @asyn.asyncf
+    async def is_network_connected(self):
+        self.logger.debug('Checking for internet connectivity...')
+
+        timeout_s = 5
+        # It would be nice to use busybox for this, but that means we'd need
+        # root (ping is usually setuid so it can open raw sockets to send ICMP)
+        command = 'ping -q -c 1 -w {} {} 2>&1'.format(timeout_s,
+                                                      quote(GOOGLE_DNS_SERVER_ADDRESS))
+
+        # We'll use our own retrying mechanism (rather than just using ping's -c
+        # to send multiple packets) so that we don't slow things down in the
+        # 'good' case where the first packet gets echoed really quickly.
+        attempts = 5
+        for _ in range(attempts):
+            try:
+                await self.execute.asyn(command)
+                return True
+            except TargetStableError as e:
+                err = str(e).lower()
+                if '100% packet loss' in err:
+                    # We sent a packet but got no response.
+                    # Try again - we don't want this to fail just because of a
+                    # transient drop in connection quality.
+                    self.logger.debug('No ping response from {} after {}s'
+                                      .format(GOOGLE_DNS_SERVER_ADDRESS, timeout_s))
+                    continue
+                elif 'network is unreachable' in err:
+                    # No internet connection at all, we can fail straight away
+                    self.logger.debug('Network unreachable')
+                    return False
+                else:
+                    # Something else went wrong, we don't know what, raise an
+                    # error.
+                    raise
+
+        self.logger.debug('Failed to ping {} after {} attempts'.format(
+            GOOGLE_DNS_SERVER_ADDRESS, attempts))
+        return False
+
+
+class ProbeCache:
+    """
+    Host-side cache of the results of target probes such as
+    :attr:`Target.abi` or :attr:`Target.cpuinfo` and of successful module
+    probes, persisted on disk so that connecting again to the same target does
+    not need to probe it again.
+
+    The entries of a target are discarded as soon as its boot id
+    (``/proc/sys/kernel/random/boot_id``) changes, so a reboot invalidates
+    them.
+
+    :param path: Directory in which the cache is stored. If ``None``, nothing
+        is cached.
+    :type path: str or None
+
+    .. warning:: The cache is stored using :mod:`pickle`, so ``path`` must
+        only be writable by trusted users.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._file = None
+        self._boot_id = None
+        self._values = {}
+
+    @property
+    def enabled(self):
+        return self._file is not None
+
+    def load(self, identity, boot_id):
+        """
+        Load the entries of the target identified by ``identity``, discarding
+        them if they were recorded during another boot than ``boot_id``.
+
+        :param identity: Value identifying the target, with a stable
+            :func:`repr`.
+        :type identity: object
+
+        :param boot_id: Boot id of the target. If ``None``, the cache is
+            disabled.
+        :type boot_id: str or None
+        """
+        self._values = {}
+        if self.path is None or boot_id is None:
+            self._file = None
+            return
+
+        digest = hashlib.sha256(repr(identity).encode('utf-8')).hexdigest()
+        self._file = os.path.join(self.path, f'{digest}.pickle')
+        self._boot_id = boot_id
+
+        try:
+            with open(self._file, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            data = {}
+        # Ignore corrupted or incompatible cache files
+        except Exception as e:
+            self.logger.debug(f'Could not load probe cache {self._file}: {e}')
+            data = {}
+
+        if data.get('boot_id') == boot_id:
+            self._values = data['values']
+            self.logger.debug(f'Loaded {len(self._values)} entries from probe cache {self._file}')
+
+    def get(self, name):
+        """
+        Get the cached result of the probe ``name``.
+
+        :raises KeyError: If there is no such entry.
+        """
+        if not self.enabled:
+            raise KeyError(name)
+        return self._values[name]
+
+    def set(self, name, value):
+        """
+        Record the result of the probe ``name`` and persist it.
+        """
+        if not self.enabled:
+            return
+
+        self._values[name] = value
+        try:
+            self._save()
+        except Exception as e:
+            self.logger.debug(f'Could not save probe {name} in cache {self._file}: {e}')
+            del self._values[name]
+
+    def _save(self):
+        os.makedirs(self.path, exist_ok=True)
+        data = dict(
+            boot_id=self._boot_id,
+            values=self._values,
+        )
+        # Write to a temporary file and rename it so that concurrent readers
+        # never see a partially written file
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f)
+            os.replace(temp, self._file)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+
+class ReadCache:
+    """
+    Cache of the content of target files read by :meth:`Target.read_value`
+    (and therefore :meth:`Target.read_int` and :meth:`Target.read_bool`) and
+    :meth:`Target.read_tree_values`.
+
+    Nothing is cached until rules are added with :meth:`add_rule`. Entries are
+    invalidated when a write access to an overlapping path is registered with
+    :meth:`devlib.utils.asyn.AsyncManager.track_access` (e.g. by
+    :meth:`Target.write_value` or :meth:`Target.push`), when a path is removed
+    with :meth:`Target.remove` and when the target reboots or connects.
+
+    .. note:: Paths are compared textually, so writing through a symlink will
+        not invalidate entries cached under the resolved path.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = []
+        self._entries = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def add_rule(self, pattern, ttl=None):
+        """
+        Allow caching the paths matching ``pattern``.
+
+        :param pattern: :mod:`fnmatch` pattern matched against the normalized
+            path. Note that ``*`` also matches ``/``.
+        :type pattern: str
+
+        :param ttl: Time in seconds after which an entry expires. If ``None``,
+            entries are kept until they are invalidated.
+        :type ttl: float or None
+        """
+        with self._lock:
+            self._rules.append((pattern, ttl))
+
+    def clear_rules(self):
+        """
+        Remove all the rules, and therefore all the cached entries.
+        """
+        with self._lock:
+            self._rules.clear()
+            self._invalidate(None)
+
+    def _get_rule(self, path):
+        for pattern, ttl in self._rules:
+            if fnmatch.fnmatchcase(path, pattern):
+                return (True, ttl)
+        return (False, None)
+
+    @staticmethod
+    def _normalize_key(key):
+        kind, path, *others = key
+        return (kind, posixpath.normpath(path), *others)
+
+    def get(self, key):
+        """
+        Get the value cached for ``key``.
+
+        :param key: Tuple whose second item is the path the value was read
+            from.
+        :type key: tuple
+
+        :raises KeyError: If no valid entry is cached.
+        """
+        key = self._normalize_key(key)
+        with self._lock:
+            cacheable, _ = self._get_rule(key[1])
+            if not cacheable:
+                raise KeyError(key)
+
+            try:
+                value, expiry = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                raise
+
+            if expiry is not None and time.monotonic() >= expiry:
+                del self._entries[key]
+                self.misses += 1
+                raise KeyError(key)
+            else:
+                self.hits += 1
+                return value
+
+    def set(self, key, value, generation=None):
+        """
+        Cache ``value`` for ``key`` if allowed by the rules.
+
+        :param generation: Value of :attr:`generation` before the read was
+            started. If any invalidation happened since then, the value is
+            not cached as it may already be stale.
+        :type generation: int or None
+        """
+        key = self._normalize_key(key)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            cacheable, ttl = self._get_rule(key[1])
+            if cacheable:
+                expiry = None if ttl is None else time.monotonic() + ttl
+                self._entries[key] = (value, expiry)
+
+    def invalidate(self, path=None):
+        """
+        Invalidate the entries of ``path``, of its parents and of its children.
+        If ``path`` is ``None``, all the entries are invalidated.
+        """
+        with self._lock:
+            self._invalidate(path)
+
+    def _invalidate(self, path):
+        self.generation += 1
+        if path is None:
+            self._entries.clear()
+        else:
+            path = posixpath.normpath(path)
+
+            def overlap(other):
+                return (
+                    other == path or
+                    other.startswith(path.rstrip('/') + '/') or
+                    path.startswith(other.rstrip('/') + '/')
+                )
+
+            self._entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if not overlap(key[1])
+            }
+
+    @property
+    def stats(self):
+        """
+        Dictionary with the number of cache ``hits``, ``misses`` and the
+        number of currently cached ``entries``.
+        """
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                entries=len(self._entries),
+            )
+
+    def reset_stats(self):
+        """
+        Reset the hit and miss counters.
+        """
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+class CommandRecord(namedtuple('CommandRecord', ['op', 'site', 'duration', 'size', 'error'])):
+    """
+    Measurement of a single operation recorded by :class:`CommandStats`.
+
+    :param op: Name of the operation, e.g. ``'execute'`` or ``'push'``.
+    :param site: Name of the module and function that started the operation,
+        e.g. ``'devlib.module.cpufreq:set_governor'``, or ``None`` if it could
+        not be determined.
+    :param size: Number of bytes transferred, or ``None``.
+    :param duration: Duration of the operation in seconds.
+    :param error: ``True`` if the operation raised an exception.
+    """
+    __slots__ = ()
+
+
+class _OpStats:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.count = 0
+        self.errors = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.size = 0
+        self.histogram = [0] * (len(buckets) + 1)
+
+    def add(self, record):
+        duration = record.duration
+        self.count += 1
+        self.errors += record.error
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+        self.size += record.size or 0
+        self.histogram[bisect.bisect_left(self.buckets, duration)] += 1
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in self.buckets] + ['inf']
+        return dict(
+            count=self.count,
+            errors=self.errors,
+            total=self.total,
+            mean=self.total / self.count if self.count else None,
+            min=self.min,
+            max=self.max,
+            size=self.size,
+            histogram=dict(zip(bounds, self.histogram)),
+        )
+
+
+class _Measurement:
+    def __init__(self, op, site):
+        self.op = op
+        self.site = site
+        self.size = None
+
+    def add_size(self, size):
+        self.size = (self.size or 0) + size
+
+
+class CommandStats:
+    """
+    Call counts, latency histograms and amount of data transferred by the
+    operations of a :class:`Target`, aggregated per operation and per caller
+    site.
+
+    :param buckets: Upper bounds in seconds of the buckets of the latency
+        histograms, in increasing order. An extra bucket collects the values
+        above the last bound.
+    :type buckets: list(float) or None
+    """
+
+    BUCKETS = (
+        0.001, 0.002, 0.005,
+        0.01, 0.02, 0.05,
+        0.1, 0.2, 0.5,
+        1, 2, 5,
+        10, 30, 60,
+    )
+
+    _SKIPPED_SITES = (
+        'devlib.target',
+        'devlib.connection',
+        'devlib.host',
+        'devlib.utils.',
+        'asyncio',
+        'concurrent.',
+        'contextlib',
+        'contextvars',
+        'functools',
+        'threading',
+        'greenlet',
+    )
+
+    def __init__(self, buckets=None):
+        self._lock = threading.Lock()
+        self.buckets = tuple(sorted(buckets or self.BUCKETS))
+        self._ops = {}
+        self.enabled = True
+        """
+        If ``False``, nothing is recorded.
+        """
+
+        self.callbacks = []
+        """
+        List of callables called with a :class:`CommandRecord` every time an
+        operation completes.
+        """
+
+    @classmethod
+    def _caller_site(cls):
+        skipped = cls._SKIPPED_SITES
+        for frame in asyn._iter_stack(sys._getframe(1)):
+            module = frame.f_globals.get('__name__', '')
+            if not module.startswith(skipped):
+                return f'{module}:{frame.f_code.co_name}'
+        return None
+
+    @contextmanager
+    def measure(self, op, site=None):
+        """
+        Context manager recording the duration of the operation ``op`` run
+        inside it.
+
+        :param op: Name of the operation.
+        :type op: str
+
+        :param site: Caller site of the operation. If ``None``, it is the first
+            function in the call stack that is not part of the devlib
+            internals, so that commands issued by devlib modules are
+            attributed to them.
+        :type site: str or None
+
+        :yield: An object with a ``site`` attribute and an ``add_size(size)``
+            method to account for the bytes transferred by the operation, or
+            ``None`` if the recording is disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        if site is None:
+            site = self._caller_site()
+
+        measurement = _Measurement(op, site)
+        error = False
+        start = time.monotonic()
+        try:
+            yield measurement
+        except BaseException:
+            error = True
+            raise
+        finally:
+            duration = time.monotonic() - start
+            self.record(op, duration, site=site, size=measurement.size, error=error)
+
+    def record(self, op, duration, site=None, size=None, error=False):
+        """
+        Record a completed operation and notify :attr:`callbacks`.
+
+        :param op: Name of the operation.
+        :type op: str
+
+        :param duration: Duration of the operation in seconds.
+        :type duration: float
+
+        :param site: Caller site of the operation.
+        :type site: str or None
+
+        :param size: Number of bytes transferred by the operation.
+        :type size: int or None
+
+        :param error: Whether the operation failed.
+        :type error: bool
+        """
+        if not self.enabled:
+            return
+
+        record = CommandRecord(op=op, site=site, duration=duration, size=size, error=error)
+        with self._lock:
+            try:
+                total, sites = self._ops[op]
+            except KeyError:
+                total = _OpStats(self.buckets)
+                sites = {}
+                self._ops[op] = (total, sites)
+
+            try:
+                site_stats = sites[site]
+            except KeyError:
+                site_stats = _OpStats(self.buckets)
+                sites[site] = site_stats
+
+            total.add(record)
+            site_stats.add(record)
+
+        for callback in self.callbacks:
+            try:
+                callback(record)
+            except Exception as e:
+                logging.getLogger('CommandStats').warning(f'Stats callback {callback} failed: {e}')
+
+    def to_dict(self):
+        """
+        Dictionary mapping each operation to its statistics. The ``sites`` key
+        of each operation maps the caller sites to the same statistics
+        restricted to the operations they started.
+        """
+        with self._lock:
+            return {
+                op: dict(
+                    total.to_dict(),
+                    sites={
+                        str(site): site_stats.to_dict()
+                        for site, site_stats in sites.items()
+                    },
+                )
+                for op, (total, sites) in self._ops.items()
+            }
+
+    def to_json(self, f=None, **kwargs):
+        """
+        Serialize :meth:`to_dict` to JSON.
+
+        :param f: Path or text file object the JSON is written to. If ``None``,
+            the JSON string is returned instead.
+        :type f: str or os.PathLike or io.TextIOBase or None
+
+        :Variable keyword arguments: Forwarded to :func:`json.dump`.
+        """
+        stats = self.to_dict()
+        if f is None:
+            return json.dumps(stats, **kwargs)
+        elif isinstance(f, (str, os.PathLike)):
+            with open(f, 'w') as _f:
+                json.dump(stats, _f, **kwargs)
+        else:
+            json.dump(stats, f, **kwargs)
+
+    def reset(self):
+        """
+        Forget all the recorded operations.
+        """
+        with self._lock:
+            self._ops.clear()
+
+
+def _futures_outcome(futures):
+    def outcome(future):
+        excep = future.exception()
+        return future.result() if excep is None else excep
+
+    return {
+        key: outcome(future)
+        for key, future in futures.items()
+    }
+
+
+class DirectoryTransferStats(namedtuple('DirectoryTransferStats', 'raw_size transferred_size duration')):
+    """
+    Statistics of a directory transfer made by :meth:`Target.pull_directory`
+    or :meth:`Target.push_directory`.
+
+    :ivar raw_size: Size in bytes of the uncompressed tar stream.
+    :ivar transferred_size: Size in bytes of the data sent over the connection.
+    :ivar duration: Duration of the transfer in seconds.
+    """
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        """
+        Uncompressed bytes transferred per second.
+        """
+        return self.raw_size / self.duration if self.duration else float('inf')
+
+    @property
+    def compression_ratio(self):
+        return self.raw_size / self.transferred_size if self.transferred_size else 1.0
+
+    def __str__(self):
+        return '{:.1f} MiB in {:.2f}s ({:.1f} MiB/s), compression ratio {:.2f}'.format(
+            self.raw_size / 2**20,
+            self.duration,
+            self.throughput / 2**20,
+            self.compression_ratio,
+        )
+
+
+class CommandOutput:
+    """
+    Output of a command executed with ``Target.execute(..., output=...)``.
+    The content is only loaded in memory when explicitly requested.
+
+    :param f: Binary file object the output was written to.
+    :type f: io.IOBase
+
+    :param path: Path of the file on the host, if any.
+    :type path: str or None
+
+    :param owned: If ``True``, :meth:`close` closes ``f``.
+    :type owned: bool
+
+    :param start: Offset of the output in ``f``, or ``None`` if ``f`` is not
+        seekable, in which case the output cannot be read back.
+    :type start: int or None
+
+    :param size: Size of the output in bytes. If ``None``, the output extends
+        to the end of ``f``.
+    :type size: int or None
+    """
+    _TAIL_SIZE = 4096
+
+    def __init__(self, f, path=None, owned=True, start=0, size=None):
+        self._f = f
+        self.path = path
+        self._owned = owned
+        self._start = start
+        if size is None:
+            pos = f.tell()
+            try:
+                size = f.seek(0, os.SEEK_END) - start
+            finally:
+                f.seek(pos)
+        self.size = size
+
+    def _seek(self, offset):
+        if self._start is None:
+            raise io.UnsupportedOperation('The output was written to a non-seekable file and cannot be read back')
+        self._f.seek(self._start + offset)
+
+    def _iter_chunks(self, offset=0, chunk_size=1024 * 1024):
+        self._seek(offset)
+        remaining = self.size - offset
+        while remaining > 0:
+            chunk = self._f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def open(self):
+        """
+        Return the binary file object containing the output, positioned at
+        its beginning.
+
+        .. note:: If the file object was provided by the caller, it may
+            contain other data before and after the output.
+        """
+        self._seek(0)
+        return self._f
+
+    def read_bytes(self):
+        """
+        Load the whole output in memory.
+        """
+        return b''.join(self._iter_chunks())
+
+    def read(self):
+        """
+        Load the whole output in memory, decoded as a string.
+        """
+        return self.read_bytes().decode('utf-8', 'replace')
+
+    def tail(self, size=_TAIL_SIZE):
+        """
+        Return the last ``size`` bytes of the output, decoded as a string.
+        """
+        offset = max(self.size - size, 0)
+        return b''.join(self._iter_chunks(offset)).decode('utf-8', 'replace')
+
+    def __iter__(self):
+        """
+        Iterate over the decoded lines of the output, without their trailing
+        newline.
+        """
+        pending = b''
+        for chunk in self._iter_chunks():
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.decode('utf-8', 'replace')
+        if pending:
+            yield pending.decode('utf-8', 'replace')
+
+    def __str__(self):
+        return self.read()
+
+    def close(self):
+        if self._owned:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
+class _CountingFile:
+    """
+    Wrap a file object and count the bytes read from or written to it.
+    """
+    def __init__(self, f):
+        self._f = f
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.count += len(data)
+        return data
+
+    def write(self, data):
+        self._f.write(data)
+        self.count += len(data)
+        return len(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+class _StreamPump(threading.Thread):
+    """
+    Copy ``src`` into ``dst`` in a thread, closing ``dst`` once done if
+    ``close`` is ``True``.
+    """
+    def __init__(self, src, dst, close):
+        super().__init__(daemon=True)
+        self.src = src
+        self.dst = dst
+        self.close = close
+        self.excep = None
+
+    def run(self):
+        try:
+            shutil.copyfileobj(self.src, self.dst, 1024 * 1024)
+        except BaseException as e:
+            self.excep = e
+        finally:
+            if self.close:
+                try:
+                    self.dst.close()
+                except OSError:
+                    pass
+
+
+def _pump_to_memory(src):
+    """
+    Start reading ``src`` into memory in a thread, so that the command writing
+    to it cannot block on a full pipe while the caller is busy with its other
+    streams. The content is available in the ``dst`` :class:`io.BytesIO` of
+    the returned :class:`_StreamPump` once it has been joined.
+    """
+    pump = _StreamPump(src, io.BytesIO(), close=False)
+    pump.start()
+    return pump
+
+
+@contextmanager
+def _zstd_process(args, f, reading):
+    proc = subprocess.Popen(['zstd', '-q', *args], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    if reading:
+        pump = _StreamPump(f, proc.stdin, close=True)
+        stream = proc.stdout
+    else:
+        pump = _StreamPump(proc.stdout, f, close=False)
+        stream = proc.stdin
+    pump.start()
+    try:
+        yield stream
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        stream.close()
+        pump.join()
+        ret = proc.wait()
+
+    if pump.excep is not None:
+        raise pump.excep
+    elif ret:
+        raise HostError(f'zstd {" ".join(args)} failed with exit code {ret}')
+
+
+@contextmanager
+def _host_decompress(compression, f):
+    """
+    Yield a file object reading the decompressed content of ``f``.
+    """
+    if compression is None:
+        yield f
+    elif compression == 'gzip':
+        with gzip.GzipFile(fileobj=f, mode='rb') as gz:
+            yield gz
+    elif compression == 'zstd':
+        with _zstd_process(['-dc'], f, reading=True) as stream:
+            yield stream
+    else:
+        raise ValueError(f'Unknown compression: {compression}')
+
+
+@contextmanager
+def _host_compress(compression, f):
+    """
+    Yield a file object compressing what is written to it into ``f``.
+    """
+    if compression is None:
+        yield f
+    elif compression == 'gzip':
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6) as gz:
+            yield gz
+    elif compression == 'zstd':
+        with _zstd_process(['-c'], f, reading=False) as stream:
+            yield stream
+    else:
+        raise ValueError(f'Unknown compression: {compression}')
+
+
+class _BatchedCommand:
+    def __init__(self, command, as_root, check_exit_code, will_succeed, process, handle_excep):
+        self.command = command
+        self.as_root = as_root
+        self.check_exit_code = check_exit_code
+        self.will_succeed = will_succeed
+        self.process = process
+        self.handle_excep = handle_excep
+        self.future = Future()
 
-        await self.install.asyn(os.path.join(scripts, 'devlib-signal-target'))
+    def set_exception(self, excep):
+        """
+        Resolve the future with ``excep``, as transformed by the
+        ``handle_excep`` callback of the command.
+        """
+        self.future.set_exception(self.handle_excep(excep))
 
-    @asyn.asyncf
-    @call_conn
-    async def _execute_util(self, command, timeout=None, check_exit_code=True, as_root=False):
-        command = '{} sh {} {}'.format(quote(self.busybox), quote(self.shutils), command)
-        return await self.execute.asyn(
+
+class CommandBatch:
+    """
+    Record commands to be executed on a :class:`Target` in a single round
+    trip.
+
+    Instances are created by :meth:`Target.batch`. Each recording method
+    returns a :class:`concurrent.futures.Future` that will hold the result of
+    the equivalent :class:`Target` method once the batch is flushed. The
+    output of each command is framed in the generated script so that errors
+    are reported for the exact command that failed.
+
+    .. note:: Consecutive commands that need the same ``as_root`` value are
+        executed in the same script, so interleaving root and non-root
+        commands will require multiple round trips.
+    """
+
+    # Keep the generated scripts well below the usual ARG_MAX
+    _MAX_SCRIPT_SIZE = 64 * 1024
+
+    def __init__(self, target, timeout=None):
+        self.target = target
+        self.timeout = timeout
+        self._pending = []
+        self._resolved = []
+
+    def _record(self, command, as_root, process, check_exit_code=True,
+                will_succeed=False, handle_excep=None):
+        cmd = _BatchedCommand(
+            command=command,
+            as_root=bool(as_root),
+            check_exit_code=check_exit_code,
+            will_succeed=will_succeed,
+            process=process,
+            handle_excep=handle_excep or (lambda e: e),
+        )
+        self._pending.append(cmd)
+        return cmd.future
+
+    def execute(self, command, check_exit_code=True, as_root=False, will_succeed=False):
+        """
+        Record a command, similar to :meth:`Target.execute`.
+        """
+        return self._record(
             command,
-            timeout=timeout,
+            as_root=as_root,
             check_exit_code=check_exit_code,
-            as_root=as_root
+            will_succeed=will_succeed,
+            process=lambda output: output,
         )
 
-    async def _extract_archive(self, path, cmd, dest=None):
-        cmd = '{} ' + cmd  # busybox
-        if dest:
-            extracted = dest
-        else:
-            extracted = self.path.dirname(path)
-        cmdtext = cmd.format(quote(self.busybox), quote(path), quote(extracted))
-        await self.execute.asyn(cmdtext)
-        return extracted
+    def read_value(self, path, kind=None):
+        """
+        Record a read, similar to :meth:`Target.read_value`.
+        """
+        target = self.target
+        target.async_manager.track_access(
+            asyn.PathAccess(namespace='target', path=path, mode='r')
+        )
 
-    async def _extract_file(self, path, cmd, dest=None):
-        cmd = '{} ' + cmd  # busybox
-        cmdtext = cmd.format(quote(self.busybox), quote(path))
-        await self.execute.asyn(cmdtext)
-        extracted = self.path.splitext(path)[0]
-        if dest:
-            await self.execute.asyn('mv -f {} {}'.format(quote(extracted), quote(dest)))
-            if dest.endswith('/'):
-                extracted = self.path.join(dest, self.path.basename(extracted))
-            else:
-                extracted = dest
-        return extracted
+        def convert(output):
+            return kind(output) if kind else output
 
-    def _install_module(self, mod, params, log=True):
-        mod = get_module(mod)
-        name = mod.name
-        if params is None or self._modules.get(name, {}) is None:
-            raise TargetStableError(f'Could not load module "{name}" as it has been explicilty disabled')
-        else:
-            try:
-                return mod.install(self, **params)
-            except Exception as e:
-                if log:
-                    self.logger.error(f'Module "{name}" failed to install on target: {e}')
-                raise
+        cache = target.read_cache
+        key = ('value', path)
+        try:
+            output = cache.get(key)
+        except KeyError:
+            generation = cache.generation
 
-    @property
-    def modules(self):
-        return sorted(self._modules.keys())
+            def process(output):
+                output = output.strip()
+                cache.set(key, output, generation)
+                return convert(output)
 
-    def _update_modules(self, stage):
-        to_install = [
-            (mod, params)
-            for mod, params in (
-                (get_module(name), params)
-                for name, params in self._modules.items()
+            return self._record(
+                'cat {}'.format(quote(path)),
+                as_root=target.needs_su,
+                process=process,
             )
-            if mod.stage == stage
-        ]
-        for mod, params in to_install:
+        else:
+            future = Future()
             try:
-                self._install_module(mod, params)
+                future.set_result(convert(output))
             except Exception as e:
-                mod_name = mod.name
-                self.logger.warning(f'Module {mod.name} is not supported by the target: {e}')
+                future.set_exception(e)
+            self._resolved.append(future)
+            return future
 
-    def _get_module(self, modname, log=True):
-        try:
-            return self._installed_modules[modname]
-        except KeyError:
-            params = {}
-            try:
-                mod = get_module(modname)
-            # We might try to access e.g. "boot" attribute, which is ambiguous
-            # since there are multiple modules with the "boot" kind. In that
-            # case, we look into the list of modules enabled by the user and
-            # get the first "boot" module we find.
-            except ValueError:
-                for _mod, _params in self._modules.items():
-                    try:
-                        _mod = get_module(_mod)
-                    except ValueError:
-                        pass
-                    else:
-                        if _mod.attr_name == modname:
-                            mod = _mod
-                            params = _params
-                            break
-                else:
-                    raise AttributeError(
-                        f"'{self.__class__.__name__}' object has no attribute '{modname}'"
-                    )
+    def write_value(self, path, value, verify=True, as_root=True):
+        """
+        Record a write, similar to :meth:`Target.write_value`.
+        """
+        target = self.target
+        target.async_manager.track_access(
+            asyn.PathAccess(namespace='target', path=path, mode='w')
+        )
+        value = str(value)
+
+        # Invalidate the cache again once the write is done, as for
+        # Target.write_value()
+        def process(output):
+            target.read_cache.invalidate(path)
+
+        def handle_excep(e):
+            target.read_cache.invalidate(path)
+            if isinstance(e, subprocess.CalledProcessError):
+                return Target._write_value_excep(e, path, value, verify)
             else:
-                params = self._modules.get(mod.name, {})
+                return e
 
-            self._install_module(mod, params, log=log)
-            return self.__getattr__(modname)
+        return self._record(
+            target._write_value_cmd(path, value, verify),
+            as_root=as_root,
+            process=process,
+            handle_excep=handle_excep,
+        )
 
-    def __getattr__(self, attr):
-        # When unpickled, objects will have an empty dict so fail early
-        if attr.startswith('__') and attr.endswith('__'):
-            raise AttributeError(attr)
+    def file_exists(self, filepath):
+        """
+        Record a file existence check, similar to :meth:`Target.file_exists`.
+        """
+        target = self.target
+        return self._record(
+            target._file_exists_cmd(filepath),
+            as_root=target.is_rooted,
+            process=lambda output: boolean(output.strip()),
+        )
+
+    def cancel(self):
+        """
+        Cancel all the commands not flushed yet.
+        """
+        pending = self._pending
+        self._pending = []
+        for cmd in pending:
+            cmd.future.cancel()
+
+    def _split(self, cmds):
+        size = 0
+        as_root = None
+        chunk = []
+        for cmd in cmds:
+            cmd_size = len(cmd.command)
+            if chunk and (cmd.as_root != as_root or size + cmd_size > self._MAX_SCRIPT_SIZE):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(cmd)
+            as_root = cmd.as_root
+            size += cmd_size
+
+        if chunk:
+            yield chunk
+
+    @asyn.asyncf
+    async def flush(self):
+        """
+        Execute all the recorded commands and resolve their futures.
 
+        :returns: The list of futures of the flushed commands.
+        """
+        pending = self._pending
+        resolved = self._resolved
+        self._pending = []
+        self._resolved = []
         try:
-            return self._get_module(attr)
-        except Exception as e:
-            # Raising AttributeError is important otherwise hasattr() will not
-            # work as expected
-            raise AttributeError(str(e))
+            for cmds in self._split(pending):
+                await self._run(cmds)
+        except BaseException as e:
+            # The chunks after the failed one will never run, so resolve
+            # their futures rather than leaving the callers waiting on them.
+            for cmd in pending:
+                if not cmd.future.done():
+                    cmd.set_exception(e)
+            raise
+        return resolved + [cmd.future for cmd in pending]
 
-    def _resolve_paths(self):
-        raise NotImplementedError()
+    async def _run(self, cmds):
+        marker = uuid.uuid4().hex
 
-    @asyn.asyncf
-    async def is_network_connected(self):
-        self.logger.debug('Checking for internet connectivity...')
+        def frame(i, cmd):
+            return (
+                f"printf '%s\\n' {marker}-begin:{i}; "
+                f"( eval {quote(cmd.command)} ) </dev/null 2>&1; "
+                f"printf '%s:%d\\n' {marker}-end:{i} $?"
+            )
 
-        timeout_s = 5
-        # It would be nice to use busybox for this, but that means we'd need
-        # root (ping is usually setuid so it can open raw sockets to send ICMP)
-        command = 'ping -q -c 1 -w {} {} 2>&1'.format(timeout_s,
-                                                      quote(GOOGLE_DNS_SERVER_ADDRESS))
+        script = '\n'.join(
+            frame(i, cmd)
+            for i, cmd in enumerate(cmds)
+        )
 
-        # We'll use our own retrying mechanism (rather than just using ping's -c
-        # to send multiple packets) so that we don't slow things down in the
-        # 'good' case where the first packet gets echoed really quickly.
-        attempts = 5
-        for _ in range(attempts):
+        try:
+            output = await self.target.execute.asyn(
+                script,
+                as_root=cmds[0].as_root,
+                check_exit_code=False,
+                timeout=self.timeout,
+            )
+        except BaseException as e:
+            for cmd in cmds:
+                cmd.set_exception(e)
+            raise
+
+        regex = re.compile(
+            r'{marker}-begin:(\d+)\n(.*?){marker}-end:\1:(\d+)\n'.format(marker=marker),
+            re.DOTALL,
+        )
+        results = {
+            int(m.group(1)): (m.group(2), int(m.group(3)))
+            for m in regex.finditer(output)
+        }
+
+        for i, cmd in enumerate(cmds):
+            future = cmd.future
             try:
-                await self.execute.asyn(command)
-                return True
-            except TargetStableError as e:
-                err = str(e).lower()
-                if '100% packet loss' in err:
-                    # We sent a packet but got no response.
-                    # Try again - we don't want this to fail just because of a
-                    # transient drop in connection quality.
-                    self.logger.debug('No ping response from {} after {}s'
-                                      .format(GOOGLE_DNS_SERVER_ADDRESS, timeout_s))
-                    continue
-                elif 'network is unreachable' in err:
-                    # No internet connection at all, we can fail straight away
-                    self.logger.debug('Network unreachable')
-                    return False
-                else:
-                    # Something else went wrong, we don't know what, raise an
-                    # error.
-                    raise
+                cmd_output, exit_code = results[i]
+            except KeyError:
+                cmd.set_exception(TargetTransientError(
+                    'Batched command did not complete: {}'.format(cmd.command)
+                ))
+                continue
 
-        self.logger.debug('Failed to ping {} after {} attempts'.format(
-            GOOGLE_DNS_SERVER_ADDRESS, attempts))
-        return False
+            if exit_code and cmd.check_exit_code:
+                cls = TargetTransientCalledProcessError if cmd.will_succeed else TargetStableCalledProcessError
+                cmd.set_exception(cls(exit_code, cmd.command, cmd_output, None))
+            else:
+                try:
+                    result = cmd.process(cmd_output)
+                except Exception as e:
+                    cmd.set_exception(e)
+                else:
+                    future.set_result(result)
 
 
 class LinuxTarget(Target):
@@ -1779,6 +3921,7 @@ class LinuxTarget(Target):
 
     @property
     @memoized
+    @_probe_cached
     def abi(self):
         value = self.execute('uname -m').strip()
         for abi, architectures in ABI_MAP.items():
@@ -1791,6 +3934,7 @@ class LinuxTarget(Target):
 
     @property
     @memoized
+    @_probe_cached
     def os_version(self):
         os_version = {}
         command = 'ls /etc/*-release /etc*-version /etc/*_release /etc/*_version 2>/dev/null'
@@ -1803,6 +3947,7 @@ class LinuxTarget(Target):
 
     @property
     @memoized
+    @_probe_cached
     def system_id(self):
         return self._execute_util('get_linux_system_id').strip()
 
@@ -1819,6 +3964,7 @@ class LinuxTarget(Target):
                  is_container=False,
                  max_async=50,
                  tmp_directory=None,
+                 probe_cache=None,
                  ):
         super(LinuxTarget, self).__init__(connection_settings=connection_settings,
                                           platform=platform,
@@ -1832,6 +3978,7 @@ class LinuxTarget(Target):
                                           is_container=is_container,
                                           max_async=max_async,
                                           tmp_directory=tmp_directory,
+                                          probe_cache=probe_cache,
                                           )
 
     def wait_boot_complete(self, timeout=10):
@@ -1881,8 +4028,14 @@ class LinuxTarget(Target):
 
     @asyn.asyncf
     async def install(self, filepath, timeout=None, with_name=None):  # pylint: disable=W0221
-        destpath = self.path.join(self.executables_directory,
-                                  with_name and with_name or self.path.basename(filepath))
+        destpath, = await self._install_content_addressed(
+            [(filepath, with_name)],
+            timeout=timeout,
+        )
+        return destpath
+
+    async def _install_executable(self, filepath, name, timeout=None):
+        destpath = self.path.join(self.executables_directory, name)
         await self.push.asyn(filepath, destpath, timeout=timeout)
         await self.execute.asyn('chmod a+x {}'.format(quote(destpath)), timeout=timeout)
         self._installed_binaries[self.path.basename(destpath)] = destpath
@@ -1925,6 +4078,7 @@ class AndroidTarget(Target):
 
     @property
     @memoized
+    @_probe_cached
     def abi(self):
         return self.getprop()['ro.product.cpu.abi'].split('-')[0]
 
@@ -1954,6 +4108,7 @@ class AndroidTarget(Target):
 
     @property
     @memoized
+    @_probe_cached
     def os_version(self):
         os_version = {}
         for k, v in self.getprop().iteritems():
@@ -1992,6 +4147,7 @@ class AndroidTarget(Target):
 
     @property
     @memoized
+    @_probe_cached
     def system_id(self):
         return self._execute_util('get_android_system_id').strip()
 
@@ -2030,6 +4186,7 @@ class AndroidTarget(Target):
                  is_container=False,
                  max_async=50,
                  tmp_directory=None,
+                 probe_cache=None,
                  ):
         super(AndroidTarget, self).__init__(connection_settings=connection_settings,
                                             platform=platform,
@@ -2043,6 +4200,7 @@ class AndroidTarget(Target):
                                             is_container=is_container,
                                             max_async=max_async,
                                             tmp_directory=tmp_directory,
+                                            probe_cache=probe_cache,
                                             )
         self.package_data_directory = package_data_directory
         self._init_logcat_lock()
@@ -2121,6 +4279,34 @@ class AndroidTarget(Target):
         else:
             return await self.install_executable.asyn(filepath, with_name, timeout)
 
+    @asyn.asyncf
+    async def install_many(self, filepaths, timeout=None):
+        """
+        Same as :meth:`Target.install_many`, except that APKs are installed
+        with :meth:`install_apk`.
+        """
+        def is_apk(filepath):
+            return os.path.splitext(filepath)[1].lower() == '.apk'
+
+        executables = [
+            filepath
+            for filepath in filepaths
+            if not is_apk(filepath)
+        ]
+        if executables:
+            paths = dict(zip(
+                executables,
+                await super().install_many.asyn(executables, timeout=timeout),
+            ))
+        else:
+            paths = {}
+
+        for filepath in filepaths:
+            if is_apk(filepath):
+                paths[filepath] = await self.install_apk.asyn(filepath, timeout)
+
+        return [paths[filepath] for filepath in filepaths]
+
     @asyn.asyncf
     async def uninstall(self, name):
         if await self.package_is_installed.asyn(name):
@@ -2378,8 +4564,19 @@ class AndroidTarget(Target):
 
     @asyn.asyncf
     async def install_executable(self, filepath, with_name=None, timeout=None):
+        on_device_executable, = await self._install_content_addressed(
+            [(filepath, with_name)],
+            timeout=timeout,
+        )
+        return on_device_executable
+
+    @property
+    def _install_as_root(self):
+        return self.needs_su
+
+    async def _install_executable(self, filepath, name, timeout=None):
         self._ensure_executables_directory_is_writable()
-        executable_name = with_name or os.path.basename(filepath)
+        executable_name = name
         on_device_file = self.path.join(self.working_directory, executable_name)
         on_device_executable = self.path.join(self.executables_directory, executable_name)
         await self.push.asyn(filepath, on_device_file, timeout=timeout)
@@ -3118,6 +5315,7 @@ class LocalLinuxTarget(LinuxTarget):
                  is_container=False,
                  max_async=50,
                  tmp_directory=None,
+                 probe_cache=None,
                  ):
         super(LocalLinuxTarget, self).__init__(connection_settings=connection_settings,
                                                platform=platform,
@@ -3131,6 +5329,7 @@ class LocalLinuxTarget(LinuxTarget):
                                                is_container=is_container,
                                                max_async=max_async,
                                                tmp_directory=tmp_directory,
+                                               probe_cache=probe_cache,
                                                )
 
     def _resolve_paths(self):
@@ -3155,6 +5354,208 @@ def _get_part_name(section):
     return name
 
 
+def _parse_tree_dump(f):
+    """
+    Parse the output of the ``read_tree_dump`` shutils command from the
+    binary file object ``f``.
+
+    The stream is parsed incrementally and the content of files is yielded as
+    soon as it is available. Files that could not be read on the target are
+    not part of the dump.
+
+    :returns: An iterator of ``(path, content)`` tuples, where ``path`` is
+        relative to the dumped folder (``.`` if a file was dumped) and
+        ``content`` is the ``bytes`` content of the file, or ``None`` if the
+        file was removed (``read_tree_dump_diff`` only).
+    """
+    def read_exact(size):
+        chunks = []
+        while size:
+            chunk = f.read(size)
+            if not chunk:
+                raise ValueError('Truncated tree dump')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def readline():
+        line = f.readline()
+        if not line.endswith(b'\n'):
+            raise ValueError('Truncated tree dump')
+        return line[:-1]
+
+    header = f.readline()
+    # The command failed before writing anything, which is reported by its
+    # exit status.
+    if not header:
+        return
+
+    if header.split() != [b'devlib-tree-dump', b'1']:
+        raise ValueError(f'Unsupported tree dump format: {header!r}')
+
+    index = []
+    for line in iter(readline, b''):
+        size, _, name = line.partition(b' ')
+        if size == b'-':
+            size = None
+        else:
+            try:
+                size = int(size)
+            except ValueError:
+                raise ValueError(f'Invalid tree dump entry: {line!r}')
+        name = name.decode('utf-8', errors='surrogateescape')
+        index.append((posixpath.normpath(name), size))
+
+    for name, size in index:
+        yield (name, None if size is None else read_exact(size))
+
+
+def _decode_tree_value(content, strip_null_chars=True):
+    try:
+        content = content.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        return ''
+    else:
+        if strip_null_chars:
+            content = content.replace('\x00', '').strip()
+        return content
+
+
+class _LazyDecodedMapping(Mapping):
+    """
+    Read-only mapping decoding its ``bytes`` values with ``decode`` the first
+    time they are accessed.
+    """
+    def __init__(self, raw, decode):
+        self.raw = raw
+        self.decode = decode
+        self._decoded = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._decoded[key]
+        except KeyError:
+            value = self.raw[key]
+            if isinstance(value, bytes):
+                value = self.decode(value)
+            self._decoded[key] = value
+            return value
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __repr__(self):
+        return f'{self.__class__.__qualname__}({dict(self)!r})'
+
+    def wrap_tree(self, tree):
+        """
+        Convert a tree made of ``dict`` with ``bytes`` leaves into a tree of
+        :class:`_LazyDecodedMapping` using the same ``decode`` function. The
+        leaves are only decoded when accessed.
+        """
+        if isinstance(tree, Mapping):
+            return self.__class__(
+                {
+                    key: self.wrap_tree(value) if isinstance(value, Mapping) else value
+                    for key, value in tree.items()
+                },
+                self.decode,
+            )
+        # A single file, with no mapping to defer its decoding to
+        elif isinstance(tree, bytes):
+            return self.decode(tree)
+        else:
+            return tree
+
+
+class TreeSnapshot:
+    """
+    Content of the files under a folder of a target, as returned by
+    :meth:`Target.snapshot_tree`.
+
+    The checksums of the files are kept in ``state_dir`` on the target, so
+    that :meth:`refresh` only transfers the files that changed since the
+    previous refresh. :meth:`close` removes that folder.
+
+    :param target: Target the folder belongs to.
+    :param path: Path of the folder.
+    :param depth: Maximum depth of the files under ``path``.
+    :param state_dir: Folder on the target used to keep the state.
+    :param decode: Function used to decode the ``bytes`` content of files, or
+        ``None`` to keep the raw content.
+    """
+    def __init__(self, target, path, depth, state_dir, decode=None):
+        self.target = target
+        self.path = path
+        self.depth = depth
+        self.state_dir = state_dir
+        self.decode = decode
+        self.values = {}
+        """
+        Dict mapping the path of each file to its content.
+        """
+        # Whether the checksums recorded on the target by the last refresh
+        # match the content of self.values
+        self._commit = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    @asyn.asyncf
+    async def refresh(self):
+        """
+        Update :attr:`values` with the files that changed on the target.
+
+        :returns: A dict mapping the path of each file that changed since the
+            previous refresh to its new content, or ``None`` if it was removed.
+        """
+        command = 'read_tree_dump_diff {} {} {} {}'.format(
+            quote(self.path),
+            self.depth,
+            quote(self.state_dir),
+            int(self._commit),
+        )
+        # The checksums recorded by that command are only committed by the
+        # next refresh, so that changes are not lost if they could not be
+        # applied to self.values.
+        self._commit = False
+        changes = await self.target._read_tree_dump.asyn(command, self.path)
+        if self.decode:
+            changes = {
+                path: None if content is None else self.decode(content)
+                for path, content in changes.items()
+            }
+
+        for path, content in changes.items():
+            if content is None:
+                self.values.pop(path, None)
+            else:
+                self.values[path] = content
+        self._commit = True
+        return changes
+
+    def tree(self, dictcls=dict):
+        """
+        Current :attr:`values` as a nested structure of ``dictcls``, in the same
+        format as :meth:`Target.read_tree_values`.
+        """
+        return _build_path_tree(self.values, self.path, self.target.path.sep, dictcls)
+
+    @asyn.asyncf
+    async def close(self):
+        """
+        Remove the state kept on the target. The snapshot cannot be refreshed
+        anymore after that.
+        """
+        await self.target.remove.asyn(self.state_dir)
+
+
 def _build_path_tree(path_map, basepath, sep=os.path.sep, dictcls=dict):
     """
     Convert a flat mapping of paths to values into a nested structure of
@@ -3207,6 +5608,7 @@ class ChromeOsTarget(LinuxTarget):
                  is_container=False,
                  max_async=50,
                  tmp_directory=None,
+                 probe_cache=None,
                  ):
 
         self.supports_android = None
@@ -3237,6 +5639,7 @@ class ChromeOsTarget(LinuxTarget):
             is_container=is_container,
             max_async=max_async,
             tmp_directory=tmp_directory,
+            probe_cache=probe_cache,
             )
 
         # We can't determine if the target supports android until connected to the linux host so
@@ -25,11 +25,14 @@ import logging
 import os
 import pexpect
 import re
+import selectors
+import socket
+import stat
+import struct
 import subprocess
 import sys
 import tempfile
 import time
-import uuid
 import zipfile
 import threading
 
@@ -40,7 +43,8 @@ from shlex import quote
 
 from devlib.exception import TargetTransientError, TargetStableError, HostError, TargetTransientCalledProcessError, TargetStableCalledProcessError, AdbRootError
 from devlib.utils.misc import check_output, which, ABI_MAP, redirect_streams, get_subprocess
-from devlib.connection import ConnectionBase, AdbBackgroundCommand, PopenTransferHandle
+from devlib.connection import (ConnectionBase, AdbBackgroundCommand, PopenTransferHandle, PersistentShellBase,
+                               _RemoteFile, _get_remote_file_cmd)
 
 
 logger = logging.getLogger('android')
@@ -246,6 +250,125 @@ class ApkInfo(object):
         return output
 
 
+class _AdbPersistentShell(PersistentShellBase):
+    """
+    :class:`devlib.connection.PersistentShellBase` running in a long-lived
+    ``adb shell`` process.
+    """
+    def __init__(self, conn, shell_cmd):
+        super().__init__()
+        parts, env = _get_adb_parts(('shell', shell_cmd), conn.device, conn.adb_server, conn.adb_port, quote_adb=False)
+        env = {**os.environ, **env}
+        logger.debug(' '.join(quote(part) for part in parts))
+        popen = get_subprocess(parts, shell=False, env=env)
+
+        selector = selectors.DefaultSelector()
+        selector.register(popen.stdout, selectors.EVENT_READ, 'stdout')
+        selector.register(popen.stderr, selectors.EVENT_READ, 'stderr')
+
+        self.popen = popen
+        self._selector = selector
+
+    def _send(self, data):
+        stdin = self.popen.stdin
+        stdin.write(data)
+        stdin.flush()
+
+    def _recv(self, timeout):
+        return [
+            (key.data, os.read(key.fileobj.fileno(), 64 * 1024))
+            for key, _ in self._selector.select(timeout)
+        ]
+
+    def _close(self):
+        popen = self.popen
+        self._selector.close()
+        try:
+            popen.stdin.close()
+        except OSError:
+            pass
+        popen.kill()
+        popen.wait()
+        popen.stdout.close()
+        popen.stderr.close()
+
+
+class _AdbSyncClient:
+    """
+    Minimal client of the ADB sync protocol, used to query the filesystem of
+    the device without running any command on it.
+
+    It talks directly to the ADB server, as documented in ``SERVICES.TXT`` and
+    ``SYNC.TXT`` in the ADB sources.
+    """
+    def __init__(self, device, adb_server=None, adb_port=None, timeout=None):
+        adb_port = adb_port or int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037))
+        self._sock = socket.create_connection((adb_server or 'localhost', adb_port), timeout=timeout)
+        try:
+            self._request(f'host:transport:{device}' if device else 'host:transport-any')
+            self._request('sync:')
+        except BaseException:
+            self._sock.close()
+            raise
+
+    def _recv(self, size):
+        chunks = []
+        while size:
+            chunk = self._sock.recv(size)
+            if not chunk:
+                raise ConnectionError('ADB server closed the connection')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _request(self, service):
+        service = service.encode('utf-8')
+        self._sock.sendall(b'%04x' % len(service) + service)
+        status = self._recv(4)
+        if status != b'OKAY':
+            msg = self._recv(int(self._recv(4), 16)).decode('utf-8', errors='replace')
+            raise HostError(f'ADB server failed to handle {service.decode()}: {msg}')
+
+    def _sync_request(self, id_, path):
+        path = path.encode('utf-8')
+        self._sock.sendall(id_ + struct.pack('<I', len(path)) + path)
+
+    def lstat(self, path):
+        """
+        Return ``(mode, size, mtime)`` of ``path``, without following symlinks.
+        All values are 0 if the path does not exist.
+        """
+        self._sync_request(b'STAT', path)
+        id_, mode, size, mtime = struct.unpack('<4sIII', self._recv(16))
+        if id_ != b'STAT':
+            raise HostError(f'Unexpected ADB sync response: {id_}')
+        return (mode, size, mtime)
+
+    def listdir(self, path):
+        """
+        Return the names of the entries of the ``path`` directory, including
+        ``.`` and ``..``.
+        """
+        self._sync_request(b'LIST', path)
+        names = []
+        while True:
+            id_, _, _, _, namelen = struct.unpack('<4sIIII', self._recv(20))
+            if id_ == b'DONE':
+                return names
+            elif id_ == b'DENT':
+                names.append(self._recv(namelen).decode('utf-8', errors='surrogateescape'))
+            else:
+                raise HostError(f'Unexpected ADB sync response: {id_}')
+
+    def close(self):
+        try:
+            self._sync_request(b'QUIT', '')
+        except OSError:
+            pass
+        finally:
+            self._sock.close()
+
+
 class AdbConnection(ConnectionBase):
 
     # maintains the count of parallel active connections to a device, so that
@@ -256,6 +379,8 @@ class AdbConnection(ConnectionBase):
     default_timeout = 10
     ls_command = 'ls'
     su_cmd = 'su -c {}'
+    # Command used to start a long-lived root shell reading commands on stdin
+    su_shell_cmd = 'su -c sh'
 
     @property
     def name(self):
@@ -287,6 +412,7 @@ class AdbConnection(ConnectionBase):
         start_transfer_poll_delay=30,
         total_transfer_timeout=3600,
         transfer_poll_period=30,
+        persistent_shell=False,
     ):
         super().__init__(
             poll_transfers=poll_transfers,
@@ -298,6 +424,11 @@ class AdbConnection(ConnectionBase):
         self.logger.debug('server=%s port=%s device=%s as_root=%s',
                           adb_server, adb_port, device, adb_as_root)
 
+        # Long-lived "adb shell" processes, keyed by whether they run as root
+        # or not
+        self.persistent_shell = persistent_shell
+        self._persistent_shells = {}
+
         self.timeout = timeout if timeout is not None else self.default_timeout
         if device is None:
             device = adb_get_device(timeout=timeout, adb_server=adb_server, adb_port=adb_port)
@@ -305,6 +436,8 @@ class AdbConnection(ConnectionBase):
         self.adb_server = adb_server
         self.adb_port = adb_port
         self.adb_as_root = adb_as_root
+        self._sync_client = None
+        self._sync_lock = threading.Lock()
         self._restore_to_adb_root = False
         lock, nr_active = AdbConnection.active_connections
         with lock:
@@ -323,6 +456,107 @@ class AdbConnection(ConnectionBase):
         self._setup_ls()
         self._setup_su()
 
+    native_fs = frozenset({'stat', 'listdir'})
+
+    def _sync(self, f):
+        """
+        Call ``f`` with an :class:`_AdbSyncClient`, or return ``None`` if the
+        ADB server cannot be reached directly.
+        """
+        if self._sync_client is False:
+            return None
+
+        with self._sync_lock:
+            # The sync connection might have been broken since last time,
+            # e.g. by adbd restarting, so retry once with a fresh one.
+            for retry in (True, False):
+                if self._sync_client is None:
+                    try:
+                        self._sync_client = _AdbSyncClient(
+                            self.device,
+                            adb_server=self.adb_server,
+                            adb_port=self.adb_port,
+                            timeout=self.timeout,
+                        )
+                    except (OSError, HostError) as e:
+                        self.logger.debug(f'Could not use ADB sync protocol, falling back on shell commands: {e}')
+                        self._sync_client = False
+                        return None
+                try:
+                    return f(self._sync_client)
+                except OSError:
+                    self._sync_client.close()
+                    self._sync_client = None
+                    if not retry:
+                        raise
+
+    def stat(self, path, as_root=False):
+        if not (as_root and not self.connected_as_root):
+            res = self._sync(lambda client: client.lstat(path))
+            # The sync protocol does not follow symlinks.
+            if res is not None and not stat.S_ISLNK(res[0]):
+                mode, size, mtime = res
+                if not mode:
+                    raise FileNotFoundError(path)
+                return os.stat_result((mode, 0, 0, 0, 0, 0, size, 0, mtime, 0))
+        return super().stat(path, as_root=as_root)
+
+    def listdir(self, path, as_root=False):
+        if not (as_root and not self.connected_as_root):
+            # The listing of a path that is not a directory is empty, so it
+            # cannot be told apart from an empty directory.
+            st = self.stat(path)
+            if not stat.S_ISDIR(st.st_mode):
+                raise NotADirectoryError(path)
+            names = self._sync(lambda client: client.listdir(path))
+            # The listing of a directory always contains "." and "..", unless
+            # adbd could not open it (e.g. for lack of permission). In that
+            # case, the shell reports the error.
+            if names:
+                return [name for name in names if name not in ('.', '..')]
+        return super().listdir(path, as_root=as_root)
+
+    def open_remote(self, path, mode='rb', as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().open_remote(path, mode, as_root=as_root)
+
+        # exec-out and exec-in do not allocate a pty, so binary data go
+        # through untouched. They do not report the exit status of the
+        # command though, so readability is checked with a status byte
+        # preceding the content.
+        cmd = _get_remote_file_cmd(path, mode)
+        if mode == 'rb':
+            _path = quote(path)
+            cmd = f'if [ -f {_path} ] && [ -r {_path} ]; then printf O && exec {cmd}; else printf E; fi'
+            verb = 'exec-out'
+        else:
+            verb = 'exec-in'
+
+        parts, env = _get_adb_parts((verb, cmd), self.device, self.adb_server, self.adb_port, quote_adb=False)
+        logger.debug(' '.join(quote(part) for part in parts))
+        popen = get_subprocess(parts, shell=False, env={**os.environ, **env})
+
+        def on_close(complete):
+            if not complete:
+                popen.kill()
+            err = popen.stderr.read()
+            popen.stderr.close()
+            if complete and popen.wait():
+                err = err.decode('utf-8', errors='replace').strip()
+                raise TargetStableError(f'Could not access {path} on the target: {err}')
+            popen.wait()
+
+        if mode == 'rb':
+            popen.stdin.close()
+            if popen.stdout.read(1) != b'O':
+                popen.stdout.close()
+                on_close(True)
+                raise TargetStableError(f'Could not read {path} on the target')
+            stream = popen.stdout
+        else:
+            stream = popen.stdin
+        return _RemoteFile(stream, mode, on_close=on_close)
+
     def push(self, sources, dest, timeout=None):
         return self._push_pull('push', sources, dest, timeout)
 
@@ -364,8 +598,11 @@ class AdbConnection(ConnectionBase):
         if as_root and self.connected_as_root:
             as_root = False
         try:
-            return adb_shell(self.device, command, timeout, check_exit_code,
-                             as_root, adb_server=self.adb_server, adb_port=self.adb_port, su_cmd=self.su_cmd)
+            if self.persistent_shell:
+                return self._execute_persistent(command, timeout, check_exit_code, as_root)
+            else:
+                return adb_shell(self.device, command, timeout, check_exit_code,
+                                 as_root, adb_server=self.adb_server, adb_port=self.adb_port, su_cmd=self.su_cmd)
         except subprocess.CalledProcessError as e:
             cls = TargetTransientCalledProcessError if will_succeed else TargetStableCalledProcessError
             raise cls(
@@ -380,6 +617,39 @@ class AdbConnection(ConnectionBase):
             else:
                 raise
 
+    def _get_persistent_shell(self, as_root):
+        shell = self._persistent_shells.get(as_root)
+        if shell is None or shell.closed:
+            shell_cmd = self.su_shell_cmd if as_root else 'sh'
+            shell = _AdbPersistentShell(self, shell_cmd)
+            self._persistent_shells[as_root] = shell
+        return shell
+
+    def _execute_persistent(self, command, timeout, check_exit_code, as_root):
+        logger.debug(command)
+        shell = self._get_persistent_shell(as_root)
+        exit_code, output, error = shell.execute(command, timeout=timeout)
+
+        encoding = sys.stdout.encoding or 'utf-8'
+        # Match the output of adb_shell()
+        output = _normalize_newlines(output.decode(encoding, 'replace'))
+        error = _normalize_newlines(error.decode(encoding, 'replace'))
+
+        if check_exit_code:
+            if exit_code:
+                raise subprocess.CalledProcessError(
+                    exit_code,
+                    command,
+                    output,
+                    error,
+                )
+            re_search = AM_START_ERROR.findall(output)
+            if re_search:
+                message = 'Could not start activity; got the following:\n{}'
+                raise TargetStableError(message.format(re_search[0]))
+
+        return '\n'.join(x for x in (output, error) if x)
+
     def background(self, command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, as_root=False):
         if as_root and self.connected_as_root:
             as_root = False
@@ -387,8 +657,8 @@ class AdbConnection(ConnectionBase):
         return bg_cmd
 
     def _background(self, command, stdout, stderr, as_root):
-        def make_init_kwargs(command):
-            adb_popen, pid = adb_background_shell(self, command, stdout, stderr, as_root)
+        def make_init_kwargs(command, data_dir):
+            adb_popen, pid = adb_background_shell(self, command, stdout, stderr, as_root, data_dir=data_dir)
             return dict(
                 adb_popen=adb_popen,
                 pid=pid,
@@ -403,6 +673,12 @@ class AdbConnection(ConnectionBase):
         return bg_cmd
 
     def _close(self):
+        for shell in self._persistent_shells.values():
+            shell.close()
+        self._persistent_shells.clear()
+        if self._sync_client:
+            self._sync_client.close()
+
         lock, nr_active = AdbConnection.active_connections
         with lock:
             nr_active[self.device] -= 1
@@ -488,6 +764,8 @@ class AdbConnection(ConnectionBase):
         # old style and root status will be verified later.
         except (TargetStableError, TargetTransientError, TimeoutError):
             self.su_cmd = 'echo {} | su'
+            # Old style su reads the commands to execute on stdin
+            self.su_shell_cmd = 'su'
         logger.debug("su command is set to {}".format(quote(self.su_cmd)))
 
 
@@ -594,6 +872,14 @@ def _ping(device, adb_server=None, adb_port=None):
 
 
 # pylint: disable=too-many-locals
+def _normalize_newlines(output):
+    """
+    Turn the ``\r\n`` and ``\r`` line endings added by the pty of ``adb
+    shell`` on devices without shell protocol v2 into ``\n``.
+    """
+    return output.replace('\r\n', '\n').replace('\r', '\n')
+
+
 def adb_shell(device, command, timeout=None, check_exit_code=False,
               as_root=False, adb_server=None, adb_port=None, su_cmd='su -c {}'):  # NOQA
 
@@ -616,9 +902,9 @@ def adb_shell(device, command, timeout=None, check_exit_code=False,
 
     if raw_output:
         try:
-            output, exit_code, _ = raw_output.replace('\r\n', '\n').replace('\r', '\n').rsplit('\n', 2)
+            output, exit_code, _ = _normalize_newlines(raw_output).rsplit('\n', 2)
         except ValueError:
-            exit_code, _ = raw_output.replace('\r\n', '\n').replace('\r', '\n').rsplit('\n', 1)
+            exit_code, _ = _normalize_newlines(raw_output).rsplit('\n', 1)
             output = ''
     else:  # raw_output is empty
         exit_code = '969696'  # just because
@@ -656,11 +942,22 @@ def adb_shell(device, command, timeout=None, check_exit_code=False,
 def adb_background_shell(conn, command,
                          stdout=subprocess.PIPE,
                          stderr=subprocess.PIPE,
-                         as_root=False):
-    """Runs the specified command in a subprocess, returning the the Popen object."""
-    device = conn.device
-    adb_server = conn.adb_server
-    adb_port = conn.adb_port
+                         as_root=False,
+                         data_dir=None,
+                         pid_timeout=30):
+    """
+    Runs the specified command in a subprocess, returning the the Popen object
+    and the PID of the command on the target.
+
+    :param data_dir: Directory on the target used to exchange the PID of the
+        command. If ``None``, a temporary directory is created and removed
+        afterwards.
+    :type data_dir: str or None
+
+    :param pid_timeout: Maximum number of seconds to wait for the command to
+        report its PID.
+    :type pid_timeout: int
+    """
     busybox = conn.busybox
     orig_command = command
 
@@ -668,56 +965,44 @@ def adb_background_shell(conn, command,
     if as_root:
         command = f'{busybox} printf "%s" {quote(command)} | su'
 
-    def with_uuid(cmd):
-        # Attach a unique UUID to the command line so it can be looked for
-        # without any ambiguity with ps
-        uuid_ = uuid.uuid4().hex
-        # Unset the var, since not all connection types set it. This will avoid
-        # anyone depending on that value.
-        cmd = f'DEVLIB_CMD_UUID={uuid_}; unset DEVLIB_CMD_UUID; {cmd}'
-        # Ensure we have an sh -c layer so that the UUID will appear on the
-        # command line parameters of at least one command.
-        cmd = f'exec {busybox} sh -c {quote(cmd)}'
-        return (uuid_, cmd)
-
-    # Freeze the command with SIGSTOP to avoid racing with PID detection.
-    command = f"{busybox} kill -STOP $$ && exec {busybox} sh -c {quote(command)}"
-    command_uuid, command = with_uuid(command)
-
-    adb_cmd = get_adb_command(device, 'shell', adb_server, adb_port)
+    if data_dir is None:
+        tmp_dir = conn.execute(f'{busybox} mktemp -d').strip()
+        data_dir = tmp_dir
+    else:
+        tmp_dir = None
+
+    # The command reports its PID through a FIFO rather than its stdout, which
+    # belongs to the caller. Opening a FIFO blocks until the other end is
+    # opened as well, so the command is held until the PID has been read and
+    # the host gets it in a single round trip without polling. Both sides try
+    # to create the FIFO, so that the order in which they run does not matter.
+    fifo = quote(f'{data_dir}/shell_pid')
+    make_fifo = f'{busybox} mkfifo {fifo} 2>/dev/null'
+    command = f'{make_fifo}; {busybox} printf "%s\\n" $$ > {fifo} && exec {busybox} sh -c {quote(command)}'
+    # Ensure we have an sh -c layer that $$ refers to, which then becomes the
+    # command itself.
+    command = f'exec {busybox} sh -c {quote(command)}'
+
+    adb_cmd = get_adb_command(conn.device, 'shell', conn.adb_server, conn.adb_port)
     full_command = f'{adb_cmd} {quote(command)}'
     logger.debug(full_command)
     p = subprocess.Popen(full_command, stdout=stdout, stderr=stderr, stdin=subprocess.PIPE, shell=True)
 
-    # Out of band PID lookup, to avoid conflicting needs with stdout redirection
-    grep_cmd = f'{busybox} grep {quote(command_uuid)}'
-    # Find the PID and release the blocked background command with SIGCONT.
-    # We get multiple PIDs:
-    # * One from the grep command itself, but we remove it with another grep command.
-    # * One for each sh -c layer in the command itself.
-    #
-    # For each of the parent layer, we issue SIGCONT as it is harmless and
-    # avoids having to rely on PID ordering (which could be misleading if PIDs
-    # got recycled).
-    find_pid = f'''pids=$({busybox} ps -A -o pid,args | {grep_cmd} | {busybox} grep -v {quote(grep_cmd)} | {busybox} awk '{{print $1}}') && {busybox} printf "%s" "$pids" && {busybox} kill -CONT $pids'''
-
-    excep = None
-    for _ in range(5):
-        try:
-            pids = conn.execute(find_pid, as_root=as_root)
-            # We choose the highest PID as the "control" PID. It actually does not
-            # really matter which one we pick, as they are all equivalent sh -c layers.
-            pid = max(map(int, pids.split()))
-        except TargetStableError:
-            raise
-        except Exception as e:
-            excep = e
-            time.sleep(10e-3)
-            continue
-        else:
-            break
-    else:
-        raise TargetTransientError(f'Could not detect PID of background command: {orig_command}') from excep
+    read_pid = f'{make_fifo}; {busybox} cat {fifo}; {busybox} rm -f {fifo}'
+    if tmp_dir is not None:
+        read_pid = f'{read_pid}; {busybox} rm -rf {quote(tmp_dir)}'
+
+    try:
+        # The FIFO is written before su is involved, so it is read as the
+        # same user that created it.
+        pid = conn.execute(read_pid, timeout=pid_timeout)
+        pid = int(pid.strip())
+    except TargetStableError:
+        p.kill()
+        raise
+    except Exception as e:
+        p.kill()
+        raise TargetTransientError(f'Could not detect PID of background command: {orig_command}') from e
 
     return (p, pid)
 
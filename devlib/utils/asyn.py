@@ -27,6 +27,7 @@ import contextlib
 import pathlib
 import queue
 import os.path
+import random
 import inspect
 import sys
 import threading
@@ -61,10 +62,123 @@ def _close_loop(loop):
             loop.close()
 
 
+class _TaskScope:
+    """
+    Tasks created by a single call to one of the :class:`AsyncManager`
+    methods, tracked in :attr:`AsyncManager.task_tree`.
+
+    The accesses of each task (and of its children) are collected when the
+    task finishes, and the task is then forgotten. When the scope is closed,
+    the collected accesses are checked for conflicts and then attributed to
+    the current task, so that the enclosing scope can check them in turn.
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.current_task = asyncio.current_task()
+        task_tree = manager.task_tree
+        self.is_root = self.current_task not in task_tree
+        self.node = task_tree.setdefault(self.current_task, set())
+        self.pending = set()
+        self.accesses = []
+
+    def spawn(self, awaitable):
+        task = create_task(awaitable)
+        self.manager.task_tree[task] = set()
+        self.node.add(task)
+        self.pending.add(task)
+        return task
+
+    def collect(self, task):
+        self.pending.discard(task)
+        self.node.discard(task)
+        self.accesses.extend(
+            (task, access)
+            for access in self.manager._pop_subtree(task)
+        )
+
+    async def cancel(self):
+        pending = list(self.pending)
+        for task in pending:
+            task.cancel()
+
+        if pending:
+            await asyncio.wait(pending)
+
+        for task in pending:
+            # Retrieve the exception to avoid asyncio logging it as never
+            # retrieved. The original one is raised by the caller.
+            if not task.cancelled():
+                task.exception()
+            self.collect(task)
+
+    def close(self):
+        manager = self.manager
+        current_task = self.current_task
+        accesses = self.accesses
+        try:
+            if accesses and manager._should_check_conflicts():
+                manager._check_conflicts(accesses)
+        finally:
+            if self.is_root:
+                manager.task_tree.pop(current_task, None)
+                manager.resources.pop(current_task, None)
+            elif accesses:
+                manager.resources.setdefault(current_task, set()).update(
+                    access
+                    for _, access in accesses
+                )
+
+
 class AsyncManager:
-    def __init__(self):
+    """
+    :param access_hooks: Callables called with every access registered with
+        :meth:`track_access`, even outside of any async task.
+    :type access_hooks: list(collections.abc.Callable) or None
+
+    :param conflict_check: Controls the detection of overlapping resources
+        manipulated by concurrent tasks in :meth:`concurrently`. ``True``
+        checks every call and ``False`` disables the detection altogether,
+        including the recording of accesses. A float between ``0`` and ``1``
+        checks that fraction of the calls, picked at random. A callable
+        returning one of these values can also be passed, in which case it is
+        called every time the setting is needed.
+    :type conflict_check: bool or float or collections.abc.Callable
+
+    :param max_in_flight: Default maximum number of tasks running at once in
+        :meth:`map_concurrently` and :meth:`imap_concurrently`. ``None`` means
+        no limit. A callable returning one of these values can also be
+        passed.
+    :type max_in_flight: int or None or collections.abc.Callable
+    """
+    def __init__(self, access_hooks=None, conflict_check=True, max_in_flight=None):
         self.task_tree = dict()
         self.resources = dict()
+        self.access_hooks = list(access_hooks or [])
+        self.conflict_check = conflict_check
+        self.max_in_flight = max_in_flight
+
+    def _get_conflict_check(self):
+        check = self.conflict_check
+        if callable(check):
+            check = check()
+        return check
+
+    def _should_check_conflicts(self):
+        check = self._get_conflict_check()
+        if isinstance(check, bool):
+            return check
+        else:
+            return random.random() < check
+
+    def _get_max_in_flight(self, max_in_flight):
+        if max_in_flight is None:
+            max_in_flight = self.max_in_flight
+            if callable(max_in_flight):
+                max_in_flight = max_in_flight()
+
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError(f'max_in_flight must be at least 1: {max_in_flight}')
+        return max_in_flight
 
     def track_access(self, access):
         """
@@ -77,12 +191,16 @@ class AsyncManager:
         This allows :func:`concurrently` to check that concurrent tasks did not
         step on each other's toes.
         """
-        try:
-            task = asyncio.current_task()
-        except RuntimeError:
-            pass
-        else:
-            self.resources.setdefault(task, set()).add(access)
+        for hook in self.access_hooks:
+            hook(access)
+
+        if self._get_conflict_check():
+            try:
+                task = asyncio.current_task()
+            except RuntimeError:
+                pass
+            else:
+                self.resources.setdefault(task, set()).add(access)
 
     async def concurrently(self, awaitables):
         """
@@ -98,85 +216,152 @@ class AsyncManager:
         if len(awaitables) == 1:
             return [await awaitables[0]]
 
-        tasks = list(map(create_task, awaitables))
+        scope = _TaskScope(self)
+        tasks = list(map(scope.spawn, awaitables))
+        try:
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                await scope.cancel()
+                raise
+            else:
+                for task in tasks:
+                    scope.collect(task)
+                return results
+        finally:
+            scope.close()
 
-        current_task = asyncio.current_task()
+    def _pop_subtree(self, task):
+        """
+        Remove ``task`` and all its children from :attr:`task_tree` and return
+        the accesses they made.
+        """
         task_tree = self.task_tree
+        resources = self.resources
 
-        try:
-            node = task_tree[current_task]
-        except KeyError:
-            is_root_task = True
-            node = set()
-        else:
-            is_root_task = False
-        task_tree[current_task] = node
+        accesses = []
+        stack = [task]
+        while stack:
+            task = stack.pop()
+            stack.extend(task_tree.pop(task, ()))
+            accesses.extend(resources.pop(task, ()))
+        return accesses
 
-        task_tree.update({
-            child: set()
-            for child in tasks
-        })
-        node.update(tasks)
+    def _check_conflicts(self, accesses):
+        """
+        Raise an exception if any of the ``(task, access)`` in ``accesses``
+        overlaps with an access made by another task.
+        """
+        path_accesses = []
+        other_accesses = {}
+        for task, access in accesses:
+            if type(access) is PathAccess:
+                path_accesses.append((task, access))
+            else:
+                other_accesses.setdefault(task, []).append(access)
 
-        try:
-            return await asyncio.gather(*tasks)
-        except BaseException:
-            for task in tasks:
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
-            raise
-        finally:
+        def overlap(task1, res1, task2, res2):
+            return RuntimeError(
+                'Overlapping resources manipulated in concurrent async tasks: {} (task {}) and {} (task {})'.format(res1, task1.name, res2, task2.name)
+            )
 
-            def get_children(task):
-                immediate_children = task_tree[task]
-                return frozenset(
-                    itertools.chain(
-                        [task],
-                        immediate_children,
-                        itertools.chain.from_iterable(
-                            map(get_children, immediate_children)
-                        )
-                    )
-                )
+        found = _find_path_overlap(path_accesses)
+        if found is not None:
+            (task1, res1), (task2, res2) = found
+            raise overlap(task1, res1, task2, res2)
+
+        # Other kinds of resources have no better strategy than comparing them
+        # pairwise.
+        for (task1, resources1), (task2, resources2) in itertools.combinations(other_accesses.items(), 2):
+            for res1, res2 in itertools.product(resources1, resources2):
+                if issubclass(res2.__class__, res1.__class__) and res1.overlap_with(res2):
+                    raise overlap(task1, res1, task2, res2)
+
+    async def imap_concurrently(self, f, keys, max_in_flight=None):
+        """
+        Similar to :meth:`map_concurrently`, but asynchronously yields
+        ``(key, result)`` tuples in the order in which the results become
+        available.
+
+        :param max_in_flight: Maximum number of tasks running at once. Keys
+            are consumed lazily from ``keys`` to keep that number of tasks
+            running, so memory usage does not depend on the number of keys.
+            Defaults to the ``max_in_flight`` parameter of
+            :class:`AsyncManager`.
+        :type max_in_flight: int or None
+
+        As with :meth:`concurrently`, the remaining tasks are cancelled as soon
+        as one raises an exception, or if the iteration is stopped before
+        completion.
+        """
+        max_in_flight = self._get_max_in_flight(max_in_flight)
+        keys = iter(keys)
+
+        # As in concurrently(), avoid creating asyncio.Tasks when they would
+        # not run concurrently anyway.
+        if max_in_flight == 1:
+            for key in keys:
+                yield (key, await f(key))
+            return
 
-            # Get the resources created during the execution of each subtask
-            # (directly or indirectly)
-            resources = {
-                task: frozenset(
-                    itertools.chain.from_iterable(
-                        self.resources.get(child, [])
-                        for child in get_children(task)
+        scope = _TaskScope(self)
+        in_flight = {}
+        try:
+            try:
+                while True:
+                    while max_in_flight is None or len(in_flight) < max_in_flight:
+                        try:
+                            key = next(keys)
+                        except StopIteration:
+                            break
+                        else:
+                            in_flight[scope.spawn(f(key))] = key
+
+                    if not in_flight:
+                        break
+
+                    done, _ = await asyncio.wait(
+                        in_flight,
+                        return_when=asyncio.FIRST_COMPLETED,
                     )
-                )
-                for task in tasks
-            }
-            for (task1, resources1), (task2, resources2) in itertools.combinations(resources.items(), 2):
-                for res1, res2 in itertools.product(resources1, resources2):
-                    if issubclass(res2.__class__, res1.__class__) and res1.overlap_with(res2):
-                        raise RuntimeError(
-                            'Overlapping resources manipulated in concurrent async tasks: {} (task {}) and {} (task {})'.format(res1, task1.name, res2, task2.name)
-                        )
-
-            if is_root_task:
-                self.resources.clear()
-                task_tree.clear()
-
-    async def map_concurrently(self, f, keys):
+                    for task in done:
+                        key = in_flight.pop(task)
+                        scope.collect(task)
+                        yield (key, task.result())
+            except BaseException:
+                await scope.cancel()
+                raise
+        finally:
+            scope.close()
+
+    async def map_concurrently(self, f, keys, max_in_flight=None):
         """
         Similar to :meth:`concurrently`,
         but maps the given function ``f`` on the given ``keys``.
 
+        :param max_in_flight: Maximum number of tasks running at once. See
+            :meth:`imap_concurrently`.
+        :type max_in_flight: int or None
+
         :return: A dictionary with ``keys`` as keys, and function result as
             values.
         """
         keys = list(keys)
-        return dict(zip(
-            keys,
-            await self.concurrently(map(f, keys))
-        ))
+        max_in_flight = self._get_max_in_flight(max_in_flight)
+        if max_in_flight is None or len(keys) <= max_in_flight:
+            return dict(zip(
+                keys,
+                await self.concurrently(map(f, keys))
+            ))
+        else:
+            results = {
+                key: value
+                async for key, value in self.imap_concurrently(f, keys, max_in_flight)
+            }
+            return {
+                key: results[key]
+                for key in keys
+            }
 
 
 def compose(*coros):
@@ -477,6 +662,21 @@ class _AwaitableGenlet:
         return gen
 
 
+def _iter_stack(frame):
+    """
+    Iterate over ``frame`` and its callers, following the greenlets used to
+    implement nested :func:`run` calls so that the blocking callers of a
+    coroutine are found.
+    """
+    g = greenlet.getcurrent()
+    while frame is not None:
+        yield frame
+        frame = frame.f_back
+        while frame is None and g is not None:
+            g = g.parent
+            frame = None if g is None else g.gr_frame
+
+
 def _allow_nested_run(coro):
     if _Genlet.get_enclosing() is None:
         return _AwaitableGenlet.wrap_coro(coro)
@@ -803,11 +1003,18 @@ def asyncf(f):
 
                 def genf():
                     asyncgen = x.__aiter__()
-                    while True:
-                        try:
-                            yield run(asyncgen.__anext__())
-                        except StopAsyncIteration:
-                            return
+                    try:
+                        while True:
+                            try:
+                                yield run(asyncgen.__anext__())
+                            except StopAsyncIteration:
+                                return
+                    # Run the cleanup code of the async generator if the
+                    # consumer stops early, rather than leaving it for the
+                    # garbage collector of an event loop that might be closed
+                    # by then.
+                    finally:
+                        run(asyncgen.aclose())
 
                 return genf()
             else:
@@ -972,10 +1179,22 @@ class PathAccess(ConcurrentAccessBase):
         assert mode in ('r', 'w')
         self.mode = mode
         self.path = os.path.abspath(path) if namespace == 'host' else os.path.normpath(path)
+        self._resolved = None
+
+    @property
+    def resolved(self):
+        """
+        :class:`pathlib.Path` of the resolved :attr:`path`, computed once.
+        """
+        resolved = self._resolved
+        if resolved is None:
+            resolved = pathlib.Path(self.path).resolve()
+            self._resolved = resolved
+        return resolved
 
     def overlap_with(self, other):
-        path1 = pathlib.Path(self.path).resolve()
-        path2 = pathlib.Path(other.path).resolve()
+        path1 = self.resolved
+        path2 = other.resolved
         return (
             self.namespace == other.namespace and
             'w' in (self.mode, other.mode) and
@@ -992,3 +1211,71 @@ class PathAccess(ConcurrentAccessBase):
             'w': 'write',
         }[self.mode]
         return '{} ({})'.format(self.path, mode)
+
+
+def _find_path_overlap(accesses):
+    """
+    Find two overlapping :class:`PathAccess` made by different owners.
+
+    :param accesses: Iterable of ``(owner, access)`` tuples.
+    :type accesses: collections.abc.Iterable
+
+    :returns: ``((owner1, access1), (owner2, access2))`` or ``None`` if there
+        is no overlap.
+
+    The accesses are inserted in a trie of path components per namespace,
+    which is then walked once. Two accesses overlap if one is located on the
+    path from the root to the other and at least one of them is a write, so
+    each access only needs to be checked against the readers and writers met
+    on its way down. This makes the cost linear in the total length of the
+    paths instead of quadratic in the number of accesses.
+    """
+    # Each node is a tuple (children, accesses)
+    tries = {}
+    for owner, access in accesses:
+        node = tries.setdefault(access.namespace, ({}, []))
+        for part in access.resolved.parts:
+            node = node[0].setdefault(part, ({}, []))
+        node[1].append((owner, access))
+
+    def add(summary, owner, access):
+        # Keeping at most 2 distinct owners is enough to always find one that
+        # differs from any given owner. The dicts are shared between siblings
+        # so they are copied rather than updated in place.
+        if owner in summary or len(summary) >= 2:
+            return summary
+        else:
+            return {**summary, owner: access}
+
+    def find_other(summary, owner):
+        for _owner, access in summary.items():
+            if _owner != owner:
+                return (_owner, access)
+        return None
+
+    # Depth-first walk carrying the readers and writers of all the ancestors
+    stack = [
+        (root, {}, {})
+        for root in tries.values()
+    ]
+    while stack:
+        (children, node_accesses), readers, writers = stack.pop()
+        for owner, access in node_accesses:
+            if access.mode == 'w':
+                writers = add(writers, owner, access)
+            else:
+                readers = add(readers, owner, access)
+
+        for owner, access in node_accesses:
+            found = find_other(writers, owner)
+            if found is None and access.mode == 'w':
+                found = find_other(readers, owner)
+            if found is not None:
+                return (found, (owner, access))
+
+        stack.extend(
+            (child, readers, writers)
+            for child in children.values()
+        )
+
+    return None
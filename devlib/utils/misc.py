@@ -18,6 +18,7 @@
 Miscellaneous functions that don't fit anywhere else.
 
 """
+from collections import OrderedDict, namedtuple
 from contextlib import contextmanager
 from functools import partial, reduce, wraps
 from itertools import groupby
@@ -25,12 +26,15 @@ from operator import itemgetter
 from weakref import WeakSet
 from ruamel.yaml import YAML
 
+import asyncio
+import inspect
 import ctypes
 import logging
 import os
 import pkgutil
 import random
 import re
+import signal
 import string
 import subprocess
 import sys
@@ -198,6 +202,119 @@ def check_output(command, timeout=None, ignore=None, inputtext=None, **kwargs):
     return check_subprocess_output(process, timeout=timeout, ignore=ignore, inputtext=inputtext)
 
 
+async def _wait_subprocess_async(process):
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(process.pid)
+    # pidfd_open() is only available on Linux >= 5.3
+    except (AttributeError, OSError):
+        delay = 0.001
+        while process.poll() is None:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+    else:
+        try:
+            exited = loop.create_future()
+
+            def callback():
+                if not exited.done():
+                    exited.set_result(None)
+
+            loop.add_reader(pidfd, callback)
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+        finally:
+            os.close(pidfd)
+        process.wait()
+
+    return process.returncode
+
+
+async def check_subprocess_output_async(process, timeout=None, ignore=None):
+    """
+    Coroutine equivalent of :func:`check_subprocess_output`. The pipes and the
+    termination of the process are monitored by the running asyncio event
+    loop, so no thread is blocked while the process executes.
+
+    If the timeout expires, the process group of ``process`` is killed, which
+    is appropriate for processes created with :func:`get_subprocess`.
+    """
+    if ignore is None:
+        ignore = []
+    elif isinstance(ignore, int):
+        ignore = [ignore]
+    elif not isinstance(ignore, list) and ignore != 'all':
+        message = 'Invalid value for ignore parameter: "{}"; must be an int or a list'
+        raise ValueError(message.format(ignore))
+
+    loop = asyncio.get_running_loop()
+    if process.stdin is not None:
+        process.stdin.close()
+
+    async def read(f, chunks):
+        if f is None:
+            return
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            f,
+        )
+        try:
+            while True:
+                chunk = await reader.read(64 * 1024)
+                if chunk:
+                    chunks.append(chunk)
+                else:
+                    break
+        finally:
+            transport.close()
+
+    def decode(chunks, stream):
+        # Currently errors=replace is needed as 0x8c throws an error
+        return b''.join(chunks).decode(stream.encoding or 'utf-8', 'replace')
+
+    out_chunks = []
+    err_chunks = []
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                read(process.stdout, out_chunks),
+                read(process.stderr, err_chunks),
+                _wait_subprocess_async(process),
+            ),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            process.kill()
+        # Reap the process so it does not linger as a zombie
+        await _wait_subprocess_async(process)
+        output = decode(out_chunks, sys.stdout)
+        error = decode(err_chunks, sys.stderr)
+        raise TimeoutError(process.args, output='\n'.join([output, error]))
+
+    output = decode(out_chunks, sys.stdout)
+    error = decode(err_chunks, sys.stderr)
+
+    retcode = process.returncode
+    if retcode and ignore != 'all' and retcode not in ignore:
+        raise subprocess.CalledProcessError(retcode, process.args, output, error)
+
+    return output, error
+
+
+async def check_output_async(command, timeout=None, ignore=None, **kwargs):
+    """
+    Coroutine equivalent of :func:`check_output`.
+    """
+    process = get_subprocess(command, **kwargs)
+    return await check_subprocess_output_async(process, timeout=timeout, ignore=ignore)
+
+
 def walk_modules(path):
     """
     Given package name, return a list of all modules (including submodules, etc)
@@ -685,11 +802,130 @@ def mask_to_list(mask):
             if mask & (1 << size - i - 1)]
 
 
-__memo_cache = {}
+MEMO_CACHE_MAXSIZE = 256
+"""
+Default maximum number of results kept by each cache of :func:`memoized`.
+"""
+
+MemoCacheInfo = namedtuple('MemoCacheInfo', ['hits', 'misses', 'evictions', 'size'])
+"""
+Statistics of :func:`memoized` caches, as returned by :func:`memo_cache_info`.
+"""
+
+# All the live caches, so they can be reset together
+_MEMO_CACHES = WeakSet()
+_MEMO_CACHES_LOCK = threading.Lock()
+
+# Name of the attribute holding the caches of an instance
+_MEMO_CACHES_ATTR = '_devlib_memo_caches'
+
+
+class _MemoCache:
+    """
+    Thread-safe LRU cache of the results of a memoized function.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        with _MEMO_CACHES_LOCK:
+            _MEMO_CACHES.add(self)
+
+    def __reduce__(self):
+        # Results are not carried over, as they may not be picklable.
+        return (self.__class__, (self.maxsize,))
+
+    def get(self, key, default):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def info(self):
+        with self._lock:
+            return MemoCacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                size=len(self._entries),
+            )
+
+
+def _get_instance_memo_caches(obj):
+    try:
+        return obj.__dict__[_MEMO_CACHES_ATTR]
+    except KeyError:
+        # setdefault() is atomic, so concurrent callers will get the same dict
+        return obj.__dict__.setdefault(_MEMO_CACHES_ATTR, {})
+
+
+def reset_memo_cache(obj=None):
+    """
+    Clear the results cached by :func:`memoized`.
 
+    :param obj: If not ``None``, only clear the results of the methods of that
+        object. Otherwise, clear all the caches.
+    """
+    if obj is None:
+        with _MEMO_CACHES_LOCK:
+            caches = list(_MEMO_CACHES)
+    else:
+        try:
+            caches = list(obj.__dict__.get(_MEMO_CACHES_ATTR, {}).values())
+        except AttributeError:
+            caches = []
 
-def reset_memo_cache():
-    __memo_cache.clear()
+    for cache in caches:
+        cache.clear()
+
+
+def memo_cache_info(obj=None):
+    """
+    Get the hit/miss statistics of the caches of :func:`memoized`.
+
+    :param obj: If not ``None``, only account for the methods of that object.
+        Otherwise, account for all the caches.
+
+    :returns: A :class:`MemoCacheInfo` named tuple.
+    """
+    if obj is None:
+        with _MEMO_CACHES_LOCK:
+            caches = list(_MEMO_CACHES)
+    else:
+        try:
+            caches = list(obj.__dict__.get(_MEMO_CACHES_ATTR, {}).values())
+        except AttributeError:
+            caches = []
+
+    infos = [cache.info for cache in caches]
+    return MemoCacheInfo(*(
+        sum(field)
+        for field in zip(*infos)
+    )) if infos else MemoCacheInfo(0, 0, 0, 0)
 
 
 def __get_memo_id(obj):
@@ -718,28 +954,99 @@ def __get_memo_id(obj):
         return '{}/{}'.format(obj_id, obj_bytes)
 
 
-@wrapt.decorator
-def memoized(wrapped, instance, args, kwargs):  # pylint: disable=unused-argument
+def __get_memo_key_item(obj):
+    try:
+        hash(obj)
+    except TypeError:
+        return __get_memo_id(obj)
+    else:
+        return obj
+
+
+def memoized(wrapped=None, maxsize=MEMO_CACHE_MAXSIZE):
     """
     A decorator for memoizing functions and methods.
 
+    The results of methods are cached per instance, so they are freed along
+    with the instance and can be cleared with :func:`reset_memo_cache`. Each
+    cache keeps the ``maxsize`` most recently used results, or all of them if
+    ``maxsize`` is ``None``. The decorator can be used as ``@memoized`` or
+    ``@memoized(maxsize=...)``.
+
     .. warning:: this may not detect changes to mutable types. As long as the
                  memoized function was used with an object as an argument
                  before, the cached result will be returned, even if the
                  structure of the object (e.g. a list) has changed in the mean time.
 
     """
-    func_id = repr(wrapped)
+    if wrapped is None:
+        return partial(memoized, maxsize=maxsize)
 
-    def memoize_wrapper(*args, **kwargs):
-        id_string = func_id + ','.join([__get_memo_id(a) for a in  args])
-        id_string += ','.join('{}={}'.format(k, __get_memo_id(v))
-                              for k, v in kwargs.items())
-        if id_string not in __memo_cache:
-            __memo_cache[id_string] = wrapped(*args, **kwargs)
-        return __memo_cache[id_string]
+    # Key of the caches in the instances, which needs to be picklable.
+    name = '{}.{}'.format(wrapped.__module__, wrapped.__qualname__)
+    # Methods wrapped in a property are called like plain functions, with the
+    # instance as first parameter.
+    try:
+        params = list(inspect.signature(wrapped).parameters)
+    except (TypeError, ValueError):
+        params = []
+    is_method = bool(params) and params[0] == 'self'
+
+    # Caches for calls not bound to an instance with a __dict__, such as plain
+    # functions, class methods or instances using __slots__.
+    shared_caches = {}
+    shared_lock = threading.Lock()
+    miss = object()
+
+    @wrapt.decorator
+    def wrapper(wrapped, instance, args, kwargs):
+        key_args = args
+        if instance is None and is_method and args:
+            instance = args[0]
+            args = args[1:]
+            wrapped = wrapped.__get__(instance)
+            key_args = args
+
+        if instance is None or isinstance(instance, type):
+            owner = instance
+            caches = None
+        else:
+            owner = None
+            try:
+                caches = _get_instance_memo_caches(instance)
+            except AttributeError:
+                caches = None
+                key_args = (instance, *args)
 
-    return memoize_wrapper(*args, **kwargs)
+        if caches is None:
+            with shared_lock:
+                try:
+                    cache = shared_caches[owner]
+                except KeyError:
+                    cache = _MemoCache(maxsize)
+                    shared_caches[owner] = cache
+        else:
+            try:
+                cache = caches[name]
+            except KeyError:
+                cache = caches.setdefault(name, _MemoCache(maxsize))
+
+        key = (key_args, tuple(kwargs.items()))
+        try:
+            value = cache.get(key, miss)
+        except TypeError:  # unhashable parameters
+            key = (
+                tuple(map(__get_memo_key_item, key_args)),
+                tuple((k, __get_memo_key_item(v)) for k, v in kwargs.items()),
+            )
+            value = cache.get(key, miss)
+
+        if value is miss:
+            value = wrapped(*args, **kwargs)
+            cache.set(key, value)
+        return value
+
+    return wrapper(wrapped)
 
 @contextmanager
 def batch_contextmanager(f, kwargs_list):
@@ -1026,6 +1333,17 @@ def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
 
     tar.extractall(path, members, numeric_owner=numeric_owner)
 
+def safe_extract_stream(tar, path="."):
+    """
+    Same as :func:`safe_extract` for a :class:`tarfile.TarFile` opened in
+    streaming mode (e.g. ``r|gz``), where members can only be visited once.
+    """
+    for member in tar:
+        member_path = os.path.join(path, member.name)
+        if not _is_within_directory(path, member_path):
+            raise Exception("Attempted Path Traversal in Tar File")
+        tar.extract(member, path)
+
 def _is_within_directory(directory, target):
 
     abs_directory = os.path.abspath(directory)
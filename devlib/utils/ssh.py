@@ -15,6 +15,7 @@
 
 
 import os
+import posixpath
 import stat
 import logging
 from pathlib import Path
@@ -27,9 +28,11 @@ import sys
 import time
 import contextlib
 import select
-import copy
 import functools
 import shutil
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
 from shlex import quote
 
 from paramiko.client import SSHClient, AutoAddPolicy, RejectPolicy
@@ -58,7 +61,8 @@ from devlib.exception import (HostError, TargetStableError, TargetNotRespondingE
 from devlib.utils.misc import (which, strip_bash_colors, check_output,
                                sanitize_cmd_template, memoized, redirect_streams)
 from devlib.utils.types import boolean
-from devlib.connection import ConnectionBase, ParamikoBackgroundCommand, SSHTransferHandle
+from devlib.connection import (ConnectionBase, ParamikoBackgroundCommand, SSHTransferHandle,
+                               PersistentShellBase, _RemoteFile, _get_remote_file_cmd)
 
 
 # Empty prompt with -p '' to avoid adding a leading space to the output.
@@ -106,6 +110,214 @@ def _handle_paramiko_exceptions(command=None):
         raise TimeoutError(command, output=None)
 
 
+class _SftpPool:
+    """
+    Pool of SFTP sessions, each using its own SSH channel so that transfers
+    can run in parallel.
+
+    :param open_sftp: Callable opening a new SFTP session.
+    :param size: Maximum number of sessions to open.
+    """
+    def __init__(self, open_sftp, size):
+        self._open_sftp = open_sftp
+        self.size = size
+        self._sessions = set()
+        self._idle = []
+        self._opening = 0
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def _check_closed(self):
+        if self.closed:
+            raise TargetTransientError('The SFTP session pool was closed')
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                self._check_closed()
+                if self._idle:
+                    return self._idle.pop()
+                elif len(self._sessions) + self._opening < self.size:
+                    self._opening += 1
+                    break
+                else:
+                    self._cond.wait()
+
+        try:
+            sftp = self._open_sftp()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                # The server might limit the number of sessions (e.g. OpenSSH
+                # MaxSessions), so make do with the ones already opened.
+                if not self._sessions:
+                    raise
+                logger.debug(f'Could not open more than {len(self._sessions)} SFTP sessions')
+                self.size = len(self._sessions)
+            return self._acquire()
+        else:
+            with self._cond:
+                self._opening -= 1
+                # The pool was closed while opening the session
+                if self.closed:
+                    sftp.close()
+                    self._check_closed()
+                self._sessions.add(sftp)
+            return sftp
+
+    def _release(self, sftp):
+        with self._cond:
+            if self.closed:
+                sftp.close()
+            elif sftp.get_channel().closed:
+                self._sessions.discard(sftp)
+            else:
+                self._idle.append(sftp)
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def get(self, timeout=None):
+        """
+        Context manager providing an SFTP session for exclusive use.
+        """
+        sftp = self._acquire()
+        try:
+            sftp.get_channel().settimeout(timeout)
+            yield sftp
+        finally:
+            self._release(sftp)
+
+    def close(self):
+        """
+        Close all the sessions, interrupting any transfer using them. The pool
+        cannot be used anymore afterwards.
+        """
+        with self._cond:
+            self.closed = True
+            sessions = list(self._sessions)
+            self._sessions.clear()
+            self._idle.clear()
+            self._cond.notify_all()
+
+        for sftp in sessions:
+            sftp.close()
+
+
+class _TransferBudget:
+    """
+    Limit the bandwidth shared by all the transfers of a connection.
+
+    :param bandwidth: Maximum bandwidth in bytes per second, or ``None`` for no
+        limit.
+    """
+    def __init__(self, bandwidth=None):
+        self.bandwidth = bandwidth
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        """
+        Block until ``size`` bytes can be transferred without exceeding the
+        budget.
+        """
+        if self.bandwidth:
+            with self._lock:
+                now = time.monotonic()
+                self._next = max(self._next, now) + size / self.bandwidth
+                delay = self._next - now
+            if delay > 0:
+                time.sleep(delay)
+
+
+class _TransferProgress:
+    """
+    Aggregate the progress of the parallel parts of a transfer, and report it
+    to ``callback(transferred, to_transfer)``.
+    """
+    def __init__(self, callback=None, budget=None):
+        self.callback = callback
+        self.budget = budget
+        self.transferred = 0
+        self.to_transfer = 0
+        self._lock = threading.Lock()
+
+    def add(self, size):
+        if self.budget is not None:
+            self.budget.consume(size)
+        with self._lock:
+            self.transferred += size
+            transferred = self.transferred
+        if self.callback is not None:
+            self.callback(transferred, self.to_transfer)
+
+    def make_file_callback(self):
+        """
+        Make a callback suitable for :meth:`paramiko.sftp_client.SFTPClient.get`
+        and :meth:`paramiko.sftp_client.SFTPClient.put` reporting the progress
+        of one file.
+        """
+        last = 0
+        def callback(transferred, to_transfer):
+            nonlocal last
+            self.add(transferred - last)
+            last = transferred
+        return callback
+
+
+class _SftpFileReader:
+    """
+    Read a :class:`paramiko.sftp_file.SFTPFile` sequentially, pipelining a
+    bounded number of read requests.
+
+    Unlike :meth:`paramiko.sftp_file.SFTPFile.prefetch`, the amount of data
+    requested ahead of the reader is bounded, so the memory usage does not
+    depend on the size of the file.
+    """
+    def __init__(self, f, chunk_size=32 * 1024, chunks_in_flight=64):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._chunks_in_flight = chunks_in_flight
+        # Files such as sysfs attributes can report a size unrelated to their
+        # content, so pipelining is only used up to the reported size and we
+        # then fall back on plain reads until EOF.
+        self._size = f.stat().st_size
+        self._pos = 0
+        self._buf = b''
+
+    def _fill(self):
+        chunk_size = self._chunk_size
+        end = min(self._size, self._pos + chunk_size * self._chunks_in_flight)
+        chunks = [
+            (pos, min(chunk_size, end - pos))
+            for pos in range(self._pos, end, chunk_size)
+        ]
+        data = b''.join(self._f.readv(chunks))
+        self._pos += len(data)
+        # The file shrunk, stop pipelining
+        if self._pos < end:
+            self._size = self._pos
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+
+        if not self._buf and self._pos < self._size:
+            self._buf = self._fill()
+
+        if self._buf:
+            data = self._buf[:size]
+            self._buf = self._buf[len(data):]
+        else:
+            self._f.seek(self._pos)
+            data = self._f.read(None if size == float('inf') else size)
+            self._pos += len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+
 def _read_paramiko_streams(stdout, stderr, select_timeout, callback, init, chunk_size=int(1e42)):
     try:
         return _read_paramiko_streams_internal(stdout, stderr, select_timeout, callback, init, chunk_size)
@@ -176,6 +388,211 @@ def _read_paramiko_streams_internal(stdout, stderr, select_timeout, callback, in
         return (callback_state, exit_code)
 
 
+async def _read_paramiko_channel_async(channel, callback, chunk_size=64 * 1024):
+    """
+    Read stdout and stderr of ``channel`` until the remote command exits,
+    without blocking the asyncio event loop.
+
+    :param callback: Coroutine function called with the name of the stream
+        (``"stdout"`` or ``"stderr"``) and each chunk of data. Nothing else is
+        read from the channel until it returns.
+    :type callback: collections.abc.Callable
+
+    :returns: The exit code of the command.
+    """
+    loop = asyncio.get_running_loop()
+    # The fileno() of a paramiko channel is a pipe that becomes readable when
+    # data is available on either stdout or stderr, and stays readable after
+    # the channel is closed.
+    fd = channel.fileno()
+    readable = asyncio.Event()
+    loop.add_reader(fd, readable.set)
+
+    async def read_ready():
+        for ready, recv, name in (
+            (channel.recv_ready, channel.recv, 'stdout'),
+            (channel.recv_stderr_ready, channel.recv_stderr, 'stderr'),
+        ):
+            while ready():
+                chunk = recv(chunk_size)
+                if chunk:
+                    await callback(name, chunk)
+                else:
+                    break
+
+    try:
+        # paramiko feeds the exit status after all the data, so once it is
+        # available we only need to empty the buffers one last time.
+        while not channel.exit_status_ready():
+            await readable.wait()
+            readable.clear()
+            await read_ready()
+            if channel.eof_received and not channel.exit_status_ready():
+                # The pipe stays readable after EOF, so avoid spinning while
+                # waiting for the exit status
+                await asyncio.sleep(0.001)
+        await read_ready()
+    finally:
+        loop.remove_reader(fd)
+
+    return channel.recv_exit_status()
+
+
+async def _redirect_paramiko_channel(channel, out_streams):
+    """
+    Copy the output of ``channel`` to ``out_streams`` until the remote command
+    exits. This is meant to run in a :class:`devlib.connection.IOReactor`
+    shared by many commands, so writing to a full pipe suspends the copy
+    rather than blocking the reactor thread.
+
+    :param out_streams: Dictionary mapping ``"stdout"`` and ``"stderr"`` to a
+        tuple ``(r, w)`` of the reading and writing ends of the stream.
+    :type out_streams: dict
+    """
+    loop = asyncio.get_running_loop()
+
+    def get_pipe_fd(f):
+        try:
+            fd = f.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+        else:
+            return fd if stat.S_ISFIFO(os.fstat(fd).st_mode) else None
+
+    pipe_fds = {}
+    for name, (r, w) in out_streams.items():
+        fd = get_pipe_fd(w)
+        if fd is not None:
+            pipe_fds[name] = fd
+
+    async def wait_writable(fd):
+        writable = loop.create_future()
+        loop.add_writer(fd, writable.set_result, None)
+        try:
+            await writable
+        finally:
+            loop.remove_writer(fd)
+
+    async def write(name, chunk):
+        _, w = out_streams[name]
+        try:
+            fd = pipe_fds[name]
+        except KeyError:
+            w.write(chunk)
+        else:
+            view = memoryview(chunk)
+            # Pipes provided by the caller are left in blocking mode as they
+            # may be shared with other writers. A writable pipe accepts at
+            # least PIPE_BUF bytes, so writing that much after waiting does not
+            # block.
+            blocking = os.get_blocking(fd)
+            while view:
+                if blocking:
+                    await wait_writable(fd)
+                    n = os.write(fd, view[:select.PIPE_BUF])
+                    view = view[n:]
+                else:
+                    try:
+                        n = os.write(fd, view)
+                    except BlockingIOError:
+                        await wait_writable(fd)
+                    else:
+                        view = view[n:]
+
+    class StreamsClosed(Exception):
+        pass
+
+    async def callback(name, chunk):
+        if name not in out_streams:
+            return
+
+        try:
+            await write(name, chunk)
+        # Write failed
+        except (ValueError, BrokenPipeError):
+            # Since that stream is now closed, stop trying to write to it
+            r, w = out_streams.pop(name)
+            if r is not w:
+                with contextlib.suppress(ValueError, OSError):
+                    w.close()
+            # If that was the last open stream, there is nothing left to do
+            if not out_streams:
+                raise StreamsClosed()
+
+    try:
+        await _read_paramiko_channel_async(channel, callback)
+    # The streams closed while we were writing to it, the job is done here
+    except StreamsClosed:
+        pass
+    except Exception as e:
+        logger.error(f'Error while redirecting the output of background command: {e}')
+        raise
+    finally:
+        # Close the channel to make sure the remote process will receive
+        # SIGPIPE when writing on its streams. That could happen if the user
+        # closed the out_streams but the remote process has not finished yet.
+        channel.close()
+
+        # Make sure the writing end are closed proper since we are not going
+        # to write anything anymore
+        for r, w in out_streams.values():
+            with contextlib.suppress(ValueError, OSError):
+                w.flush()
+                if r is not w:
+                    w.close()
+
+
+class _ParamikoPersistentShell(PersistentShellBase):
+    """
+    :class:`devlib.connection.PersistentShellBase` running in a dedicated
+    paramiko channel.
+    """
+    def __init__(self, conn, as_root):
+        super().__init__()
+        channel = conn._make_channel()
+
+        def executor(cmd, timeout):
+            channel.exec_command(cmd)
+            return (channel.makefile_stdin('w', 0),)
+
+        try:
+            conn._execute_command(
+                'exec sh',
+                as_root=as_root,
+                log=False,
+                timeout=None,
+                executor=executor,
+            )
+        except BaseException:
+            channel.close()
+            raise
+
+        self.channel = channel
+
+    def _send(self, data):
+        self.channel.sendall(data)
+
+    def _recv(self, timeout):
+        channel = self.channel
+        read_list, _, _ = select.select([channel], [], [], timeout)
+        chunks = []
+        if read_list:
+            if channel.recv_ready():
+                chunks.append(('stdout', channel.recv(_PERSISTENT_SHELL_CHUNK_SIZE)))
+            if channel.recv_stderr_ready():
+                chunks.append(('stderr', channel.recv_stderr(_PERSISTENT_SHELL_CHUNK_SIZE)))
+            # The channel is readable but has no data: it has been closed
+            if not chunks:
+                chunks.append(('stdout', b''))
+        return chunks
+
+    def _close(self):
+        self.channel.close()
+
+
+_PERSISTENT_SHELL_CHUNK_SIZE = 64 * 1024
+
+
 def _resolve_known_hosts(strict_host_check):
     if strict_host_check:
         if isinstance(strict_host_check, (str, os.PathLike)):
@@ -355,6 +772,10 @@ class SshConnection(SshConnectionBase):
                  start_transfer_poll_delay=30,
                  total_transfer_timeout=3600,
                  transfer_poll_period=30,
+                 persistent_shell=False,
+                 max_async_channels=8,
+                 sftp_channels=4,
+                 transfer_bandwidth=None,
                  ):
 
         super().__init__(
@@ -381,6 +802,24 @@ class SshConnection(SshConnectionBase):
         else:
             logger.debug('Using SFTP for file transfer')
 
+        # Long-lived shells, keyed by whether they run with sudo or not
+        self.persistent_shell = persistent_shell
+        self._persistent_shells = {}
+
+        # Persistent shells are driven synchronously, so they cannot be used
+        # from execute_async()
+        self.native_async = not persistent_shell
+        # Bound the number of channels opened concurrently by execute_async()
+        # to stay below the MaxSessions setting of the server, with one
+        # semaphore per event loop since they cannot be shared across loops.
+        self.max_async_channels = max_async_channels
+        self._async_channels_sems = weakref.WeakKeyDictionary()
+
+        # SFTP sessions used in parallel by push() and pull(), all sharing
+        # the same bandwidth budget.
+        self._sftp_pool = _SftpPool(self._open_sftp, sftp_channels)
+        self._transfer_budget = _TransferBudget(transfer_bandwidth)
+
         self.client = None
         try:
             self.client = self._make_client()
@@ -444,11 +883,7 @@ class SshConnection(SshConnectionBase):
             channel = transport.open_session()
             return channel
 
-    # Limit the number of opened channels to a low number, since some servers
-    # will reject more connections request. For OpenSSH, this is controlled by
-    # the MaxSessions config.
-    @functools.lru_cache(maxsize=1)
-    def _cached_get_sftp(self):
+    def _open_sftp(self):
         try:
             sftp = self.client.open_sftp()
         except paramiko.ssh_exception.SSHException as e:
@@ -458,19 +893,35 @@ class SshConnection(SshConnectionBase):
                 raise
         return sftp
 
-    def _get_sftp(self, timeout):
-        sftp = self._cached_get_sftp()
-        sftp.get_channel().settimeout(timeout)
-        return sftp
-
     @functools.lru_cache()
     def _get_scp(self, timeout, callback=lambda *_: None):
         cb = lambda _, to_transfer, transferred: callback(to_transfer, transferred)
         return SCPClient(self.client.get_transport(), socket_timeout=timeout, progress=cb)
 
+    # Files bigger than that are split in parts transferred in parallel on
+    # different SFTP sessions.
+    _SFTP_SPLIT_SIZE = 32 * 1024 * 1024
+    _SFTP_PART_SIZE = 8 * 1024 * 1024
+    # Size of the requests pipelined when transferring a part of a file.
+    _SFTP_CHUNK_SIZE = 32 * 1024
+    _SFTP_CHUNKS_IN_FLIGHT = 64
+
     def _push_file(self, sftp, src, dst, callback):
         sftp.put(src, dst, callback=callback)
 
+    def _push_file_range(self, sftp, src, dst, offset, size, callback):
+        with open(src, 'rb') as fr, sftp.open(dst, 'r+b') as fw:
+            fw.set_pipelined(True)
+            fr.seek(offset)
+            fw.seek(offset)
+            while size:
+                data = fr.read(min(self._SFTP_CHUNK_SIZE, size))
+                if not data:
+                    raise IOError(f'File changed while being pushed: {src}')
+                fw.write(data)
+                size -= len(data)
+                callback(len(data))
+
     @classmethod
     def _path_exists(cls, sftp, path):
         try:
@@ -480,24 +931,6 @@ class SshConnection(SshConnectionBase):
         else:
             return True
 
-    def _push_folder(self, sftp, src, dst, callback):
-        sftp.mkdir(dst)
-        for entry in os.scandir(src):
-            name = entry.name
-            src_path = os.path.join(src, name)
-            dst_path = os.path.join(dst, name)
-            if entry.is_dir():
-                push = self._push_folder
-            else:
-                push = self._push_file
-
-            push(sftp, src_path, dst_path, callback)
-
-    def _push_path(self, sftp, src, dst, callback=None):
-        logger.debug('Pushing via sftp: {} -> {}'.format(src, dst))
-        push = self._push_folder if os.path.isdir(src) else self._push_file
-        push(sftp, src, dst, callback)
-
     def _pull_file(self, sftp, src, dst, callback):
         try:
             sftp.get(src, dst, callback=callback)
@@ -512,26 +945,242 @@ class SshConnection(SshConnectionBase):
                 pass
             raise e
 
-    def _pull_folder(self, sftp, src, dst, callback):
+    def _pull_file_range(self, sftp, src, dst, offset, size, callback):
+        chunk_size = self._SFTP_CHUNK_SIZE
+        end = offset + size
+        with sftp.open(src, 'rb') as fr, open(dst, 'r+b') as fw:
+            fw.seek(offset)
+            while offset < end:
+                # Pipeline a bounded number of read requests, so that the
+                # bandwidth budget is not bypassed by prefetching.
+                batch_end = min(end, offset + chunk_size * self._SFTP_CHUNKS_IN_FLIGHT)
+                chunks = [
+                    (pos, min(chunk_size, batch_end - pos))
+                    for pos in range(offset, batch_end, chunk_size)
+                ]
+                for (_, chunk_size_), data in zip(chunks, fr.readv(chunks)):
+                    if len(data) != chunk_size_:
+                        raise IOError(f'File changed while being pulled: {src}')
+                    fw.write(data)
+                    callback(len(data))
+                offset = batch_end
+
+    def _walk_push_dir(self, sftp, src, dst):
+        sftp.mkdir(dst)
+        dirs = []
+        files = []
+        for entry in os.scandir(src):
+            src_path = os.path.join(src, entry.name)
+            dst_path = os.path.join(dst, entry.name)
+            if entry.is_dir():
+                dirs.append((src_path, dst_path))
+            else:
+                files.append((src_path, dst_path, entry.stat().st_size))
+        return (dirs, files)
+
+    def _walk_pull_dir(self, sftp, src, dst):
         os.makedirs(dst)
+        dirs = []
+        files = []
         for fileattr in sftp.listdir_attr(src):
-            filename = fileattr.filename
-            src_path = os.path.join(src, filename)
-            dst_path = os.path.join(dst, filename)
+            src_path = os.path.join(src, fileattr.filename)
+            dst_path = os.path.join(dst, fileattr.filename)
             if stat.S_ISDIR(fileattr.st_mode):
-                pull = self._pull_folder
+                dirs.append((src_path, dst_path))
             else:
-                pull = self._pull_file
+                files.append((src_path, dst_path, fileattr.st_size))
+        return (dirs, files)
 
-            pull(sftp, src_path, dst_path, callback)
+    def _sftp_transfer(self, action, sources, dest, timeout, callback=None):
+        """
+        Transfer ``sources`` to ``dest``, spreading the files and the parts of
+        big files across the sessions of the SFTP pool.
+        """
+        pool = self._sftp_pool
+        progress = _TransferProgress(callback, budget=self._transfer_budget)
+
+        if action == 'push':
+            walk_dir = self._walk_push_dir
+            transfer_file = self._push_file
+            transfer_range = self._push_file_range
+            def classify(sftp, src):
+                return (os.path.isdir(src), os.path.getsize(src))
+            def create_file(sftp, path, size):
+                with sftp.open(path, 'wb') as f:
+                    f.truncate(size)
+            def remove_file(sftp, path):
+                sftp.remove(path)
+        else:
+            walk_dir = self._walk_pull_dir
+            transfer_file = self._pull_file
+            transfer_range = self._pull_file_range
+            def classify(sftp, src):
+                attrs = sftp.stat(src)
+                return (stat.S_ISDIR(attrs.st_mode), attrs.st_size)
+            def create_file(sftp, path, size):
+                with open(path, 'wb') as f:
+                    f.truncate(size)
+            def remove_file(sftp, path):
+                os.remove(path)
+
+        def with_sftp(f):
+            def wrapper(*args):
+                with pool.get(timeout) as sftp:
+                    return f(sftp, *args)
+            return wrapper
+
+        def run_all(executor, calls):
+            futures = [
+                executor.submit(with_sftp(f), *args)
+                for f, *args in calls
+            ]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+            wait(not_done)
+            return [future.result() for future in futures]
+
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            kinds = run_all(executor, [(classify, src) for src in sources])
+            dirs = []
+            files = []
+            for src, (is_dir, size) in zip(sources, kinds):
+                if is_dir:
+                    dirs.append((src, dest))
+                else:
+                    files.append((src, dest, size))
+
+            # Walk the directories one level at a time, so the listing of all
+            # the directories of a level happens in parallel.
+            while dirs:
+                walked = run_all(executor, [(walk_dir, src, dst) for src, dst in dirs])
+                dirs = []
+                for _dirs, _files in walked:
+                    dirs.extend(_dirs)
+                    files.extend(_files)
+
+            progress.to_transfer = sum(size for _, _, size in files)
+
+            calls = []
+            split = []
+            for src, dst, size in files:
+                if size > self._SFTP_SPLIT_SIZE and pool.size > 1:
+                    split.append((src, dst, size))
+                    calls.extend(
+                        (transfer_range, src, dst, offset, min(self._SFTP_PART_SIZE, size - offset), progress.add)
+                        for offset in range(0, size, self._SFTP_PART_SIZE)
+                    )
+                else:
+                    calls.append((transfer_file, src, dst, progress.make_file_callback()))
 
-    def _pull_path(self, sftp, src, dst, callback=None):
-        logger.debug('Pulling via sftp: {} -> {}'.format(src, dst))
-        try:
-            self._pull_file(sftp, src, dst, callback)
-        except IOError:
-            # Maybe that was a directory, so retry as such
-            self._pull_folder(sftp, src, dst, callback)
+            for src, dst, size in split:
+                logger.debug(f'{action.capitalize()}ing in parallel parts via sftp: {src} -> {dst}')
+                with pool.get(timeout) as sftp:
+                    create_file(sftp, dst, size)
+
+            logger.debug(f'{action.capitalize()}ing {len(files)} files via {pool.size} sftp sessions: {sources} -> {dest}')
+            try:
+                run_all(executor, calls)
+            except BaseException:
+                for _, dst, _ in split:
+                    try:
+                        with pool.get(timeout) as sftp:
+                            remove_file(sftp, dst)
+                    except Exception:
+                        pass
+                raise
+
+    @property
+    def native_fs(self):
+        if self.use_scp:
+            return frozenset()
+        else:
+            return frozenset({'stat', 'listdir', 'makedirs', 'unlink', 'rename'})
+
+    @contextlib.contextmanager
+    def _sftp_fs(self):
+        with _handle_paramiko_exceptions(), self._sftp_pool.get(self.timeout) as sftp:
+            yield sftp
+
+    def stat(self, path, as_root=False):
+        if (as_root and not self.connected_as_root) or self.use_scp:
+            return super().stat(path, as_root=as_root)
+        with self._sftp_fs() as sftp:
+            return sftp.stat(path)
+
+    def listdir(self, path, as_root=False):
+        if (as_root and not self.connected_as_root) or self.use_scp:
+            return super().listdir(path, as_root=as_root)
+        with self._sftp_fs() as sftp:
+            return sftp.listdir(path)
+
+    def makedirs(self, path, as_root=False):
+        if (as_root and not self.connected_as_root) or self.use_scp:
+            return super().makedirs(path, as_root=as_root)
+
+        def makedirs(sftp, path):
+            try:
+                sftp.mkdir(path)
+            except OSError:
+                # Either the path already exists or a parent is missing.
+                try:
+                    attrs = sftp.stat(path)
+                except FileNotFoundError:
+                    parent = posixpath.dirname(path.rstrip('/'))
+                    if parent == path:
+                        raise
+                    makedirs(sftp, parent)
+                    sftp.mkdir(path)
+                else:
+                    if not stat.S_ISDIR(attrs.st_mode):
+                        raise FileExistsError(path)
+
+        with self._sftp_fs() as sftp:
+            makedirs(sftp, path)
+
+    def unlink(self, path, as_root=False):
+        if (as_root and not self.connected_as_root) or self.use_scp:
+            return super().unlink(path, as_root=as_root)
+        with self._sftp_fs() as sftp:
+            sftp.remove(path)
+
+    def rename(self, src, dst, as_root=False):
+        if (as_root and not self.connected_as_root) or self.use_scp:
+            return super().rename(src, dst, as_root=as_root)
+        with self._sftp_fs() as sftp:
+            try:
+                sftp.posix_rename(src, dst)
+            # The server might not support the posix-rename@openssh.com
+            # extension
+            except IOError:
+                return super().rename(src, dst, as_root=as_root)
+
+    def open_remote(self, path, mode='rb', as_root=False):
+        if as_root and not self.connected_as_root:
+            return super().open_remote(path, mode, as_root=as_root)
+
+        # Validate the mode
+        _get_remote_file_cmd(path, mode)
+        with _handle_paramiko_exceptions():
+            # Use a dedicated session, so that the file can be kept opened
+            # for as long as the caller wants without starving transfers.
+            sftp = self._open_sftp()
+            try:
+                f = sftp.open(path, mode)
+                if mode == 'rb':
+                    stream = _SftpFileReader(
+                        f,
+                        chunk_size=self._SFTP_CHUNK_SIZE,
+                        chunks_in_flight=self._SFTP_CHUNKS_IN_FLIGHT,
+                    )
+                else:
+                    f.set_pipelined(True)
+                    stream = f
+            except BaseException:
+                sftp.close()
+                raise
+
+        return _RemoteFile(stream, mode, on_close=lambda complete: sftp.close())
 
     def push(self, sources, dest, timeout=None):
         self._push_pull('push', sources, dest, timeout)
@@ -557,11 +1206,8 @@ class SshConnection(SshConnectionBase):
                 logger.debug(scp_msg.capitalize())
                 scp_cmd(sources, dest, recursive=True)
             else:
-                sftp = self._get_sftp(timeout)
-                sftp_cmd = getattr(self, '_' + action + '_path')
                 with _handle_paramiko_exceptions():
-                    for source in sources:
-                        sftp_cmd(sftp, source, dest)
+                    self._sftp_transfer(action, sources, dest, timeout)
 
         # No timeout
         elif self.use_scp:
@@ -576,12 +1222,16 @@ class SshConnection(SshConnectionBase):
                 logger.debug(scp_msg.capitalize())
                 scp_cmd(sources, dest, recursive=True)
         else:
-            sftp = self._get_sftp(timeout)
-            handle, cm = make_handle(sftp)
-            sftp_cmd = getattr(self, '_' + action + '_path')
-            with _handle_paramiko_exceptions(), cm:
-                for source in sources:
-                    sftp_cmd(sftp, source, dest, callback=handle.progress_cb)
+            pool = self._sftp_pool
+            handle, cm = make_handle(pool)
+            try:
+                with _handle_paramiko_exceptions(), cm:
+                    self._sftp_transfer(action, sources, dest, timeout, callback=handle.progress_cb)
+            finally:
+                # Cancelling the transfer closes the pool to stop all its
+                # workers, so the next transfers need a new one.
+                if pool.closed and self._sftp_pool is pool:
+                    self._sftp_pool = _SftpPool(self._open_sftp, pool.size)
 
     def execute(self, command, timeout=None, check_exit_code=True,
                 as_root=False, strip_colors=True, will_succeed=False): #pylint: disable=unused-argument
@@ -598,22 +1248,43 @@ class SshConnection(SshConnectionBase):
             else:
                 raise
         else:
-            if check_exit_code and exit_code:
-                cls = TargetTransientCalledProcessError if will_succeed else TargetStableCalledProcessError
-                raise cls(
-                    exit_code,
-                    command,
-                    output,
-                    None,
-                )
-            return output
+            return self._check_exit_code(command, exit_code, output, check_exit_code, will_succeed)
+
+    async def execute_async(self, command, timeout=None, check_exit_code=True,
+                            as_root=False, strip_colors=True, will_succeed=False): #pylint: disable=unused-argument
+        if command == '':
+            return ''
+        try:
+            with _handle_paramiko_exceptions(command):
+                exit_code, output = await self._execute_async(command, timeout, as_root)
+        except TargetCalledProcessError:
+            raise
+        except TargetStableError as e:
+            if will_succeed:
+                raise TargetTransientError(e)
+            else:
+                raise
+        else:
+            return self._check_exit_code(command, exit_code, output, check_exit_code, will_succeed)
+
+    @staticmethod
+    def _check_exit_code(command, exit_code, output, check_exit_code, will_succeed):
+        if check_exit_code and exit_code:
+            cls = TargetTransientCalledProcessError if will_succeed else TargetStableCalledProcessError
+            raise cls(
+                exit_code,
+                command,
+                output,
+                None,
+            )
+        return output
 
     def background(self, command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, as_root=False):
         with _handle_paramiko_exceptions(command):
             return self._background(command, stdout, stderr, as_root)
 
     def _background(self, command, stdout, stderr, as_root):
-        def make_init_kwargs(command):
+        def make_init_kwargs(command, data_dir):
             _stdout, _stderr, _command = redirect_streams(stdout, stderr, command)
 
             _command = "printf '%s\n' $$; exec sh -c {}".format(quote(_command))
@@ -664,6 +1335,9 @@ class SshConnection(SshConnectionBase):
                 # it
                 elif stream_out == subprocess.PIPE:
                     r, w = os.pipe()
+                    # Only the reactor writes to that pipe, so it can be
+                    # non-blocking
+                    os.set_blocking(w, False)
                     r = os.fdopen(r, 'rb')
                     w = os.fdopen(w, 'wb')
                 # Turn a file descriptor into a file-like object
@@ -685,54 +1359,16 @@ class SshConnection(SshConnectionBase):
                 )
             }
 
-            def redirect_thread_f(stdout_in, stderr_in, out_streams, select_timeout):
-                def callback(out_streams, name, chunk):
-                    try:
-                        r, w = out_streams[name]
-                    except KeyError:
-                        return out_streams
-
-                    try:
-                        w.write(chunk)
-                    # Write failed
-                    except ValueError:
-                        # Since that stream is now closed, stop trying to write to it
-                        del out_streams[name]
-                        # If that was the last open stream, we raise an
-                        # exception so the thread can terminate.
-                        if not out_streams:
-                            raise
-
-                    return out_streams
-
-                try:
-                    _read_paramiko_streams(stdout_in, stderr_in, select_timeout, callback, copy.copy(out_streams))
-                # The streams closed while we were writing to it, the job is done here
-                except ValueError:
-                    pass
-
-                # Make sure the writing end are closed proper since we are not
-                # going to write anything anymore
-                for r, w in out_streams.values():
-                    w.flush()
-                    if r is not w and w is not None:
-                        w.close()
-
-            # If there is anything we need to redirect to, spawn a thread taking
-            # care of that
-            select_timeout = 1
-            thread_out_streams = {
+            # If there is anything we need to redirect to, let the connection
+            # reactor take care of that
+            redirect_out_streams = {
                 name: (r, w)
                 for name, (r, w) in out_streams.items()
                 if w is not None
             }
-            redirect_thread = threading.Thread(
-                target=redirect_thread_f,
-                args=(stdout_in, stderr_in, thread_out_streams, select_timeout),
-                # The thread will die when the main thread dies
-                daemon=True,
+            redirect = self.reactor.submit(
+                _redirect_paramiko_channel(channel, redirect_out_streams)
             )
-            redirect_thread.start()
 
             return dict(
                 chan=channel,
@@ -741,7 +1377,7 @@ class SshConnection(SshConnectionBase):
                 # We give the reading end to the consumer of the data
                 stdout=out_streams['stdout'][0],
                 stderr=out_streams['stderr'][0],
-                redirect_thread=redirect_thread,
+                redirect=redirect,
             )
 
         return ParamikoBackgroundCommand.from_factory(
@@ -754,6 +1390,10 @@ class SshConnection(SshConnectionBase):
     def _close(self):
         logger.debug('Logging out {}@{}'.format(self.username, self.host))
         with _handle_paramiko_exceptions():
+            for shell in self._persistent_shells.values():
+                shell.close()
+            self._persistent_shells.clear()
+            self._sftp_pool.close()
             self.client.close()
 
     def _execute_command(self, command, as_root, log, timeout, executor):
@@ -779,7 +1419,29 @@ class SshConnection(SshConnectionBase):
 
         return streams
 
+    def _get_persistent_shell(self, use_sudo):
+        shell = self._persistent_shells.get(use_sudo)
+        if shell is None or shell.closed:
+            shell = _ParamikoPersistentShell(self, as_root=use_sudo)
+            self._persistent_shells[use_sudo] = shell
+        return shell
+
+    def _execute_persistent(self, command, timeout, as_root, log):
+        use_sudo = as_root and not self.connected_as_root
+        if log:
+            logger.debug(command)
+
+        shell = self._get_persistent_shell(use_sudo)
+        # Merge stderr into stdout to match the behavior of the non-persistent
+        # path
+        exit_code, output, _ = shell.execute(command, timeout=timeout, merge_stderr=True)
+        output = output.decode(sys.stdout.encoding or 'utf-8', 'replace')
+        return (exit_code, output)
+
     def _execute(self, command, timeout=None, as_root=False, strip_colors=True, log=True):
+        if self.persistent_shell:
+            return self._execute_persistent(command, timeout, as_root, log)
+
         # Merge stderr into stdout since we are going without a TTY
         command = '({}) 2>&1'.format(command)
 
@@ -807,6 +1469,72 @@ class SshConnection(SshConnectionBase):
         return (exit_code, output)
 
 
+    def _get_async_channels_sem(self):
+        loop = asyncio.get_running_loop()
+        try:
+            return self._async_channels_sems[loop]
+        except KeyError:
+            sem = asyncio.Semaphore(self.max_async_channels)
+            self._async_channels_sems[loop] = sem
+            return sem
+
+    async def _execute_async(self, command, timeout=None, as_root=False, log=True):
+        # Merge stderr into stdout since we are going without a TTY
+        command = '({}) 2>&1'.format(command)
+
+        def start():
+            channel = self._make_channel()
+
+            def executor(cmd, timeout):
+                channel.exec_command(cmd)
+                return (channel.makefile_stdin('wb', -1),)
+
+            try:
+                stdin, = self._execute_command(
+                    command,
+                    as_root=as_root,
+                    log=log,
+                    timeout=timeout,
+                    executor=executor,
+                )
+                stdin.close()
+            except BaseException:
+                channel.close()
+                raise
+            return channel
+
+        loop = asyncio.get_running_loop()
+        async with self._get_async_channels_sem():
+            # Opening the channel and starting the command each wait for a
+            # reply from the server with no non-blocking API in paramiko, so
+            # use a short-lived worker for that part only. The output is then
+            # read from the event loop directly.
+            channel = await loop.run_in_executor(None, start)
+            output_chunks = []
+
+            async def callback(name, chunk):
+                output_chunks.append(chunk)
+
+            def get_output():
+                # Join in one go to avoid O(N^2) concatenation
+                output = b''.join(output_chunks)
+                return output.decode(sys.stdout.encoding or 'utf-8', 'replace')
+
+            try:
+                exit_code = await asyncio.wait_for(
+                    _read_paramiko_channel_async(channel, callback),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(command, output=get_output())
+            finally:
+                # Close the channel to make sure the remote process will
+                # receive SIGPIPE when writing on its streams.
+                channel.close()
+
+        return (exit_code, get_output())
+
+
 class TelnetConnection(SshConnectionBase):
 
     default_password_prompt = '[sudo] password'
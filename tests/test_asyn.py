@@ -23,7 +23,7 @@ from contextlib import contextmanager
 
 from pytest import skip, raises
 
-from devlib.utils.asyn import run, asynccontextmanager, AsyncManager
+from devlib.utils.asyn import run, asynccontextmanager, AsyncManager, PathAccess
 
 
 class AsynTestExcep(Exception):
@@ -564,6 +564,68 @@ def _do_test_run(top_run):
 
     test_async_map_concurrently_cancel()
 
+    def test_async_concurrently_conflict():
+        def make_coro(manager, accesses):
+            async def f():
+                for namespace, path, mode in accesses:
+                    manager.track_access(PathAccess(namespace, path, mode))
+            return f()
+
+        async def agen_f(accesses, **kwargs):
+            manager = AsyncManager(**kwargs)
+            return await manager.concurrently(
+                make_coro(manager, _accesses)
+                for _accesses in accesses
+            )
+
+        top_run(agen_f([
+            [('target', '/a/b', 'r')],
+            [('target', '/a/b', 'r')],
+            [('target', '/a/c', 'w')],
+            [('host', '/a/b', 'w')],
+        ]))
+
+        for accesses in (
+            [[('target', '/a/b', 'w')], [('target', '/a/b', 'r')]],
+            [[('target', '/a', 'w')], [('target', '/a/b/c', 'r')]],
+            [[('target', '/a', 'r')], [('target', '/b', 'r'), ('target', '/a/b', 'w')]],
+        ):
+            with raises(RuntimeError):
+                top_run(agen_f(accesses))
+
+            top_run(agen_f(accesses, conflict_check=False))
+
+    test_async_concurrently_conflict()
+
+    def test_async_map_concurrently_bounded():
+        async def agen_f():
+            manager = AsyncManager(max_in_flight=3)
+            in_flight = 0
+            max_seen = 0
+
+            async def f(x):
+                nonlocal in_flight, max_seen
+                in_flight += 1
+                max_seen = max(max_seen, in_flight)
+                await asyncio.sleep(0)
+                in_flight -= 1
+                return x * 2
+
+            mapping = await manager.map_concurrently(f, range(10))
+            assert list(mapping.items()) == [(x, x * 2) for x in range(10)]
+
+            streamed = [
+                item
+                async for item in manager.imap_concurrently(f, range(10), max_in_flight=2)
+            ]
+            assert sorted(streamed) == [(x, x * 2) for x in range(10)]
+
+            return max_seen
+
+        assert top_run(agen_f()) == 3
+
+    test_async_map_concurrently_bounded()
+
 
 def _test_in_thread(setup, test):
     def f():
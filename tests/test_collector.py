@@ -0,0 +1,153 @@
+#
+#    Copyright 2024 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Module for testing collectors, using dummy collectors that do not need any
+target.
+"""
+
+import asyncio
+import time
+
+from pytest import raises
+
+from devlib.collector import CollectorBase, CollectorGroup, CollectorOutput, CollectorOutputEntry
+from devlib.utils.asyn import asyncf
+
+
+DELAY = 0.5
+
+
+class CollectorTestExcep(Exception):
+    pass
+
+
+class BlockingCollector(CollectorBase):
+    """
+    Collector implementing its lifecycle with blocking methods.
+    """
+    def __init__(self, target, path, excep=None):
+        super().__init__(target)
+        self.path = path
+        self.excep = excep
+        self.started = False
+
+    def start(self):
+        time.sleep(DELAY)
+        self.started = True
+
+    def stop(self):
+        time.sleep(DELAY)
+        if self.excep is not None:
+            raise self.excep
+
+    def get_data(self):
+        return CollectorOutput([CollectorOutputEntry(self.path, 'file')])
+
+
+class AsyncCollector(CollectorBase):
+    """
+    Collector implementing its lifecycle with coroutines.
+    """
+    def __init__(self, target, path, excep=None):
+        super().__init__(target)
+        self.path = path
+        self.excep = excep
+        self.started = False
+
+    @asyncf
+    async def start(self):
+        await asyncio.sleep(DELAY)
+        self.started = True
+
+    @asyncf
+    async def stop(self):
+        # Fail after the blocking collectors, to check that the exception
+        # raised does not depend on the order of completion.
+        await asyncio.sleep(DELAY * 2)
+        if self.excep is not None:
+            raise self.excep
+
+    @asyncf
+    async def get_data(self):
+        return CollectorOutput([CollectorOutputEntry(self.path, 'file')])
+
+
+def _overlap(a, b):
+    return a[0] < b[1] and b[0] < a[1]
+
+
+def test_collector_group():
+    """
+    Test that CollectorGroup runs blocking and async collectors concurrently.
+    """
+    collectors = [
+        BlockingCollector(None, 'blocking1'),
+        BlockingCollector(None, 'blocking2'),
+        AsyncCollector(None, 'async'),
+    ]
+    group = CollectorGroup(None, collectors)
+
+    begin = time.monotonic()
+    group.start()
+    duration = time.monotonic() - begin
+
+    assert all(collector.started for collector in collectors)
+    # Sequential execution would take at least 3 * DELAY
+    assert duration < DELAY * 2
+
+    timestamps = [group.get_timestamps(collector)['start'] for collector in collectors]
+    for start, end in timestamps:
+        assert end - start >= DELAY * 0.9
+    for i, a in enumerate(timestamps):
+        for b in timestamps[i + 1:]:
+            assert _overlap(a, b)
+
+    output = group.get_data()
+    assert [entry.path for entry in output] == ['blocking1', 'blocking2', 'async']
+
+    # get_timestamps() only reports the operations that were executed
+    assert set(group.get_timestamps(collectors[0])) == {'start', 'get_data'}
+
+
+def test_collector_group_excep():
+    """
+    Test that CollectorGroup lets all the operations finish and raises the
+    exception of the first failing collector.
+    """
+    first = CollectorTestExcep('first')
+    second = CollectorTestExcep('second')
+    collectors = [
+        AsyncCollector(None, 'async', excep=first),
+        BlockingCollector(None, 'blocking1', excep=second),
+        BlockingCollector(None, 'blocking2'),
+    ]
+    group = CollectorGroup(None, collectors)
+
+    with raises(CollectorTestExcep) as excinfo:
+        group.stop()
+    assert excinfo.value is first
+
+    # The successful collector finished its operation before the exception
+    # was raised.
+    assert 'stop' in group.get_timestamps(collectors[2])
+
+    async def test():
+        with raises(CollectorTestExcep) as excinfo:
+            await group.stop.asyn()
+        assert excinfo.value is first
+
+    asyncio.run(test())
@@ -0,0 +1,359 @@
+#
+#    Copyright 2024 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Module for testing the connections internals, using fake channels and
+processes that do not need any target.
+"""
+
+import asyncio
+import os
+import stat
+import sys
+import threading
+from shlex import quote
+from types import SimpleNamespace
+
+import pytest
+
+from devlib.connection import IOReactor, TransferManager, TransferMetrics, TransferRecord
+from devlib.host import LocalConnection
+from devlib.utils import android
+from devlib.utils.android import _AdbPersistentShell
+from devlib.utils.ssh import _redirect_paramiko_channel
+
+
+class FakeChannel:
+    """
+    Minimal stand-in for :class:`paramiko.channel.Channel`, fed with data by
+    the test.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers = {'stdout': bytearray(), 'stderr': bytearray()}
+        self._exit_code = None
+        self.eof_received = False
+        self.closed = False
+        # Like paramiko, signal that data is available with a pipe that stays
+        # readable.
+        self._r, self._w = os.pipe()
+
+    def fileno(self):
+        return self._r
+
+    def _notify(self):
+        os.write(self._w, b'x')
+
+    def feed(self, name, data):
+        with self._lock:
+            self._buffers[name] += data
+        self._notify()
+
+    def exit(self, exit_code):
+        with self._lock:
+            self.eof_received = True
+            self._exit_code = exit_code
+        self._notify()
+
+    def _recv(self, name, size):
+        with self._lock:
+            buf = self._buffers[name]
+            chunk = bytes(buf[:size])
+            del buf[:size]
+            return chunk
+
+    def recv_ready(self):
+        with self._lock:
+            return bool(self._buffers['stdout'])
+
+    def recv(self, size):
+        return self._recv('stdout', size)
+
+    def recv_stderr_ready(self):
+        with self._lock:
+            return bool(self._buffers['stderr'])
+
+    def recv_stderr(self, size):
+        return self._recv('stderr', size)
+
+    def exit_status_ready(self):
+        with self._lock:
+            return self._exit_code is not None
+
+    def recv_exit_status(self):
+        return self._exit_code
+
+    def close(self):
+        self.closed = True
+        os.close(self._r)
+        os.close(self._w)
+
+
+def _make_streams(blocking=True):
+    streams = {}
+    for name in ('stdout', 'stderr'):
+        r, w = os.pipe()
+        os.set_blocking(w, blocking)
+        streams[name] = (os.fdopen(r, 'rb'), os.fdopen(w, 'wb'))
+    return streams
+
+
+@pytest.mark.parametrize('blocking', [True, False])
+def test_redirect_paramiko_channel(blocking):
+    """
+    Test that the output of a channel is copied to pipes without blocking the
+    reactor when a pipe is full, whether the pipe is blocking or not.
+    """
+    reactor = IOReactor()
+    try:
+        channel = FakeChannel()
+        streams = _make_streams(blocking)
+        # The mode of the pipes is left untouched
+        for _, w in streams.values():
+            assert os.get_blocking(w.fileno()) == blocking
+        stdout, _ = streams['stdout']
+        stderr, _ = streams['stderr']
+
+        redirect = reactor.submit(_redirect_paramiko_channel(channel, dict(streams)))
+
+        # Larger than the capacity of a pipe, so the copy has to wait for the
+        # reader.
+        data = os.urandom(4 * 1024 * 1024)
+        channel.feed('stdout', data)
+        channel.feed('stderr', b'error')
+        channel.exit(0)
+
+        # The reactor is still available to other commands
+        assert reactor.submit(asyncio.sleep(0, result=42)).result(timeout=10) == 42
+        for _, w in streams.values():
+            assert os.get_blocking(w.fileno()) == blocking
+
+        # The writing ends are closed once the command exits, so reading
+        # reaches the end of the streams.
+        assert stdout.read() == data
+        assert stderr.read() == b'error'
+        redirect.result(timeout=10)
+        assert channel.closed
+
+        stdout.close()
+        stderr.close()
+    finally:
+        reactor.close()
+
+
+def test_redirect_paramiko_channel_closed():
+    """
+    Test that the copy stops and closes the channel once the consumer closed
+    all the streams.
+    """
+    reactor = IOReactor()
+    try:
+        channel = FakeChannel()
+        streams = _make_streams()
+        for r, _ in streams.values():
+            r.close()
+
+        redirect = reactor.submit(_redirect_paramiko_channel(channel, dict(streams)))
+        channel.feed('stdout', b'output')
+        channel.feed('stderr', b'error')
+
+        # The command has not exited, but there is nothing left to do
+        redirect.result(timeout=10)
+        assert channel.closed
+    finally:
+        reactor.close()
+
+
+# Shell behaving like "adb shell" on devices without shell protocol v2:
+# stderr is merged into stdout, and the pty turns "\n" into "\r\n".
+_CRLF_FILTER = r"""
+import sys
+while True:
+    line = sys.stdin.buffer.readline()
+    if not line:
+        break
+    sys.stdout.buffer.write(line.replace(b'\n', b'\r\n'))
+    sys.stdout.buffer.flush()
+"""
+_FAKE_ADB_SHELL = 'sh 2>&1 | {} -c {}'.format(quote(sys.executable), quote(_CRLF_FILTER))
+
+
+def test_adb_persistent_shell(monkeypatch):
+    """
+    Test the framing of the output of the persistent adb shell.
+    """
+    def get_adb_parts(command, *args, **kwargs):
+        return (('sh', '-c', _FAKE_ADB_SHELL), {})
+
+    monkeypatch.setattr(android, '_get_adb_parts', get_adb_parts)
+
+    conn = SimpleNamespace(device=None, adb_server=None, adb_port=None)
+    shell = _AdbPersistentShell(conn, 'sh')
+    try:
+        exit_code, out, err = shell.execute('echo foo; echo bar >&2', timeout=10)
+        assert exit_code == 0
+        assert out == b'foo\r\nbar\r\n'
+        assert err == b''
+        # Same output as adb_shell() once normalized
+        assert android._normalize_newlines(out.decode()) == 'foo\nbar\n'
+
+        # The shell is reused across commands
+        exit_code, out, err = shell.execute('printf "a\\rb"; exit 3', timeout=10)
+        assert exit_code == 3
+        assert android._normalize_newlines(out.decode()) == 'a\nb'
+
+        assert not shell.closed
+    finally:
+        shell.close()
+
+
+def _record(size, duration):
+    return TransferRecord(
+        direction='pull',
+        connection='FakeConnection',
+        sources=['src'],
+        dest='dest',
+        size=size,
+        duration=duration,
+    )
+
+
+def test_transfer_metrics_estimate_timeout():
+    """
+    Test TransferMetrics.estimate_timeout()
+    """
+    metrics = TransferMetrics()
+    mib = 1024 * 1024
+
+    # No history yet
+    assert metrics.throughput is None
+    assert metrics.estimate_timeout(100 * mib, default=42) == 42
+
+    # Small transfers are not representative of the throughput
+    metrics.record(_record(1024, 1))
+    assert metrics.throughput is None
+
+    metrics.record(_record(10 * mib, 2))
+    metrics.record(_record(30 * mib, 2))
+    assert metrics.throughput == 10 * mib
+
+    assert metrics.estimate_timeout(None, default=42) == 42
+    assert metrics.estimate_timeout(1000 * mib) == 4 * 100
+    assert metrics.estimate_timeout(1000 * mib, margin=2) == 2 * 100
+    # Small transfers get the minimum timeout
+    assert metrics.estimate_timeout(mib, min_timeout=30) == 30
+
+    # Only the most recent records are kept
+    metrics = TransferMetrics(maxlen=2)
+    for duration in (1, 2, 4):
+        metrics.record(_record(4 * mib, duration))
+    assert [r.duration for r in metrics.history] == [2, 4]
+
+
+class FakeStatConnection:
+    """
+    Connection only providing what :class:`TransferManager` needs.
+    """
+    def __init__(self, stats):
+        self.stats = stats
+        self.transfer_metrics = TransferMetrics()
+
+    def stat(self, path, as_root=False):
+        try:
+            return self.stats[path]
+        except KeyError:
+            raise FileNotFoundError(path)
+
+
+def _stat_result(mode, size):
+    return os.stat_result((mode, 0, 0, 0, 0, 0, size, 0, 0, 0))
+
+
+def test_transfer_manager_size(tmp_path):
+    """
+    Test the computation of the size of a transfer by TransferManager.
+    """
+    conn = FakeStatConnection({
+        'a': _stat_result(stat.S_IFREG, 10),
+        'b': _stat_result(stat.S_IFREG, 20),
+        'dir': _stat_result(stat.S_IFDIR, 4096),
+    })
+    manager = TransferManager(conn)
+
+    assert manager._get_size(['a', 'b'], 'pull') == 30
+    # The size of a directory on the target is unknown
+    assert manager._get_size(['a', 'dir'], 'pull') is None
+    # Errors are not fatal
+    assert manager._get_size(['missing'], 'pull') is None
+
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'f1').write_bytes(b'x' * 10)
+    (tmp_path / 'f2').write_bytes(b'x' * 5)
+    assert manager._get_size([str(tmp_path)], 'push') == 15
+    assert manager._get_size([str(tmp_path / 'f2')], 'push') == 5
+
+
+def test_transfer_manager_deadline():
+    """
+    Test the deadline of a transfer computed by TransferManager.
+    """
+    mib = 1024 * 1024
+    conn = FakeStatConnection({})
+    manager = TransferManager(conn, total_transfer_timeout=100)
+
+    # Unknown size or throughput
+    assert manager._get_deadline(None, 0, 0) == 100
+    assert manager._get_deadline(1000 * mib, 0, 0) == 100
+
+    # Extended from the throughput recorded for the previous transfers
+    conn.transfer_metrics.record(_record(10 * mib, 1))
+    assert manager._get_deadline(1000 * mib, 0, 0) == 4 * 100
+
+    # Extended from the progress of the transfer itself: 1MiB/s so far with
+    # 1990MiB to go.
+    assert manager._get_deadline(2000 * mib, 10 * mib, 10) == 10 + 2 * 1990
+
+    # Never shorter than total_transfer_timeout
+    assert manager._get_deadline(mib, mib, 1) == 100
+
+
+def test_local_execute_async_bound(tmp_path):
+    """
+    Test that LocalConnection.execute_async() does not run more than
+    max_async_processes commands at once.
+    """
+    conn = LocalConnection(unrooted=True, max_async_processes=2)
+    log = tmp_path / 'log'
+    # Each command records when it starts and ends
+    cmd = f'echo 1 >> {quote(str(log))}; sleep 0.2; echo -1 >> {quote(str(log))}'
+
+    async def main():
+        await asyncio.gather(*(
+            conn.execute_async(cmd)
+            for _ in range(5)
+        ))
+
+    try:
+        asyncio.run(main())
+    finally:
+        conn.close()
+
+    running = 0
+    peak = 0
+    for line in log.read_text().splitlines():
+        running += int(line)
+        peak = max(peak, running)
+    assert peak == 2
@@ -0,0 +1,207 @@
+#
+#    Copyright 2024 ARM Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Module for testing devlib.utils.misc
+"""
+
+import asyncio
+import gc
+import pickle
+import weakref
+
+import pytest
+
+from devlib.exception import TimeoutError
+from devlib.utils.misc import (
+    memoized, memo_cache_info, reset_memo_cache, get_subprocess,
+    check_subprocess_output_async,
+)
+
+
+class Memoized:
+    """
+    Class with memoized methods counting their actual calls.
+    """
+    def __init__(self, value=0):
+        self.value = value
+        self.calls = []
+
+    @memoized
+    def method(self, x, y=0):
+        self.calls.append(('method', x, y))
+        return (self.value, x, y)
+
+    @memoized(maxsize=2)
+    def small(self, x):
+        self.calls.append(('small', x))
+        return x
+
+    @property
+    @memoized
+    def prop(self):
+        self.calls.append(('prop',))
+        return self.value
+
+    @memoized
+    def unhashable(self, x):
+        self.calls.append(('unhashable', len(x)))
+        return len(x)
+
+
+@memoized
+def _square(x, calls):
+    calls.append(x)
+    return x * x
+
+
+def test_memoized_cache():
+    """
+    Test that results are cached per set of parameters.
+    """
+    obj = Memoized()
+    assert obj.method(1) == (0, 1, 0)
+    assert obj.method(1) == (0, 1, 0)
+    assert obj.method(1, y=2) == (0, 1, 2)
+    assert obj.calls == [('method', 1, 0), ('method', 1, 2)]
+
+    info = memo_cache_info(obj)
+    assert (info.hits, info.misses, info.size) == (1, 2, 2)
+
+    # Plain functions are memoized too
+    calls = []
+    assert _square(3, calls) == 9
+    assert _square(3, calls) == 9
+    assert calls == [3]
+
+
+def test_memoized_lru():
+    """
+    Test the eviction of the least recently used results at maxsize.
+    """
+    obj = Memoized()
+    obj.small(1)
+    obj.small(2)
+    # Make 1 the most recently used
+    obj.small(1)
+    # Evicts 2
+    obj.small(3)
+    assert memo_cache_info(obj).evictions == 1
+    assert memo_cache_info(obj).size == 2
+
+    del obj.calls[:]
+    obj.small(1)
+    obj.small(3)
+    assert obj.calls == []
+    obj.small(2)
+    assert obj.calls == [('small', 2)]
+
+
+def test_memoized_instances():
+    """
+    Test that the caches of instances are isolated and freed along with them.
+    """
+    obj1 = Memoized(1)
+    obj2 = Memoized(2)
+    assert obj1.method(0) == (1, 0, 0)
+    assert obj2.method(0) == (2, 0, 0)
+    assert obj1.prop == 1
+    assert obj2.prop == 2
+    assert memo_cache_info(obj1).size == 2
+    assert memo_cache_info(obj2).size == 2
+
+    ref = weakref.ref(obj1)
+    del obj1
+    gc.collect()
+    assert ref() is None
+
+
+def test_memoized_property():
+    """
+    Test memoized methods wrapped in a property.
+    """
+    obj = Memoized(1)
+    assert obj.prop == 1
+    obj.value = 2
+    assert obj.prop == 1
+    assert obj.calls == [('prop',)]
+
+    reset_memo_cache(obj)
+    assert obj.prop == 2
+
+
+def test_memoized_reset():
+    """
+    Test reset_memo_cache() for one instance and for all the caches.
+    """
+    obj1 = Memoized()
+    obj2 = Memoized()
+    obj1.method(0)
+    obj2.method(0)
+
+    reset_memo_cache(obj1)
+    assert memo_cache_info(obj1).size == 0
+    assert memo_cache_info(obj2).size == 1
+
+    obj1.method(0)
+    reset_memo_cache()
+    assert memo_cache_info(obj1).size == 0
+    assert memo_cache_info(obj2).size == 0
+
+    # Objects without any cache are fine
+    reset_memo_cache(object())
+
+
+def test_memoized_unhashable():
+    """
+    Test that unhashable parameters are keyed on their identity.
+    """
+    obj = Memoized()
+    x = [1, 2]
+    assert obj.unhashable(x) == 2
+    assert obj.unhashable(x) == 2
+    assert obj.calls == [('unhashable', 2)]
+
+    y = [1, 2, 3]
+    assert obj.unhashable(y) == 3
+    assert obj.calls == [('unhashable', 2), ('unhashable', 3)]
+
+
+def test_memoized_pickle():
+    """
+    Test that instances with memoized caches can be pickled, without the
+    cached results.
+    """
+    obj = Memoized(1)
+    obj.method(0)
+    assert obj.prop == 1
+
+    obj2 = pickle.loads(pickle.dumps(obj))
+    assert memo_cache_info(obj2).size == 0
+    obj2.value = 2
+    assert obj2.prop == 2
+    # The original is unaffected
+    assert obj.prop == 1
+
+
+def test_check_subprocess_output_async_timeout():
+    """
+    Test that a process killed on timeout is also reaped.
+    """
+    process = get_subprocess('sleep 10', shell=True)
+    with pytest.raises(TimeoutError):
+        asyncio.run(check_subprocess_output_async(process, timeout=0.3))
+    assert process.returncode is not None
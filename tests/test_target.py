@@ -23,14 +23,22 @@ https://docs.pytest.org/en/7.1.x/how-to/logging.html#live-logs for logging detai
 $ python -m pytest --log-cli-level DEBUG test_target.py
 """
 
+import io
+import json
 import logging
 import os
 import pytest
+import stat
+import time
+from shlex import quote
 
 from devlib import AndroidTarget, ChromeOsTarget, LinuxTarget, LocalLinuxTarget
 from devlib._target_runner import NOPTargetRunner, QEMUTargetRunner
+from devlib.exception import TargetStableCalledProcessError, TargetStableError, TimeoutError
+from devlib.module import Module
+from devlib.target import ProbeCache, ReadCache, _LazyDecodedMapping
 from devlib.utils.android import AdbConnection
-from devlib.utils.misc import load_struct_from_yaml
+from devlib.utils.misc import load_struct_from_yaml, memo_cache_info
 
 
 logger = logging.getLogger('test_target')
@@ -179,3 +187,839 @@ def test_read_multiline_values(build_target_runners):
             result = {os.path.basename(k): v for k, v in raw_result.items()}
 
         assert {k: v.strip() for k, v in data.items()} == result
+
+
+def test_read_write_values(build_target_runners):
+    """
+    Test Target.read_values() and Target.write_values(), including the
+    outcome of failed accesses with ``raise_errors=False``.
+    """
+
+    logger.info('Running test_read_write_values test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        as_root = target.conn.connected_as_root
+        with target.make_temp() as tempdir:
+            data = {
+                target.path.join(tempdir, f'test{i}'): i
+                for i in range(3)
+            }
+            missing = target.path.join(tempdir, 'missing', 'test')
+
+            assert target.write_values(data, verify=False, as_root=as_root) == dict.fromkeys(data)
+            assert target.read_values(list(data), kind=int) == data
+
+            with pytest.raises(TargetStableError):
+                target.read_values([*data, missing])
+            with pytest.raises(TargetStableError):
+                target.write_values({missing: 42}, verify=False, as_root=as_root)
+
+            result = target.read_values([*data, missing], kind=int, raise_errors=False)
+            assert isinstance(result.pop(missing), TargetStableError)
+            assert result == data
+
+            values = {missing: 42, **data}
+            values = {path: value + 1 for path, value in values.items()}
+            result = target.write_values(values, verify=False, as_root=as_root, raise_errors=False)
+            assert isinstance(result.pop(missing), TargetStableError)
+            assert result == dict.fromkeys(data)
+            # A failed write does not prevent the following ones
+            assert target.read_values(list(data), kind=int) == {
+                path: value + 1
+                for path, value in data.items()
+            }
+
+
+# pylint: disable=redefined-outer-name
+def test_read_tree_values_tar(build_target_runners):
+    """
+    Test Target.read_tree_values() with ``tar=True``
+
+    Checks that values containing newlines and colons are read back correctly
+    from nested folders, decoded eagerly, lazily or not at all.
+    """
+
+    logger.info('Running test_read_tree_values_tar test...')
+
+    data = {
+        'test1': '1\n',
+        'test:2': 'a:b\n\nc\n',
+        'sub/test3': '3',
+    }
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        with target.make_temp() as tempdir:
+            target.makedirs(target.path.join(tempdir, 'sub'))
+            for key, value in data.items():
+                target.write_value(target.path.join(tempdir, key), value, verify=False,
+                                   as_root=target.conn.connected_as_root)
+
+            tree = target.read_tree_values(tempdir, depth=2, tar=True)
+            raw_tree = target.read_tree_values(tempdir, depth=2, tar=True, decode_unicode=False)
+            lazy_tree = target.read_tree_values(tempdir, depth=2, tar=True, lazy_decode=True)
+
+        expected = {
+            'test1': '1',
+            'test:2': 'a:b\n\nc',
+            'sub': {'test3': '3'},
+        }
+        assert tree == expected
+        assert lazy_tree == expected
+        assert raw_tree['test:2'] == data['test:2'].encode()
+
+
+def test_lazy_decoded_tree():
+    """
+    Check that the values of trees read with ``lazy_decode=True`` are only
+    decoded when they are accessed.
+    """
+    decoded = []
+
+    def decode(value):
+        decoded.append(value)
+        return value.decode()
+
+    tree = _LazyDecodedMapping({}, decode).wrap_tree({
+        'a': b'1',
+        'sub': {'b': b'2', 'c': b'3'},
+    })
+    assert decoded == []
+
+    assert tree['sub']['b'] == '2'
+    assert tree['sub']['b'] == '2'
+    assert decoded == [b'2']
+
+    assert tree == {'a': '1', 'sub': {'b': '2', 'c': '3'}}
+    assert sorted(decoded) == [b'1', b'2', b'3']
+
+
+# pylint: disable=redefined-outer-name
+def test_read_cache(monkeypatch):
+    """
+    Test ReadCache rules, expiry and invalidation.
+    """
+    cache = ReadCache()
+
+    # Nothing is cached without a rule
+    cache.set(('value', '/a/b'), 1)
+    with pytest.raises(KeyError):
+        cache.get(('value', '/a/b'))
+
+    cache.add_rule('/a/*')
+    cache.set(('value', '/a//b'), 1)
+    # Paths are normalized
+    assert cache.get(('value', '/a/b')) == 1
+    cache.set(('value', '/c'), 2)
+    with pytest.raises(KeyError):
+        cache.get(('value', '/c'))
+
+    # Invalidating a path also invalidates its parents and children
+    cache.set(('value', '/a/b/c'), 3)
+    cache.set(('value', '/a/d'), 4)
+    cache.invalidate('/a/b')
+    for path in ('/a/b', '/a/b/c'):
+        with pytest.raises(KeyError):
+            cache.get(('value', path))
+    assert cache.get(('value', '/a/d')) == 4
+
+    cache.set(('tree', '/a'), 5)
+    cache.invalidate('/a/d/e')
+    with pytest.raises(KeyError):
+        cache.get(('tree', '/a'))
+
+    # A value read before an invalidation is not cached
+    generation = cache.generation
+    cache.invalidate('/x')
+    cache.set(('value', '/a/f'), 6, generation)
+    with pytest.raises(KeyError):
+        cache.get(('value', '/a/f'))
+    cache.set(('value', '/a/f'), 6, cache.generation)
+    assert cache.get(('value', '/a/f')) == 6
+
+    cache.invalidate()
+    with pytest.raises(KeyError):
+        cache.get(('value', '/a/f'))
+
+    # Entries expire after their TTL
+    now = 100
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    cache.add_rule('/ttl/*', ttl=10)
+    cache.set(('value', '/ttl/a'), 7)
+    now = 109
+    assert cache.get(('value', '/ttl/a')) == 7
+    now = 110
+    with pytest.raises(KeyError):
+        cache.get(('value', '/ttl/a'))
+
+    stats = cache.stats
+    assert stats['hits'] > 0 and stats['misses'] > 0
+
+    cache.clear_rules()
+    cache.set(('value', '/a/b'), 1)
+    with pytest.raises(KeyError):
+        cache.get(('value', '/a/b'))
+
+
+def test_probe_cache(tmp_path):
+    """
+    Test that ProbeCache entries persist across instances, and are discarded
+    for another target or boot.
+    """
+    path = str(tmp_path)
+    identity = ('Target', 'host1')
+
+    cache = ProbeCache(path)
+    cache.load(identity, 'boot1')
+    assert cache.enabled
+    with pytest.raises(KeyError):
+        cache.get('abi')
+    cache.set('abi', 'arm64')
+    cache.set('cpuinfo', {'cpus': [0, 1]})
+
+    cache = ProbeCache(path)
+    cache.load(identity, 'boot1')
+    assert cache.get('abi') == 'arm64'
+    assert cache.get('cpuinfo') == {'cpus': [0, 1]}
+
+    # Another target does not see the entries
+    other = ProbeCache(path)
+    other.load(('Target', 'host2'), 'boot1')
+    with pytest.raises(KeyError):
+        other.get('abi')
+
+    # A reboot discards them
+    cache = ProbeCache(path)
+    cache.load(identity, 'boot2')
+    with pytest.raises(KeyError):
+        cache.get('abi')
+    cache.set('abi', 'armeabi')
+    cache.load(identity, 'boot1')
+    with pytest.raises(KeyError):
+        cache.get('abi')
+
+    # Corrupted files are ignored
+    for name in os.listdir(path):
+        with open(os.path.join(path, name), 'wb') as f:
+            f.write(b'garbage')
+    cache.load(identity, 'boot2')
+    with pytest.raises(KeyError):
+        cache.get('abi')
+
+    # Without a path or a boot id, nothing is cached
+    for cache, boot_id in ((ProbeCache(), 'boot1'), (ProbeCache(path), None)):
+        cache.load(identity, boot_id)
+        assert not cache.enabled
+        cache.set('abi', 'arm64')
+        with pytest.raises(KeyError):
+            cache.get('abi')
+
+
+class ProbedModule(Module):
+    """
+    Module whose support is controlled by the test.
+    """
+    name = 'test-probed'
+    supported = False
+
+    @staticmethod
+    def probe(target):
+        return ProbedModule.supported
+
+
+def test_probe_cache_module(build_target_runners, tmp_path, monkeypatch):
+    """
+    Test that only successful module probes are persisted.
+    """
+
+    logger.info('Running test_probe_cache_module test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        identity = ('test', target.__class__.__qualname__)
+        cache = ProbeCache(str(tmp_path))
+        cache.load(identity, 'boot')
+        monkeypatch.setattr(target, 'probe_cache', cache)
+        monkeypatch.setattr(target, '_installed_modules', {})
+        monkeypatch.setattr(target, '_modules', dict(target._modules))
+
+        monkeypatch.setattr(ProbedModule, 'supported', False)
+        with pytest.raises(TargetStableError):
+            ProbedModule.install(target)
+
+        cache = ProbeCache(str(tmp_path))
+        cache.load(identity, 'boot')
+        with pytest.raises(KeyError):
+            cache.get('module:test-probed')
+
+        monkeypatch.setattr(ProbedModule, 'supported', True)
+        assert isinstance(ProbedModule.install(target), ProbedModule)
+
+        cache = ProbeCache(str(tmp_path))
+        cache.load(identity, 'boot')
+        assert cache.get('module:test-probed')
+
+        # The persisted result is used instead of probing again
+        monkeypatch.setattr(ProbedModule, 'supported', False)
+        monkeypatch.setattr(target, 'probe_cache', cache)
+        monkeypatch.setattr(target, '_installed_modules', {})
+        ProbedModule.install(target)
+
+        monkeypatch.undo()
+
+
+def test_read_cache_target(build_target_runners):
+    """
+    Test that the read cache of the target is invalidated by writes, removals
+    and reconnections.
+    """
+
+    logger.info('Running test_read_cache_target test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        with target.make_temp() as tempdir:
+            path = target.path.join(tempdir, 'value')
+            as_root = target.conn.connected_as_root
+            target.write_value(path, 1, verify=False, as_root=as_root)
+
+            cache = target.read_cache
+            cache.add_rule(target.path.join(tempdir, '*'))
+            try:
+                assert target.read_int(path) == 1
+                # Modified behind the back of the target, so the cached value
+                # is returned
+                target.execute('echo 2 > {}'.format(quote(path)))
+                assert target.read_int(path) == 1
+
+                target.write_value(path, 3, verify=False, as_root=as_root)
+                assert target.read_int(path) == 3
+
+                target.connect()
+                target.execute('echo 4 > {}'.format(quote(path)))
+                assert target.read_int(path) == 4
+
+                target.remove(path)
+                with pytest.raises(TargetStableError):
+                    target.read_value(path)
+            finally:
+                cache.clear_rules()
+
+
+def test_snapshot_tree(build_target_runners):
+    """
+    Test Target.snapshot_tree()
+
+    Checks that refreshing a snapshot only reports the files that changed.
+    """
+
+    logger.info('Running test_snapshot_tree test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        with target.make_temp() as tempdir:
+            def path(name):
+                return target.path.join(tempdir, name)
+
+            as_root = target.conn.connected_as_root
+            target.write_value(path('a'), '1', verify=False, as_root=as_root)
+            target.write_value(path('b'), '2', verify=False, as_root=as_root)
+
+            with target.snapshot_tree(tempdir) as snapshot:
+                assert snapshot.tree() == {'a': '1', 'b': '2'}
+                assert snapshot.refresh() == {}
+
+                target.write_value(path('a'), '3', verify=False, as_root=as_root)
+                target.remove(path('b'))
+                target.write_value(path('c'), '4', verify=False, as_root=as_root)
+
+                assert snapshot.refresh() == {path('a'): '3', path('b'): None, path('c'): '4'}
+                assert snapshot.tree() == {'a': '3', 'c': '4'}
+
+                # Changes that could not be processed are reported again by
+                # the next refresh
+                target.write_value(path('a'), '5', verify=False, as_root=as_root)
+                decode = snapshot.decode
+
+                def failing_decode(content):
+                    raise ValueError('decoding failed')
+
+                snapshot.decode = failing_decode
+                with pytest.raises(ValueError):
+                    snapshot.refresh()
+                snapshot.decode = decode
+
+                assert snapshot.refresh() == {path('a'): '5'}
+                assert snapshot.refresh() == {}
+                assert snapshot.tree() == {'a': '5', 'c': '4'}
+
+
+# pylint: disable=redefined-outer-name
+def test_batch(build_target_runners):
+    """
+    Test Target.batch()
+
+    Checks that batched commands get their own results and errors.
+    """
+
+    logger.info('Running test_batch test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        with target.make_temp() as tempdir:
+            path = os.path.join(tempdir, 'value')
+
+            with target.batch() as batch:
+                batch.write_value(path, 42, as_root=target.conn.connected_as_root)
+                value = batch.read_value(path, kind=int)
+                exists = batch.file_exists(path)
+                output = batch.execute('echo hello')
+
+            assert value.result() == 42
+            assert exists.result()
+            assert output.result().strip() == 'hello'
+
+            with target.batch(raise_errors=False) as batch:
+                failed = batch.execute('exit 3')
+                output = batch.execute('echo world')
+
+            assert isinstance(failed.exception(), TargetStableCalledProcessError)
+            assert failed.exception().returncode == 3
+            assert output.result().strip() == 'world'
+
+            # If a script fails, the commands of the following scripts fail
+            # as well rather than never completing
+            with pytest.raises(TimeoutError):
+                with target.batch(timeout=1) as batch:
+                    batch._MAX_SCRIPT_SIZE = 1
+                    slow = batch.execute('sleep 10')
+                    later = batch.execute('echo later')
+
+            assert isinstance(slow.exception(timeout=0), TimeoutError)
+            assert isinstance(later.exception(timeout=0), TimeoutError)
+
+            # A failed write invalidates the read cache once it is done, even if
+            # a read cached the value in the meantime.
+            target.read_cache.add_rule(path)
+            try:
+                with pytest.raises(TimeoutError):
+                    with target.batch(timeout=1) as batch:
+                        batch._MAX_SCRIPT_SIZE = 1
+                        batch.execute('sleep 10')
+                        write = batch.write_value(path, 43, as_root=target.conn.connected_as_root)
+                        target.read_value(path)
+                        target.read_cache.get(('value', path))
+
+                assert isinstance(write.exception(timeout=0), TimeoutError)
+                with pytest.raises(KeyError):
+                    target.read_cache.get(('value', path))
+            finally:
+                target.read_cache.clear_rules()
+
+
+def test_push_pull_directory(build_target_runners, tmp_path):
+    """
+    Test Target.push_directory() and Target.pull_directory()
+
+    Checks that a directory tree survives a round trip with each compression.
+    """
+
+    logger.info('Running test_push_pull_directory test...')
+
+    src = tmp_path / 'src'
+    (src / 'sub').mkdir(parents=True)
+    (src / 'sub' / 'file').write_text('hello\n' * 1000)
+    (src / 'data').write_bytes(os.urandom(4096))
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        for compression in (None, 'gzip'):
+            with target.make_temp() as tempdir:
+                target_dir = target.path.join(tempdir, 'dir')
+                stats = target.push_directory(src, target_dir, compression=compression)
+                assert stats.raw_size > 0
+
+                dest = tmp_path / f'dest-{compression}-{id(target)}'
+                target.pull_directory(target_dir, dest, compression=compression)
+
+            assert (dest / 'sub' / 'file').read_text() == (src / 'sub' / 'file').read_text()
+            assert (dest / 'data').read_bytes() == (src / 'data').read_bytes()
+
+
+def test_open_remote(build_target_runners):
+    """
+    Test Target.open_remote(), Target.pull_stream() and Target.push_stream()
+    """
+
+    logger.info('Running test_open_remote test...')
+
+    data = os.urandom(100 * 1024)
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        with target.make_temp() as tempdir:
+            path = target.path.join(tempdir, 'file')
+
+            assert target.push_stream(io.BytesIO(data), path) == len(data)
+            assert b''.join(target.pull_stream(path, chunk_size=4096)) == data
+
+            with target.open_remote(path, 'ab') as f:
+                f.write(b'end')
+            with target.open_remote(path) as f:
+                assert f.read() == data + b'end'
+
+
+def test_fs_primitives(build_target_runners):
+    """
+    Test the filesystem methods of the connection and the Target methods based
+    on them.
+    """
+
+    logger.info('Running test_fs_primitives test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+        conn = target.conn
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        with target.make_temp() as tempdir:
+            subdir = target.path.join(tempdir, 'a', 'b')
+            conn.makedirs(subdir)
+            # Existing directories are not an error
+            conn.makedirs(subdir)
+            assert stat.S_ISDIR(conn.stat(subdir).st_mode)
+
+            path = target.path.join(tempdir, 'file')
+            target.write_value(path, 'hello', verify=False)
+            st = conn.stat(path)
+            assert stat.S_ISREG(st.st_mode)
+            assert st.st_size == len('hello')
+
+            hidden = target.path.join(tempdir, '.hidden')
+            target.write_value(hidden, '', verify=False)
+            assert sorted(conn.listdir(tempdir)) == ['.hidden', 'a', 'file']
+            # Like "ls", hidden entries are not listed
+            assert target.list_directory(tempdir) == ['a', 'file']
+            # Like "ls", a file is listed as itself
+            assert target.list_directory(path) == [path]
+            with pytest.raises(TargetStableError):
+                target.list_directory(target.path.join(tempdir, 'missing'))
+            assert target.estimate_transfer_timeout(target.path.join(tempdir, 'missing'), default=42) == 42
+
+            renamed = target.path.join(tempdir, 'renamed')
+            conn.rename(path, renamed)
+            with pytest.raises(FileNotFoundError):
+                conn.stat(path)
+            assert target.read_value(renamed) == 'hello'
+
+            conn.unlink(renamed)
+            assert not target.file_exists(renamed)
+
+            assert target.directory_exists(subdir)
+            assert not target.file_exists(path)
+            # Several paths are checked in a single command
+            assert target._get_path_kinds([subdir, hidden, path]) == ['dir', 'file', None]
+
+            target.remove(target.path.join(tempdir, 'a'))
+            assert not target.directory_exists(subdir)
+
+
+def test_stream(build_target_runners):
+    """
+    Test Target.stream()
+    """
+
+    logger.info('Running test_stream test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        lines = list(target.stream('for i in 1 2 3 4; do echo line$i; done'))
+        assert lines == ['line1', 'line2', 'line3', 'line4']
+
+        lines = list(target.stream('for i in 1 2 3 4; do echo line$i; done', line_filter='line[24]'))
+        assert lines == ['line2', 'line4']
+
+        # The exit code is the one of the command, not of the filter
+        with pytest.raises(TargetStableError):
+            list(target.stream('echo line1; false', line_filter='line'))
+
+        # Stopping early must kill the command rather than wait for it
+        for line in target.stream('while true; do echo y; done'):
+            assert line == 'y'
+            break
+
+
+def test_execute_output(build_target_runners, tmp_path):
+    """
+    Test Target.execute() with the output parameter
+    """
+
+    logger.info('Running test_execute_output test...')
+
+    cmd = 'for i in $(seq 1000); do echo line$i; done'
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        expected = target.execute(cmd)
+
+        with target.execute(cmd, output=1024) as out:
+            assert out.read().strip() == expected.strip()
+            assert list(out) == expected.splitlines()
+
+        path = tmp_path / f'output-{id(target)}'
+        with target.execute(cmd, output=path) as out:
+            assert out.path == str(path)
+        assert path.read_text().strip() == expected.strip()
+
+        with pytest.raises(TargetStableCalledProcessError):
+            target.execute('echo foo; false', output=1024)
+
+        # The output is located in a caller-provided file, even if it already
+        # contains some data.
+        with open(tmp_path / f'output-shared-{id(target)}', 'w+b') as f:
+            f.write(b'before\n')
+            out = target.execute(cmd, output=f)
+            f.write(b'after\n')
+            assert out.read().strip() == expected.strip()
+            assert list(out) == expected.splitlines()
+
+        # Non-seekable outputs still report errors with the end of the output
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd, 'rb') as r, os.fdopen(write_fd, 'wb') as w:
+            with pytest.raises(TargetStableCalledProcessError) as excinfo:
+                target.execute('echo foo; false', output=w)
+            assert 'foo' in excinfo.value.output
+            # The output also reached the pipe
+            w.close()
+            assert r.read() == b'foo\n'
+
+
+def test_stats(build_target_runners):
+    """
+    Test Target.stats()
+    """
+
+    logger.info('Running test_stats test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        target.stats(reset=True)
+        records = []
+        target.command_stats.callbacks.append(records.append)
+        try:
+            target.execute('true')
+            target.read_value('/proc/version')
+        finally:
+            target.command_stats.callbacks.remove(records.append)
+
+        stats = target.stats()
+        # The execute() call made by read_value() is counted as well
+        assert stats['execute']['count'] == 2
+        assert stats['read_value']['count'] == 1
+        assert sum(stats['execute']['histogram'].values()) == 2
+        # Both commands are attributed to this function, including the one
+        # issued by read_value() from a coroutine
+        assert list(stats['execute']['sites']) == [f'{__name__}:test_stats']
+        assert list(stats['read_value']['sites']) == [f'{__name__}:test_stats']
+        assert [record.op for record in records] == ['execute', 'execute', 'read_value']
+
+        assert json.loads(target.command_stats.to_json()) == stats
+
+
+def test_memo_cache_invalidation(build_target_runners, monkeypatch):
+    """
+    Test that connect() and reboot() clear the memoized values of the target.
+    """
+
+    logger.info('Running test_memo_cache_invalidation test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        def misses():
+            before = memo_cache_info(target).misses
+            target.number_of_nodes
+            return memo_cache_info(target).misses - before
+
+        target.number_of_nodes
+        assert misses() == 0
+
+        target.connect()
+        assert misses() == 1
+
+        # Pretend a hard reset is available so that the target is not actually
+        # rebooted.
+        monkeypatch.setattr(target, 'has', lambda name: name == 'hard_reset')
+        monkeypatch.setattr(target, 'hard_reset', lambda: None, raising=False)
+        target.reboot(hard=True, connect=False)
+        monkeypatch.undo()
+        assert memo_cache_info(target).size == 0
+        assert misses() == 1
+
+
+def test_install_content_addressed(build_target_runners, tmp_path):
+    """
+    Test that installing a binary again only pushes it if its content on the
+    target differs.
+    """
+
+    logger.info('Running test_install_content_addressed test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        name = f'devlib-test-install-{id(target)}'
+        host_path = tmp_path / name
+        host_path.write_text('#!/bin/sh\necho v1\n')
+
+        pushed = []
+        install_executable = target._install_executable
+
+        async def _install_executable(filepath, name, timeout=None):
+            pushed.append(name)
+            return await install_executable(filepath, name, timeout=timeout)
+
+        target._install_executable = _install_executable
+        try:
+            path = target.install(str(host_path))
+            assert pushed == [name]
+            assert target.execute(quote(path)).strip() == 'v1'
+
+            # Same content, nothing to push
+            assert target.install(str(host_path)) == path
+            assert pushed == [name]
+
+            # Modified on the target with the same size, so it is pushed again
+            target.execute(f"printf '#!/bin/sh\\necho v2\\n' > {quote(path)}")
+            target.install(str(host_path))
+            assert pushed == [name, name]
+            assert target.execute(quote(path)).strip() == 'v1'
+
+            # Modified on the host
+            host_path.write_text('#!/bin/sh\necho v3\n')
+            target.install(str(host_path))
+            assert pushed == [name, name, name]
+            assert target.execute(quote(path)).strip() == 'v3'
+
+            # The manifest keeps a single entry per binary
+            manifest = target.path.join(target.executables_directory, target._INSTALL_MANIFEST)
+            names = [
+                line.split(' ', 1)[1]
+                for line in target.read_value(manifest).splitlines()
+            ]
+            assert names.count(name) == 1
+            assert len(names) == len(set(names))
+        finally:
+            del target._install_executable
+            target.uninstall(name)
+
+
+def test_conn_pool(build_target_runners):
+    """
+    Test the closing of idle connections and the ceiling of the async pool.
+    """
+
+    logger.info('Running test_conn_pool test...')
+
+    target_runners = build_target_runners
+    for target_runner in target_runners:
+        target = target_runner.target
+
+        logger.info('target=%s os=%s hostname=%s',
+                    target.__class__.__name__, target.os, target.hostname)
+
+        idle_timeout = target.conn_idle_timeout
+        target.conn_idle_timeout = 0.2
+        try:
+            conn = target.get_connection()
+            target._release_conn(conn)
+            assert conn in target._unused_conns
+
+            # Closed even if the target is not used in the meantime
+            time.sleep(1)
+            assert conn not in target._unused_conns
+            assert conn._closed
+        finally:
+            target.conn_idle_timeout = idle_timeout
+
+        # Failing to open a connection lowers the size of the pool for good
+        key = target._get_target_key()
+        pool_size = target._async_pool_size
+        try:
+            target._lower_max_async()
+            ceiling = target._async_pool_size
+            assert ceiling < pool_size
+            assert target._max_async_ceilings[key] == ceiling
+
+            target._setup_async_pool(pool_size)
+            assert target._async_pool_size == ceiling
+        finally:
+            target._max_async_ceilings.pop(key, None)
+            target._setup_async_pool(pool_size)